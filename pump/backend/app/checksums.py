@@ -0,0 +1,16 @@
+import hashlib
+import os
+
+# Standard library only, so the ingest scripts can use it without numpy/scipy
+
+def file_checksum(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def file_stat(path):
+    """[size, mtime in ns]: recorded next to checksums so loads can skip unchanged files."""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
@@ -0,0 +1,69 @@
+import math
+from app.network.geo import encode_polyline
+
+# Stop fields kept in the compact stop table; graph nodes also carry build internals
+STOP_FIELDS = ("id", "name", "type", "lat", "lon")
+# Leg fields summed when consecutive legs are merged
+ADDITIVE_FIELDS = ("length_m", "duration_sec")
+
+def _same_vehicle(a, b):
+    """Consecutive legs merge when they use the same mode and, for scheduled legs, the same trip."""
+    return a['mode'] == b['mode'] and a.get('trip_id') == b.get('trip_id')
+
+def compact_routes(routes):
+    """
+    Compact form of ranked routes for bandwidth constrained clients:
+    {"stops": [...], "routes": [...]}. Each stop a merged leg starts or ends at is
+    listed once in the stop table, and legs refer to it by index. Consecutive legs on
+    the same mode (same trip for timetable routes) become one leg whose geometry
+    through the intermediate stops is an encoded polyline.
+    """
+    stops, stop_index = [], {}
+    def stop_ref(node):
+        key = node['id']
+        if key not in stop_index:
+            stop_index[key] = len(stops)
+            stop = {f: node[f] for f in STOP_FIELDS if f in node}
+            # ~10 cm, well past the precision of the stop data
+            stop['lat'], stop['lon'] = round(float(node['lat']), 6), round(float(node['lon']), 6)
+            stops.append(stop)
+        return stop_index[key]
+
+    compact = []
+    for route in routes:
+        runs = []
+        for leg in route['legs']:
+            if runs and _same_vehicle(runs[-1][-1], leg):
+                runs[-1].append(leg)
+            else:
+                runs.append([leg])
+
+        legs = []
+        for run in runs:
+            first, last = run[0], run[-1]
+            chain = [first['from_node']] + [leg['to_node'] for leg in run]
+            merged = {
+                "mode": first['mode'],
+                "from": stop_ref(first['from_node']),
+                "to": stop_ref(last['to_node']),
+                "stops": sum(leg.get('stops', 1) for leg in run),
+                "polyline": encode_polyline([n['lat'] for n in chain], [n['lon'] for n in chain])
+            }
+            for field in ADDITIVE_FIELDS:
+                if field in first:
+                    merged[field] = round(sum(leg[field] for leg in run), 1)
+            if 'duration_sec' in merged:
+                merged['duration_mins'] = math.ceil(merged['duration_sec'] / 60)
+            # Scheduled legs keep their trip and clock times
+            for field in ("route", "trip_id", "departure", "wait_sec"):
+                if field in first:
+                    merged[field] = first[field]
+            if 'arrival' in last:
+                merged['arrival'] = last['arrival']
+            legs.append(merged)
+
+        compact.append({
+            **{k: v for k, v in route.items() if k != 'legs'},
+            "legs": legs
+        })
+    return {"stops": stops, "routes": compact}
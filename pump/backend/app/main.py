@@ -1,12 +1,29 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import gzip
+import hashlib
+import time
+import traceback
+from fastapi import FastAPI, Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
 import json
 from pathlib import Path
 
-from app.network.graph import engine
+from app.compact import compact_routes
+from app.metrics import (SearchFailed, errors_total, observe_trace, render_metrics, request_seconds,
+                         requests_total, run_traced, stage_seconds)
+from app.network.cache import RouteCache
+from app.network.graph import engine, get_time_band
+from app.network.stops import DEFAULT_ZOOM, stop_index
 from app.ml.inference import predictor
-from app.scoring.ranker import score_and_rank_routes
+from app.network.timetable import TIMETABLE_ALGORITHMS, timetable
+from app.pool import (PoolBusy, run_batch, run_isochrone, run_matrix, run_score, run_search, run_timetable_search,
+                      search_pool)
+from app.readiness import readiness
+from app.scoring.ranker import rank_routes
 
 app = FastAPI(title="Pune Urban Mobility Planner - Marg")
 
@@ -36,67 +53,464 @@ class RouteRequest(BaseModel):
     source: Point
     destination: Point
     departure_time: str # "YYYY-MM-DDTHH:MM:SS"
+    engine: str = "graph" # "graph" (proximity graph + model), or a timetable algorithm: "raptor", "csa"
+    compact: bool = False # Stop table + merged legs with polylines, see app.compact
+    profile: bool = False # Sampling profile in the response; needs PUMP_PROFILING=1 on the server
+
+class ODPair(BaseModel):
+    source: Point
+    destination: Point
+    departure_time: Optional[str] = None # Overrides the batch departure_time
+
+class BatchRouteRequest(BaseModel):
+    pairs: List[ODPair]
+    departure_time: str
+    include_paths: bool = False
+
+class IsochroneRequest(BaseModel):
+    source: Point
+    departure_time: str
+    budget_mins: float = 30
+
+class MatrixRequest(BaseModel):
+    origins: List[Point]
+    destinations: List[Point]
+    departure_time: str
+    max_mins: Optional[float] = None
+
+class GraphDelta(BaseModel):
+    add: List[Dict[str, Any]] = [] # Full stop records: id, lat, lon, type, name...
+    remove: List[str] = []
+    move: List[Dict[str, Any]] = [] # {"id", "lat", "lon"}
+
+class OverlayEntry(BaseModel):
+    edges: List[Dict[str, str]] = [] # {"from": stop id, "to": stop id}
+    stops: List[str] = [] # Every edge into or out of these stops
+    zone: Optional[Dict[str, float]] = None # {"lat", "lng", "radius_m"}
+    modes: List[str] = [] # Restrict to these modes; empty means all
+    factor: float = 1.0 # Travel time multiplier, >= 1
+    closed: bool = False
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv("PUMP_ADMIN_TOKEN")
+graph_update_lock = asyncio.Lock()
+
+def require_admin(x_admin_token):
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+# Seconds clients are told to wait (Retry-After) while components are still loading
+STARTUP_RETRY_AFTER = 5
+
+def require_ready(*names):
+    """503 until the named components (see startup_event) have loaded."""
+    if not readiness.is_ready(*names):
+        states = readiness.stats()
+        failed = [name for name in names if states.get(name, {}).get("state") == "failed"]
+        if failed:
+            raise HTTPException(status_code=503, detail=f"Failed to load: {', '.join(failed)}")
+        waiting = [name for name in names if states.get(name, {}).get("state") != "ready"]
+        raise HTTPException(status_code=503, detail=f"Still loading: {', '.join(waiting)}",
+                            headers={"Retry-After": str(STARTUP_RETRY_AFTER)})
+
+def require_search(*local):
+    """
+    require_ready for work dispatched to the search pool: its workers when there are
+    any, otherwise the API process's own `local` components, which then run it.
+    """
+    require_ready(*(("search_pool",) if search_pool.workers else local))
+
+BATCH_MAX_PAIRS = int(os.getenv("PUMP_BATCH_MAX_PAIRS", "10000"))
+# Responses smaller than this aren't worth gzipping
+GZIP_MIN_BYTES = 1024
+# Rendered /network/stops viewports, keyed on the snapped bbox and zoom
+stops_cache = RouteCache(maxsize=256, ttl=3600)
+
+def json_body(payload):
+    """Serialized here directly, skipping FastAPI's encoder pass."""
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+def encoded_response(body, accept_encoding, gz_body=None, headers=None):
+    """JSON body, gzipped when the client accepts it (gz_body: already compressed copy)."""
+    headers = {"Vary": "Accept-Encoding", **(headers or {})}
+    if 'gzip' in (accept_encoding or '') and len(body) >= GZIP_MIN_BYTES:
+        body = gz_body or gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, media_type="application/json", headers=headers)
+
+def route_response(routes, request, accept_encoding, endpoint=None, trace=None, started=None):
+    """
+    {"routes": [...]} or compact_routes(), gzipped when the client accepts it. With a
+    trace (see app.metrics.run_traced), adds Server-Timing, the sampling profile if
+    one was taken, and records the request's metrics.
+    """
+    start = time.perf_counter()
+    payload = compact_routes(routes) if request.compact else {"routes": routes}
+    if trace is not None and trace.profile:
+        payload["profile"] = trace.profile
+    body = json_body(payload)
+    if trace is None:
+        return encoded_response(body, accept_encoding)
+
+    done = time.perf_counter()
+    # Time spent outside the search itself: queueing for a worker and shipping the result back
+    dispatch = (start - started) - trace.totals()["search"][0]
+    timings = [("dispatch", max(dispatch, 0.0)), ("serialize", done - start), ("total", done - started)]
+    observe_trace(endpoint, trace)
+    for stage, seconds in timings[:2]:
+        stage_seconds.observe(seconds, endpoint, stage)
+    request_seconds.observe(done - started, endpoint)
+    requests_total.inc(endpoint, "200")
+    return encoded_response(body, accept_encoding, headers={"Server-Timing": trace.server_timing(timings)})
 
 @app.on_event("startup")
 def startup_event():
     print("Initializing Core Engines...")
-    engine.load()
-    predictor.load()
+    # Nothing is loaded here: health answers right away and /api/v1/ready reports progress
+    search_pool.start()
+    loaders = {"graph": engine.load, "stops": lambda: stop_index.load(DATA_DIR)}
+    if not search_pool.workers:
+        # With worker processes the model and timetable are only used (and loaded) there;
+        # the graph stays here for snapping, streamed path search and admin updates
+        loaders.update(model=predictor.load, timetable=timetable.load)
+    readiness.start(loaders, checks={"search_pool": search_pool.ready})
+
+@app.on_event("shutdown")
+def shutdown_event():
+    search_pool.shutdown()
 
 @app.get("/api/v1/health")
 def health_check():
     return {
         "status": "ok",
-        "graph_nodes": len(engine.G.nodes) if engine.G else 0,
-        "ml_loaded": predictor.model is not None
+        "ready": readiness.is_ready(),
+        "components": readiness.stats(),
+        "graph_nodes": len(engine.nodes) if engine.nodes is not None else 0,
+        "ml_loaded": predictor.model is not None,
+        "route_cache": search_pool.route_cache_stats(),
+        "timetable": timetable.stats(),
+        "search_pool": search_pool.stats()
     }
 
+@app.get("/api/v1/ready")
+def ready_check():
+    """200 once every component has loaded, 503 until then; for load balancer readiness probes."""
+    ready = readiness.is_ready()
+    return JSONResponse({"ready": ready, "components": readiness.stats()}, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition: request/stage latency histograms, search sizes, errors."""
+    pool = search_pool.stats()
+    return PlainTextResponse(render_metrics([
+        ("pump_search_pool_in_flight", "Searches running or queued", pool["in_flight"]),
+        ("pump_search_pool_rejected", "Searches rejected with 503 since startup", pool["rejected"]),
+        ("pump_search_pool_timed_out", "Searches that hit the timeout since startup", pool["timed_out"]),
+    ]), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/v1/network/stops")
-def get_stops():
-    """Returns a lightweight list of stops for the frontend map."""
-    stops = []
-    
-    # Load raw JSONs directly to avoid large graph serialization
-    if (DATA_DIR / "metro_stations.json").exists():
-        with open(DATA_DIR / "metro_stations.json") as f:
-            stops.extend(json.load(f))
-            
-    if (DATA_DIR / "bus_stops.json").exists():
-        with open(DATA_DIR / "bus_stops.json") as f:
-            # We take a sample of bus stops to not crash the UI (there are 5000+)
-            all_buses = json.load(f)
-            stops.extend(all_buses[:500]) # Take top 500 for visualization 
-            
-    return {"stops": stops}
+def get_stops(
+    min_lat: Optional[float] = None, min_lng: Optional[float] = None,
+    max_lat: Optional[float] = None, max_lng: Optional[float] = None,
+    zoom: Optional[int] = None,
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None)
+):
+    """
+    Stops for the frontend map, from the in-memory stop index. Pass the viewport
+    (all four bounds) and map zoom to get every stop in view, with bus stops
+    clustered below CLUSTER_MAX_ZOOM; see StopIndex.query. Without a viewport the
+    whole network is returned.
+    Without a zoom, bus stops are clustered as at zoom 11 (PUMP_STOPS_DEFAULT_ZOOM).
+    Earlier versions returned every stop unclustered here; pass zoom=15 or set
+    PUMP_STOPS_DEFAULT_ZOOM empty to get that list.
+    """
+    require_ready("stops")
+    bounds = (min_lat, min_lng, max_lat, max_lng)
+    if any(b is None for b in bounds) and any(b is not None for b in bounds):
+        raise HTTPException(status_code=400, detail="Pass all of min_lat, min_lng, max_lat, max_lng or none")
+    bbox = None if min_lat is None else bounds
+    if zoom is None:
+        zoom = DEFAULT_ZOOM
+
+    key = (stop_index.snap_bbox(bbox, zoom), zoom)
+    cached = stops_cache.get(key)
+    if cached is None:
+        body = json_body(stop_index.query(bbox, zoom))
+        etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        cached = (etag, body, gzip.compress(body, compresslevel=5) if len(body) >= GZIP_MIN_BYTES else None)
+        stops_cache.put(key, cached)
+
+    etag, body, gz_body = cached
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=300"}
+    if etag in [tag.strip() for tag in (if_none_match or '').split(',')]:
+        return Response(status_code=304, headers=headers)
+    return encoded_response(body, accept_encoding, gz_body, headers)
+
+def parse_departure(departure_time):
+    """Extract hour and day from ISO string (e.g. 2026-02-23T18:30:00). Falls back to 10 AM Monday."""
+    try:
+        from datetime import datetime
+        dt = datetime.fromisoformat(departure_time.replace('Z', '+00:00'))
+        return dt.hour, dt.weekday()
+    except:
+        return 10, 0
+
+def parse_departure_seconds(departure_time):
+    """Seconds after local midnight for timetable queries. Falls back to 10 AM."""
+    try:
+        from datetime import datetime
+        dt = datetime.fromisoformat(departure_time.replace('Z', '+00:00'))
+        return dt.hour * 3600 + dt.minute * 60 + dt.second
+    except:
+        return 10 * 3600
 
 @app.post("/api/v1/routes/search")
-def search_routes(request: RouteRequest):
+async def search_routes(request: RouteRequest, accept_encoding: Optional[str] = Header(None)):
+    """
+    Ranked routes. The Server-Timing header breaks the time down by stage (snap,
+    graph_prep, path per route, predict per model batch, format, serialize) and
+    reports nodes/edges explored; the same spans feed /metrics.
+    """
+    started = time.perf_counter()
+    if request.engine in TIMETABLE_ALGORITHMS:
+        # Scheduled journeys from the GTFS feed; legs carry real departure and arrival times
+        require_search("timetable")
+        if not timetable.available:
+            raise HTTPException(status_code=400, detail="No GTFS timetable loaded; use engine=graph")
+        endpoint, fn = "timetable", run_timetable_search
+        args = (parse_departure_seconds(request.departure_time), request.engine)
+    elif request.engine == "graph":
+        require_search("graph", "model")
+        endpoint, fn = "search", run_search
+        args = parse_departure(request.departure_time)
+    else:
+        raise HTTPException(status_code=400, detail=f"Unknown engine: {request.engine}")
+
     try:
-        # Extract hour and day from ISO string (e.g. 2026-02-23T18:30:00)
-        # Fallbacks to 10 AM Monday
-        try:
-            from datetime import datetime
-            dt = datetime.fromisoformat(request.departure_time.replace('Z', '+00:00'))
-            hour = dt.hour
-            day = dt.weekday()
-        except:
-            hour = 10
-            day = 0
-            
-        # 1. Path Generation (Top 5 dynamically shortest based on time of day)
-        k_paths = engine.k_shortest_paths(
+        # Searches are CPU bound, so they run off the event loop
+        ranked, trace = await search_pool.submit(
+            run_traced, fn, request.profile,
             request.source.lat, request.source.lng,
             request.destination.lat, request.destination.lng,
-            k=5, departure_hour=hour, departure_day=day
+            *args
         )
+    except PoolBusy as e:
+        raise search_error(endpoint, 503, "dispatch", e, f"Route search is overloaded: {e}")
+    except asyncio.TimeoutError as e:
+        raise search_error(endpoint, 504, "dispatch", e, "Route search timed out")
+    except SearchFailed as e:
+        raise search_error(endpoint, 500, e.stage, e, str(e), error_type=e.error_type)
+    except Exception as e:
+        # Failures outside the traced call, e.g. a worker process dying
+        traceback.print_exc()
+        raise search_error(endpoint, 500, "dispatch", e, f"{type(e).__name__}: {e}")
+    return route_response(ranked, request, accept_encoding, endpoint, trace, started)
+
+def search_error(endpoint, status, stage, error, detail, error_type=None):
+    """Counts a failed search and builds its HTTPException, naming the stage that failed."""
+    error_type = error_type or type(error).__name__
+    requests_total.inc(endpoint, str(status))
+    errors_total.inc(endpoint, stage, error_type)
+    return HTTPException(status_code=status, detail={"stage": stage, "error": error_type, "message": detail})
+
+@app.post("/api/v1/routes/search/stream")
+def stream_routes(request: RouteRequest):
+    """
+    NDJSON variant of search_routes. Each route is scored and written as a
+    {"type": "route"} line as soon as Yen's algorithm finds it, followed by a
+    {"type": "summary"} line with all routes re-ranked. Paths are searched in the
+    API process; each is scored by the search pool, where the model lives.
+    """
+    require_ready("graph")
+    require_search("model")
+    hour, day = parse_departure(request.departure_time)
+    
+    def events():
+        scored = []
+        try:
+            paths = engine.iter_shortest_paths(
+                request.source.lat, request.source.lng,
+                request.destination.lat, request.destination.lng,
+                k=5, departure_hour=hour, departure_day=day
+            )
+            for path in paths:
+                route = search_pool.call(run_score, [path], hour, day)[0]
+                scored.append(route)
+                yield json.dumps({"type": "route", "index": len(scored) - 1, "route": route}) + "\n"
+            yield json.dumps({"type": "summary", "routes": rank_routes(scored)}) + "\n"
+        except Exception as e:
+            # Headers are already sent, so errors are reported in-band
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+    
+    # Starlette iterates sync generators on its thread pool, off the event loop
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.post("/api/v1/routes/batch")
+async def batch_routes(request: BatchRouteRequest):
+    """
+    Fastest path for many OD pairs. Pairs are snapped to their candidate stops,
+    grouped by time band and source candidates, and the groups are spread over the
+    search workers so each shortest-path tree serves every destination sharing its
+    source. Times and distances include the walks (see RouteEngine.solve_batch).
+    Returns {"results": [...]} aligned with `pairs`; entries are null when unroutable.
+    """
+    if len(request.pairs) > BATCH_MAX_PAIRS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_PAIRS} pairs per batch")
+    require_ready("graph")
+    require_search("graph")
+        
+    default_hour, _ = parse_departure(request.departure_time)
+    points = [(p.source.lat, p.source.lng, p.destination.lat, p.destination.lng) for p in request.pairs]
+    
+    try:
+        bands = [
+            get_time_band(parse_departure(pair.departure_time)[0] if pair.departure_time else default_hour)
+            for pair in request.pairs
+        ]
+        snapped = engine.batch_queries(points, bands)
         
-        if not k_paths:
-            return {"routes": []}
+        # band -> source candidates -> queries, so each source's trees are built in one worker
+        groups = {}
+        for i, (band, query) in enumerate(zip(bands, snapped)):
+            if query is None:
+                continue
+            sources, targets, direct = query
+            band_groups = groups.setdefault(band, {})
+            band_groups.setdefault(tuple(sorted(sources)), []).append((i, sources, targets, direct))
             
-        # 2. Score & Rank (ML Travel time + Penalty heuristics)
-        ranked = score_and_rank_routes(k_paths, departure_hour=hour, departure_day=day)
+        n_chunks = max(1, search_pool.workers)
+        jobs = []
+        for band, by_source in groups.items():
+            chunks = [[] for _ in range(n_chunks)]
+            for j, queries in enumerate(by_source.values()):
+                chunks[j % n_chunks].extend(queries)
+            for chunk in chunks:
+                if chunk:
+                    jobs.append(search_pool.submit(run_batch, chunk, band, request.include_paths))
+                    
+        results = [None] * len(request.pairs)
+        for chunk_results in await asyncio.gather(*jobs):
+            for i, result in chunk_results:
+                results[i] = result
+        return {"results": results}
         
-        return {"routes": ranked}
+    except PoolBusy as e:
+        raise HTTPException(status_code=503, detail=f"Route search is overloaded: {e}")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Route batch timed out")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/v1/network/isochrone")
+async def isochrone(request: IsochroneRequest):
+    """Stops reachable within budget_mins of the source, with arrival times in seconds."""
+    require_search("graph")
+    hour, _ = parse_departure(request.departure_time)
+    try:
+        stops = await search_pool.submit(
+            run_isochrone, request.source.lat, request.source.lng, request.budget_mins * 60, hour
+        )
+        return {"stops": stops}
+    except PoolBusy as e:
+        raise HTTPException(status_code=503, detail=f"Route search is overloaded: {e}")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Isochrone timed out")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/v1/routes/matrix")
+async def travel_time_matrix(request: MatrixRequest):
+    """Travel time matrix in seconds (origins x destinations), null where unreachable."""
+    if len(request.origins) * len(request.destinations) > BATCH_MAX_PAIRS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_PAIRS} matrix cells per request")
+    require_search("graph")
         
+    hour, _ = parse_departure(request.departure_time)
+    max_time_s = request.max_mins * 60 if request.max_mins is not None else None
+    try:
+        matrix = await search_pool.submit(
+            run_matrix,
+            [(p.lat, p.lng) for p in request.origins],
+            [(p.lat, p.lng) for p in request.destinations],
+            hour, max_time_s
+        )
+        return {"matrix_s": matrix}
+    except PoolBusy as e:
+        raise HTTPException(status_code=503, detail=f"Route search is overloaded: {e}")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Matrix timed out")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/v1/admin/graph/delta")
+async def apply_graph_delta(delta: GraphDelta, x_admin_token: Optional[str] = Header(None)):
+    """
+    Adds, removes or moves stops without a rebuild or restart. The updated network is
+    built next to the live one and swapped in atomically, so in-flight searches
+    finish on the network they started with. Not persisted: rerun build_graph.py.
+    """
+    require_admin(x_admin_token)
+    require_ready("graph")
+        
+    delta_dict = delta.model_dump()
+    async with graph_update_lock:
+        start = time.perf_counter()
+        try:
+            new_engine = await run_in_threadpool(engine.apply_delta, delta_dict)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        engine.swap(new_engine)
+        search_pool.apply_delta(delta_dict)
+        
+    return {
+        "graph_nodes": len(new_engine.nodes),
+        "deltas_applied": len(search_pool.deltas),
+        "took_ms": round((time.perf_counter() - start) * 1000, 1)
+    }
+
+@app.get("/api/v1/admin/overlay")
+def list_overlay(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    require_ready("graph")
+    return {
+        "entries": {
+            entry_id: {**spec, "edges_affected": len(engine.overlay_edges[entry_id])}
+            for entry_id, spec in engine.overlay_specs.items()
+        },
+        "edges_affected": len(engine.edge_factors)
+    }
+
+@app.put("/api/v1/admin/overlay/{entry_id}")
+async def set_overlay(entry_id: str, entry: OverlayEntry, x_admin_token: Optional[str] = Header(None)):
+    """
+    Adds or replaces a live delay/closure entry. Only the edges it touches are
+    reweighted and only cached routes over them are dropped, so this is cheap
+    enough to call on every feed update. Not persisted across restarts.
+    """
+    require_admin(x_admin_token)
+    require_ready("graph")
+    spec = entry.model_dump(exclude_defaults=True)
+    async with graph_update_lock:
+        start = time.perf_counter()
+        try:
+            n_edges = await run_in_threadpool(engine.set_overlay, entry_id, spec)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        search_pool.set_overlay(engine.overlay_specs)
+        
+    return {
+        "entry": entry_id,
+        "edges_affected": n_edges,
+        "took_ms": round((time.perf_counter() - start) * 1000, 1)
+    }
+
+@app.delete("/api/v1/admin/overlay/{entry_id}")
+async def clear_overlay(entry_id: str, x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    require_ready("graph")
+    async with graph_update_lock:
+        if not await run_in_threadpool(engine.clear_overlay, entry_id):
+            raise HTTPException(status_code=404, detail=f"No overlay entry {entry_id}")
+        search_pool.set_overlay(engine.overlay_specs)
+    return {"entry": entry_id, "removed": True}
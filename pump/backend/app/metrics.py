@@ -0,0 +1,231 @@
+import contextvars
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+
+# Histogram buckets: stage and request durations in seconds, search sizes in nodes/edges
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000)
+# Requests may ask for a sampling profile ("profile": true) only when this is on
+PROFILING = os.getenv("PUMP_PROFILING", "0") == "1"
+PROFILE_INTERVAL_S = float(os.getenv("PUMP_PROFILE_INTERVAL_MS", "5")) / 1000
+# Distinct stacks returned with a profile, most sampled first
+PROFILE_TOP = 40
+
+_current = contextvars.ContextVar("pump_trace", default=None)
+
+class Trace:
+    """
+    Timing spans and search counters of one request. Engine code adds to the
+    current trace through span()/record()/current_stats(); the trace is picklable
+    so pool workers can hand it back with their result.
+    """
+    def __init__(self):
+        self.spans = [] # (stage, seconds) in completion order
+        self.stats = {} # search counters, see CSRGraph.shortest_path
+        self.stage = None # innermost open span, for error reports
+        self.profile = None
+
+    def add(self, stage, seconds):
+        self.spans.append((stage, seconds))
+
+    def totals(self):
+        """{stage: (total seconds, calls)} in order of first completion."""
+        totals = {}
+        for stage, seconds in self.spans:
+            total, calls = totals.get(stage, (0.0, 0))
+            totals[stage] = (total + seconds, calls + 1)
+        return totals
+
+    def server_timing(self, extra=()):
+        """Server-Timing header value; repeated stages are summed with their count as desc."""
+        parts = []
+        for stage, (total, calls) in list(self.totals().items()) + [(s, (t, 1)) for s, t in extra]:
+            part = f"{stage};dur={total * 1000:.2f}"
+            if calls > 1:
+                part += f';desc="{calls}x"'
+            parts.append(part)
+        if self.stats:
+            parts.append('explored;desc="' + " ".join(f"{k}={v}" for k, v in sorted(self.stats.items())) + '"')
+        return ", ".join(parts)
+
+class SearchFailed(Exception):
+    """A traced call failed; carries the stage it failed in and the original error."""
+    def __init__(self, stage, error_type, message):
+        super().__init__(stage, error_type, message)
+        self.stage = stage
+        self.error_type = error_type
+        self.message = message
+
+    def __str__(self):
+        return f"{self.error_type} during {self.stage}: {self.message}"
+
+@contextmanager
+def span(stage):
+    """Times the block into the current trace; a no-op when nothing is being traced."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    outer, trace.stage = trace.stage, stage
+    start = time.perf_counter()
+    # On an exception trace.stage stays set, so the failure is reported against this stage
+    yield
+    trace.add(stage, time.perf_counter() - start)
+    trace.stage = outer
+
+def record(stage, seconds):
+    """Adds a span measured by the caller, e.g. around a generator's next()."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+def current_stats():
+    """Search counter dict of the current trace, or None."""
+    trace = _current.get()
+    return None if trace is None else trace.stats
+
+class SamplingProfiler:
+    """
+    Samples one thread's Python stack every `interval` seconds from a helper thread
+    and counts identical stacks, in the collapsed format flame graph tools read
+    ("outer;inner;leaf count"). Only the GIL's switch interval limits resolution.
+    """
+    def __init__(self, interval=PROFILE_INTERVAL_S):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self, target, root):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            stack = []
+            # Frames above the profiled block (thread/worker plumbing) are the same in every sample
+            while frame is not None and frame is not root:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, args=(threading.get_ident(), sys._getframe(1)), daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def report(self, top=PROFILE_TOP):
+        return {
+            "interval_ms": self.interval * 1000,
+            "samples": sum(self.samples.values()),
+            "stacks": [f"{stack} {n}" for stack, n in self.samples.most_common(top)]
+        }
+
+def run_traced(fn, profile, *args):
+    """
+    Calls fn(*args) under a fresh trace (and a sampling profiler if asked and
+    PUMP_PROFILING is on). Returns (result, trace). Failures are re-raised as
+    SearchFailed naming the stage, which survives the trip back from a worker.
+    Runs in a pool worker or thread, like fn would.
+    """
+    trace = Trace()
+    token = _current.set(trace)
+    profiler = SamplingProfiler() if profile and PROFILING else None
+    try:
+        start = time.perf_counter()
+        if profiler:
+            with profiler:
+                result = fn(*args)
+            trace.profile = profiler.report()
+        else:
+            result = fn(*args)
+        trace.add("search", time.perf_counter() - start)
+        return result, trace
+    except Exception as e:
+        traceback.print_exc()
+        raise SearchFailed(trace.stage or fn.__name__, type(e).__name__, str(e)) from None
+    finally:
+        _current.reset(token)
+
+def _label_str(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, values)) + "}"
+
+class CounterMetric:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, labels
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, value=1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, v in sorted(self.values.items()):
+                lines.append(f"{self.name}{_label_str(self.labels, values)} {v}")
+        return lines
+
+class HistogramMetric:
+    def __init__(self, name, help, buckets, labels=()):
+        self.name, self.help, self.buckets, self.labels = name, help, buckets, labels
+        self.series = {} # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self.series.setdefault(label_values, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, series in sorted(self.series.items()):
+                for bound, n in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_label_str(self.labels + ('le',), values + (bound,))} {n}")
+                lines.append(f"{self.name}_bucket{_label_str(self.labels + ('le',), values + ('+Inf',))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_label_str(self.labels, values)} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{_label_str(self.labels, values)} {series[-1]}")
+        return lines
+
+# API process registry; workers only fill traces, which the API process observes here
+requests_total = CounterMetric("pump_requests_total", "Requests by endpoint and status code", ("endpoint", "status"))
+errors_total = CounterMetric("pump_errors_total", "Failed searches by endpoint, stage and error type", ("endpoint", "stage", "type"))
+request_seconds = HistogramMetric("pump_request_seconds", "Request handling time", LATENCY_BUCKETS, ("endpoint",))
+stage_seconds = HistogramMetric("pump_stage_seconds", "Time per search stage (each path and model batch separately)",
+                                LATENCY_BUCKETS, ("endpoint", "stage"))
+nodes_settled = HistogramMetric("pump_search_nodes_settled", "Nodes settled per route search", SIZE_BUCKETS, ("endpoint",))
+edges_scanned = HistogramMetric("pump_search_edges_scanned", "Edges scanned per route search", SIZE_BUCKETS, ("endpoint",))
+REGISTRY = (requests_total, errors_total, request_seconds, stage_seconds, nodes_settled, edges_scanned)
+
+def observe_trace(endpoint, trace):
+    for stage, seconds in trace.spans:
+        stage_seconds.observe(seconds, endpoint, stage)
+    if "nodes_settled" in trace.stats:
+        nodes_settled.observe(trace.stats["nodes_settled"], endpoint)
+    if "edges_scanned" in trace.stats:
+        edges_scanned.observe(trace.stats["edges_scanned"], endpoint)
+
+def render_metrics(gauges=()):
+    """Prometheus text exposition of the registry plus (name, help, value) gauges."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for name, help, value in gauges:
+        lines.extend([f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {value}"])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,73 @@
+import numpy as np
+
+class CompiledForest:
+    """
+    A RandomForestRegressor flattened into padded NumPy arrays, one row per tree.
+    Leaves point back at themselves, so walking every sample down every tree for
+    `depth` steps lands on the leaf sklearn would reach. Only needs NumPy to predict.
+    """
+    def __init__(self, feature, threshold, left, right, value, depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.depth = int(depth)
+        self.max_error = None
+
+    @classmethod
+    def from_sklearn(cls, model):
+        trees = [est.tree_ for est in model.estimators_]
+        width = max(t.node_count for t in trees)
+        n_trees = len(trees)
+
+        feature = np.zeros((n_trees, width), dtype=np.int32)
+        threshold = np.zeros((n_trees, width), dtype=np.float64)
+        left = np.zeros((n_trees, width), dtype=np.int32)
+        right = np.zeros((n_trees, width), dtype=np.int32)
+        value = np.zeros((n_trees, width), dtype=np.float64)
+
+        for i, t in enumerate(trees):
+            n = t.node_count
+            nodes = np.arange(n)
+            is_leaf = t.children_left == -1
+            feature[i, :n] = np.where(is_leaf, 0, t.feature)
+            threshold[i, :n] = t.threshold
+            left[i, :n] = np.where(is_leaf, nodes, t.children_left)
+            right[i, :n] = np.where(is_leaf, nodes, t.children_right)
+            value[i, :n] = t.value[:, 0, 0]
+
+        return cls(feature, threshold, left, right, value, max(t.max_depth for t in trees))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        forest = cls(data['feature'], data['threshold'], data['left'], data['right'], data['value'], data['depth'])
+        forest.max_error = float(data['max_error'])
+        return forest
+
+    def save(self, path):
+        np.savez(path, feature=self.feature, threshold=self.threshold, left=self.left,
+                 right=self.right, value=self.value, depth=self.depth, max_error=self.max_error)
+
+    def predict(self, X):
+        """X: (n_samples, n_features) array in the model's feature order."""
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        n_trees = self.feature.shape[0]
+        rows = np.arange(n_trees)[:, None]
+        samples = np.arange(len(X))[None, :]
+
+        node = np.zeros((n_trees, len(X)), dtype=np.int32)
+        for _ in range(self.depth):
+            go_left = X[samples, self.feature[rows, node]] <= self.threshold[rows, node]
+            node = np.where(go_left, self.left[rows, node], self.right[rows, node])
+
+        return self.value[rows, node].mean(axis=0)
+
+    def measure_error(self, model, X):
+        """Records and returns the max absolute difference versus the original model on X."""
+        import pandas as pd
+        expected = model.predict(pd.DataFrame(X, columns=model.feature_names_in_))
+        self.max_error = float(np.max(np.abs(self.predict(X) - expected)))
+        return self.max_error
@@ -1,40 +1,96 @@
-import joblib
-import pandas as pd
+import os
+import numpy as np
 from pathlib import Path
 
+from app.metrics import span
+from app.ml.compiled import CompiledForest
+
 MODEL_PATH = Path("/home/jayant/gitgud/marg/marg/pump/data/models/travel_time_rf.pkl")
+COMPILED_PATH = MODEL_PATH.with_suffix(".npz")
+
+# "sklearn" predicts with the pickled RandomForest, "compiled" with its NumPy-flattened trees
+ML_BACKEND = os.getenv("PUMP_ML_BACKEND", "sklearn")
+
+MODE_MAP = {"bus": 0, "metro": 1, "walk": 2}
+FEATURES = ['mode', 'distance_m', 'hour', 'day_of_week', 'congestion_zone']
+
+def error_probe_grid():
+    """Every (mode, hour, day, zone) combination over a sweep of leg distances."""
+    modes, hours, days, zones, distances = np.meshgrid(
+        list(MODE_MAP.values()), np.arange(24), np.arange(7), [1, 2, 3],
+        np.linspace(0, 5000, 51), indexing='ij'
+    )
+    return np.column_stack([modes.ravel(), distances.ravel(), hours.ravel(), days.ravel(), zones.ravel()])
 
 class TravelTimePredictor:
-    def __init__(self):
+    def __init__(self, backend=ML_BACKEND):
+        self.backend = backend
         self.model = None
-        
+
     def load(self):
+        if self.backend == "compiled":
+            self._load_compiled()
+            return
+
+        import joblib
+        # predict_leg_times hands the forest DataFrames; import pandas now rather than on the first request
+        import pandas
         print("Loading Random Forest Model...")
         self.model = joblib.load(MODEL_PATH)
+        # Request batches are tiny, so dispatching trees to a thread pool costs more than it saves
+        self.model.n_jobs = 1
         print("Model loaded.")
-        
+
+    def _load_compiled(self):
+        # Reuse the flattened forest unless the pickle was retrained after it was written
+        if COMPILED_PATH.exists() and COMPILED_PATH.stat().st_mtime >= MODEL_PATH.stat().st_mtime:
+            print("Loading compiled Random Forest...")
+            self.model = CompiledForest.load(COMPILED_PATH)
+        else:
+            import joblib
+            print("Compiling Random Forest Model...")
+            rf = joblib.load(MODEL_PATH)
+            self.model = CompiledForest.from_sklearn(rf)
+            self.model.measure_error(rf, error_probe_grid())
+            self.model.save(COMPILED_PATH)
+        print(f"Compiled model loaded (max error vs forest: {self.model.max_error:.6f}s).")
+
     def predict_leg_time(self, mode_str, distance_m, hour=10, day_of_week=0, zone=1):
         """
         mode_str: "bus", "metro", "walk"
         hour: 0-23
         day_of_week: 0-6
+        zone: congestion zone 1-3 (the edge's "zone" tag, see app.network.zones)
+        """
+        # Returns duration in seconds
+        return self.predict_leg_times([mode_str], [distance_m], hour, day_of_week, zone)[0]
+
+    def predict_leg_times(self, mode_strs, distances_m, hour=10, day_of_week=0, zones=1):
+        """
+        Batched predict_leg_time: one feature matrix and one model call for any number of legs.
+        mode_strs, distances_m: sequences of equal length
+        zones: a single zone for every leg or one per leg
+        Returns an array of durations in seconds.
         """
         if self.model is None:
             raise ValueError("Model not loaded")
-            
-        mode_map = {"bus": 0, "metro": 1, "walk": 2}
-        mode_encoded = mode_map.get(mode_str, 2)
-        
-        # In a real app, congestion_zone is a geo-fence lookup. Here we mock it as Zone 1.
-        df = pd.DataFrame([{
-            'mode': mode_encoded,
-            'distance_m': distance_m,
-            'hour': hour,
-            'day_of_week': day_of_week,
-            'congestion_zone': zone
-        }])
-        
-        # Returns duration in seconds
-        return self.model.predict(df)[0]
+
+        n = len(mode_strs)
+        if n == 0:
+            return np.empty(0)
+
+        with span("predict"):
+            X = np.empty((n, len(FEATURES)))
+            X[:, 0] = [MODE_MAP.get(m, 2) for m in mode_strs]
+            X[:, 1] = distances_m
+            X[:, 2] = hour
+            X[:, 3] = day_of_week
+            X[:, 4] = zones
+
+            if self.backend == "compiled":
+                return self.model.predict(X)
+
+            import pandas as pd
+            return self.model.predict(pd.DataFrame(X, columns=FEATURES))
 
 predictor = TravelTimePredictor()
@@ -0,0 +1,47 @@
+import os
+
+# Alternatives may be this much slower than the fastest path (1.0 = twice as long). Metro is
+# twice as fast as bus in rush hour, so tighter bounds leave metro trips with no alternative.
+ALT_MAX_STRETCH = float(os.getenv("PUMP_ALT_MAX_STRETCH", "1.0"))
+# Share of an alternative's travel time allowed on edges of an already accepted route
+ALT_MAX_OVERLAP = float(os.getenv("PUMP_ALT_MAX_OVERLAP", "0.6"))
+# Via nodes examined per query before giving up on finding k routes
+ALT_MAX_CANDIDATES = 500
+
+def via_node_paths(candidates, route_via, k, max_overlap=ALT_MAX_OVERLAP, max_candidates=ALT_MAX_CANDIDATES):
+    """
+    Via-node alternatives from a forward tree out of the source and a backward tree
+    into the target. Each via node v gives the route source -> v -> target along the
+    two trees, so every candidate costs a tree lookup instead of a search.
+
+    candidates: via nodes in increasing order of best route cost through them, already
+        limited to the allowed stretch; the first one lies on the fastest path
+    route_via(v): (nodes, edge_costs) of that route
+    Yields up to k loopless routes (node lists), fastest first. Via nodes on a route
+    already examined are skipped, since they lie on the same plateau and give the same
+    route; candidates sharing more than max_overlap of their cost with an accepted
+    route are rejected.
+    """
+    accepted = []
+    covered = set()
+    for examined, v in enumerate(candidates):
+        if examined >= max_candidates:
+            return
+        if v in covered:
+            continue
+        nodes, costs = route_via(v)
+        covered.update(nodes)
+        if len(set(nodes)) != len(nodes):
+            continue
+
+        edges = list(zip(nodes, nodes[1:]))
+        total = sum(costs)
+        if total > 0 and any(
+            sum(c for e, c in zip(edges, costs) if e in route_edges) > max_overlap * total
+            for route_edges in accepted
+        ):
+            continue
+        accepted.append(set(edges))
+        yield nodes
+        if len(accepted) >= k:
+            return
@@ -0,0 +1,168 @@
+import json
+import os
+import numpy as np
+from pathlib import Path
+
+from app.checksums import file_checksum, file_stat
+from app.network.csr import MODE_CODES
+from app.network.zones import DEFAULT_ZONE
+
+# Directory of raw .npy arrays plus a manifest, readable with mmap so every
+# worker process shares the same page-cache copy of the network.
+FORMAT_NAME = "marg-graph"
+FORMAT_VERSION = 2
+MANIFEST = "manifest.json"
+
+class ArtifactError(Exception):
+    """Raised when graph artifacts are missing, from another format version or corrupt."""
+
+class NodeTable:
+    """
+    Read-only node attribute lookup with the same `table[node_id]` / `len(table)`
+    usage as G.nodes. Attribute dicts are decoded from their JSON strings on demand.
+    """
+    def __init__(self, node_ids, attrs):
+        self.node_ids = node_ids
+        self.node_index = {n: i for i, n in enumerate(node_ids)}
+        self.attrs = attrs
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def __iter__(self):
+        return iter(self.node_ids)
+
+    def __contains__(self, node_id):
+        return node_id in self.node_index
+
+    def __getitem__(self, node_id):
+        return json.loads(self.attrs[self.node_index[node_id]])
+
+def write_artifacts(out_dir, G, node_ids, coords, sources=()):
+    """
+    Writes the MultiDiGraph as CSR arrays sorted by source node.
+    sources: input files whose checksums are recorded so stale artifacts can be detected.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    node_index = {n: i for i, n in enumerate(node_ids)}
+    coords = np.asarray(coords, dtype=np.float64)
+
+    # Stable sort on the source node keeps insertion order between parallel edges,
+    # so ties collapse the same way as with the pickled graph
+    edges = sorted(
+        ((node_index[u], node_index[v], MODE_CODES.get(d.get('mode', 'walk'), 0), d.get('length_m', 0.0),
+          d.get('zone', DEFAULT_ZONE))
+         for u, v, d in G.edges(data=True)),
+        key=lambda e: e[0]
+    )
+    src = np.array([e[0] for e in edges], dtype=np.int32)
+    indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=len(node_ids)), out=indptr[1:])
+
+    arrays = {
+        "node_ids": np.array(node_ids, dtype='S'),
+        "node_attrs": np.array([json.dumps(G.nodes[n], ensure_ascii=True) for n in node_ids], dtype='S'),
+        "node_lat": coords[:, 0].copy(),
+        "node_lon": coords[:, 1].copy(),
+        "edge_indptr": indptr,
+        "edge_dst": np.array([e[1] for e in edges], dtype=np.int32),
+        "edge_mode": np.array([e[2] for e in edges], dtype=np.uint8),
+        "edge_length_m": np.array([e[3] for e in edges], dtype=np.float32),
+        "edge_zone": np.array([e[4] for e in edges], dtype=np.uint8),
+    }
+
+    manifest = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "n_nodes": len(node_ids),
+        "n_edges": len(edges),
+        "arrays": {},
+        "sources": {Path(p).name: file_checksum(p) for p in sources},
+        "stats": {},
+        "source_stats": {Path(p).name: file_stat(p) for p in sources},
+    }
+    for name, arr in arrays.items():
+        path = out_dir / f"{name}.npy"
+        np.save(path, arr)
+        manifest["arrays"][name] = file_checksum(path)
+        manifest["stats"][name] = file_stat(path)
+
+    # Written last so a half-written directory never has a valid manifest
+    with open(out_dir / MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def add_artifact_arrays(art_dir, arrays, section, info):
+    """
+    Adds derived arrays (e.g. contraction hierarchies) to an existing artifact
+    directory and records `info` under manifest[section]. The manifest is replaced
+    atomically after every array is on disk.
+    """
+    art_dir = Path(art_dir)
+    with open(art_dir / MANIFEST) as f:
+        manifest = json.load(f)
+    for name, arr in arrays.items():
+        path = art_dir / f"{name}.npy"
+        np.save(path, arr)
+        manifest["arrays"][name] = file_checksum(path)
+        manifest.setdefault("stats", {})[name] = file_stat(path)
+    manifest[section] = info
+
+    tmp = art_dir / f"{MANIFEST}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, art_dir / MANIFEST)
+    return manifest
+
+def load_artifacts(art_dir, verify="auto", sources=()):
+    """
+    Memory-maps the arrays written by write_artifacts and returns them in a dict.
+    verify: "full" re-hashes every array and existing `sources` file; "auto" only
+    re-hashes files whose size or mtime differ from the manifest, so a normal load
+    never reads the mapped pages; "off" skips checksums. Array sizes are always
+    checked against the manifest.
+    """
+    art_dir = Path(art_dir)
+    try:
+        with open(art_dir / MANIFEST) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise ArtifactError(f"No graph artifacts in {art_dir}")
+
+    if manifest.get("format") != FORMAT_NAME or manifest.get("version") != FORMAT_VERSION:
+        raise ArtifactError(
+            f"Graph artifacts are {manifest.get('format')} v{manifest.get('version')}, "
+            f"expected {FORMAT_NAME} v{FORMAT_VERSION}; rerun scripts/build_graph.py"
+        )
+
+    # Manifests written before stats were recorded get a full check
+    stats = manifest.get("stats", {})
+    for name in manifest["arrays"]:
+        path = art_dir / f"{name}.npy"
+        if not path.exists():
+            raise ArtifactError(f"{name}.npy is missing; rerun scripts/build_graph.py")
+        if name in stats and os.path.getsize(path) != stats[name][0]:
+            raise ArtifactError(f"Size mismatch for {name}.npy; rerun scripts/build_graph.py")
+
+    if verify != "off":
+        for name, checksum in manifest["arrays"].items():
+            path = art_dir / f"{name}.npy"
+            if verify == "auto" and stats.get(name) == file_stat(path):
+                continue
+            if file_checksum(path) != checksum:
+                raise ArtifactError(f"Checksum mismatch for {name}.npy; rerun scripts/build_graph.py")
+        source_stats = manifest.get("source_stats", {})
+        for p in sources:
+            p = Path(p)
+            expected = manifest["sources"].get(p.name)
+            if not p.exists() or expected is None:
+                continue
+            if verify == "auto" and source_stats.get(p.name) == file_stat(p):
+                continue
+            if file_checksum(p) != expected:
+                raise ArtifactError(f"{p.name} changed since the graph was built; rerun scripts/build_graph.py")
+
+    data = {name: np.load(art_dir / f"{name}.npy", mmap_mode='r') for name in manifest["arrays"]}
+    data["manifest"] = manifest
+    return data
@@ -0,0 +1,228 @@
+import heapq
+import numpy as np
+
+# Witness searches give up after settling this many nodes and keep the shortcut,
+# which costs a few redundant shortcuts but bounds preprocessing time
+WITNESS_SETTLE_LIMIT = 500
+# Cheaper bound while only estimating a node's priority
+PRIORITY_SETTLE_LIMIT = 50
+
+ARRAY_NAMES = ("rank", "up_indptr", "up_dst", "up_weight", "up_middle",
+               "down_indptr", "down_src", "down_weight", "down_middle")
+
+def _witness_distances(out_adj, source, skip, targets, limit, settle_limit):
+    """Dijkstra from source over the uncontracted graph without `skip`, up to `limit`."""
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    remaining = set(targets)
+    settled = 0
+    while heap and remaining and settled < settle_limit:
+        d, u = heapq.heappop(heap)
+        if d > limit:
+            break
+        if d > dist[u]:
+            continue
+        settled += 1
+        remaining.discard(u)
+        for v, (w, _) in out_adj[u].items():
+            if v == skip:
+                continue
+            nd = d + w
+            if nd < dist.get(v, np.inf):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
+
+def _shortcuts(out_adj, in_adj, v, settle_limit):
+    """Shortcuts (u, x, weight) needed to keep distances correct once v is removed."""
+    needed = []
+    outs = out_adj[v]
+    for u, w_uv in in_adj[v].items():
+        targets = [x for x in outs if x != u]
+        if not targets:
+            continue
+        limit = w_uv + max(outs[x][0] for x in targets)
+        dist = _witness_distances(out_adj, u, v, targets, limit, settle_limit)
+        for x in targets:
+            w = w_uv + outs[x][0]
+            if dist.get(x, np.inf) > w:
+                needed.append((u, x, w))
+    return needed
+
+class ContractionHierarchy:
+    """
+    Contraction hierarchy over one band's CSRGraph. Nodes are contracted in order of
+    edge difference; the result is an upward graph (edges to higher ranked nodes) and
+    a downward graph stored reversed, so a query is two small Dijkstra searches that
+    both only climb. Shortcut edges keep their middle node for unpacking.
+    """
+    def __init__(self, arrays):
+        self.rank = np.asarray(arrays["rank"])
+        # Adjacency as Python lists: queries touch a few hundred edges, so list indexing beats NumPy
+        self.up = self._adjacency(arrays["up_indptr"], arrays["up_dst"], arrays["up_weight"])
+        self.down = self._adjacency(arrays["down_indptr"], arrays["down_src"], arrays["down_weight"])
+        self.middle = {}
+        for indptr, other, middle, upward in (
+            (arrays["up_indptr"], arrays["up_dst"], arrays["up_middle"], True),
+            (arrays["down_indptr"], arrays["down_src"], arrays["down_middle"], False),
+        ):
+            owner = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+            shortcut = np.nonzero(np.asarray(middle) >= 0)[0]
+            for a, b, m in zip(owner[shortcut].tolist(), np.asarray(other)[shortcut].tolist(),
+                               np.asarray(middle)[shortcut].tolist()):
+                self.middle[(a, b) if upward else (b, a)] = m
+        self.arrays = arrays
+
+    @staticmethod
+    def _adjacency(indptr, nodes, weights):
+        indptr, nodes, weights = np.asarray(indptr).tolist(), np.asarray(nodes).tolist(), np.asarray(weights).tolist()
+        return [list(zip(nodes[indptr[i]:indptr[i + 1]], weights[indptr[i]:indptr[i + 1]]))
+                for i in range(len(indptr) - 1)]
+
+    @classmethod
+    def build(cls, graph, settle_limit=WITNESS_SETTLE_LIMIT, log_every=1000):
+        """Contracts every node of a CSRGraph (current weights) and returns the hierarchy."""
+        n = len(graph.node_ids)
+        out_adj = [dict() for _ in range(n)] # u -> {v: (weight, middle)}
+        in_adj = [dict() for _ in range(n)] # v -> {u: weight}
+        indptr, indices, weights = (a.tolist() for a in (graph.indptr, graph.indices, graph.weights))
+        for u in range(n):
+            for slot in range(indptr[u], indptr[u + 1]):
+                v, w = indices[slot], weights[slot]
+                if v != u and np.isfinite(w):
+                    out_adj[u][v] = (w, -1)
+                    in_adj[v][u] = w
+
+        deleted_neighbours = [0] * n
+        def priority(v):
+            added = len(_shortcuts(out_adj, in_adj, v, PRIORITY_SETTLE_LIMIT))
+            return added - len(out_adj[v]) - len(in_adj[v]) + deleted_neighbours[v]
+
+        heap = [(priority(v), v) for v in range(n)]
+        heapq.heapify(heap)
+        rank = np.empty(n, dtype=np.int32)
+        up = [[] for _ in range(n)]
+        down = [[] for _ in range(n)]
+        contracted = bytearray(n)
+        order = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            if contracted[v]:
+                continue
+            # Lazy update: re-evaluate and defer v if it is no longer the cheapest
+            p = priority(v)
+            if heap and p > heap[0][0]:
+                heapq.heappush(heap, (p, v))
+                continue
+
+            for u, x, w in _shortcuts(out_adj, in_adj, v, settle_limit):
+                if w < out_adj[u].get(x, (np.inf, -1))[0]:
+                    out_adj[u][x] = (w, v)
+                    in_adj[x][u] = w
+
+            # Remaining neighbours all get contracted later, i.e. rank higher than v
+            for x, (w, m) in out_adj[v].items():
+                up[v].append((x, w, m))
+                del in_adj[x][v]
+                deleted_neighbours[x] += 1
+            for u in in_adj[v]:
+                w, m = out_adj[u].pop(v)
+                down[v].append((u, w, m))
+                deleted_neighbours[u] += 1
+            out_adj[v], in_adj[v] = {}, {}
+            contracted[v] = 1
+            rank[v] = order
+            order += 1
+            if log_every and order % log_every == 0:
+                print(f"  contracted {order}/{n} nodes")
+
+        arrays = {"rank": rank}
+        for name, lists, other in (("up", up, "dst"), ("down", down, "src")):
+            counts = [len(edges) for edges in lists]
+            indptr = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(counts, out=indptr[1:])
+            flat = [e for edges in lists for e in edges]
+            arrays[f"{name}_indptr"] = indptr
+            arrays[f"{name}_{other}"] = np.array([e[0] for e in flat], dtype=np.int32)
+            arrays[f"{name}_weight"] = np.array([e[1] for e in flat], dtype=np.float64)
+            arrays[f"{name}_middle"] = np.array([e[2] for e in flat], dtype=np.int32)
+        return cls(arrays)
+
+    def n_shortcuts(self):
+        return len(self.middle)
+
+    def query(self, source, target, stats=None):
+        """
+        Bidirectional upward Dijkstra. Returns (cost, [node indexes]) like
+        CSRGraph.shortest_path, or None when target is unreachable.
+        """
+        return self.query_many({source: 0.0}, {target: 0.0}, stats)
+
+    def query_many(self, sources, targets, stats=None):
+        """
+        query() from a virtual node with edges to `sources` to one with edges from
+        `targets`; both are {node index: cost}. The path runs from the source it
+        starts at to the target it ends at.
+        """
+        inf = float('inf')
+        dist = (dict(sources), dict(targets))
+        pred = ({}, {})
+        heaps = ([(d, u) for u, d in sources.items()], [(d, u) for u, d in targets.items()])
+        for heap in heaps:
+            heapq.heapify(heap)
+        graphs = (self.up, self.down)
+        best, meet = inf, -1
+        n_settled = n_scanned = 0
+
+        while heaps[0] or heaps[1]:
+            # Expand whichever side has the smaller frontier key
+            side = 0 if heaps[0] and (not heaps[1] or heaps[0][0][0] <= heaps[1][0][0]) else 1
+            d, u = heapq.heappop(heaps[side])
+            if d >= best:
+                # Keys only grow, so this side can't improve on best any more
+                heaps[side].clear()
+                continue
+            if d > dist[side][u]:
+                continue
+            n_settled += 1
+            other = dist[1 - side].get(u)
+            if other is not None and d + other < best:
+                best, meet = d + other, u
+            n_scanned += len(graphs[side][u])
+            for v, w in graphs[side][u]:
+                nd = d + w
+                if nd < dist[side].get(v, inf):
+                    dist[side][v] = nd
+                    pred[side][v] = u
+                    heapq.heappush(heaps[side], (nd, v))
+
+        if stats is not None:
+            stats["searches"] = stats.get("searches", 0) + 1
+            stats["nodes_settled"] = stats.get("nodes_settled", 0) + n_settled
+            stats["edges_scanned"] = stats.get("edges_scanned", 0) + n_scanned
+        if meet < 0:
+            return None
+
+        hops = [meet]
+        while hops[-1] in pred[0]:
+            hops.append(pred[0][hops[-1]])
+        hops.reverse()
+        while hops[-1] in pred[1]:
+            hops.append(pred[1][hops[-1]])
+
+        path = [hops[0]]
+        for a, b in zip(hops, hops[1:]):
+            self._unpack(a, b, path)
+        return best, path
+
+    def _unpack(self, a, b, path):
+        """Appends the original nodes after a on edge a -> b, expanding shortcuts."""
+        stack = [(a, b)]
+        while stack:
+            a, b = stack.pop()
+            m = self.middle.get((a, b))
+            if m is None:
+                path.append(b)
+            else:
+                stack.append((m, b))
+                stack.append((a, m))
@@ -0,0 +1,59 @@
+class GraphEditor:
+    """
+    Copy-on-write editing of a NetworkX DiGraph or MultiDiGraph.
+    `graph` starts as a new graph whose outer dicts point at the source's node and
+    adjacency rows, which costs a few dict copies instead of a full G.copy(). A row
+    is copied the first time an edit touches it, and edge values (data dicts, or key
+    dicts on a MultiDiGraph) are replaced rather than modified, so the source graph
+    never changes. Values read from `graph` may be shared with it: treat them as
+    read-only and write through the editor.
+    """
+    def __init__(self, G):
+        H = G.__class__()
+        H.graph.update(G.graph)
+        H._node = dict(G._node)
+        # Setting _adj also sets _succ; _pred must then share its edge values
+        H._adj = dict(G._succ)
+        H._pred = dict(G._pred)
+        self.graph = H
+        self._own_succ = set()
+        self._own_pred = set()
+
+    def _succ_row(self, u):
+        if u not in self._own_succ:
+            self.graph._succ[u] = dict(self.graph._succ[u])
+            self._own_succ.add(u)
+        return self.graph._succ[u]
+
+    def _pred_row(self, v):
+        if v not in self._own_pred:
+            self.graph._pred[v] = dict(self.graph._pred[v])
+            self._own_pred.add(v)
+        return self.graph._pred[v]
+
+    def set_node(self, n, attrs):
+        """Adds node n, or replaces its attribute dict."""
+        H = self.graph
+        if n not in H._node:
+            H._succ[n] = {}
+            H._pred[n] = {}
+            self._own_succ.add(n)
+            self._own_pred.add(n)
+        H._node[n] = attrs
+
+    def remove_node(self, n):
+        H = self.graph
+        for v in H._succ[n]:
+            del self._pred_row(v)[n]
+        for u in H._pred[n]:
+            del self._succ_row(u)[n]
+        del H._succ[n], H._pred[n], H._node[n]
+
+    def set_edge(self, u, v, value):
+        """Sets edge u -> v to `value`: its data dict, or its key dict on a MultiDiGraph."""
+        self._succ_row(u)[v] = value
+        self._pred_row(v)[u] = value
+
+    def remove_edge(self, u, v):
+        del self._succ_row(u)[v]
+        del self._pred_row(v)[u]
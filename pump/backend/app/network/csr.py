@@ -0,0 +1,530 @@
+import copy
+import heapq
+import math
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from app.network.alternatives import via_node_paths
+from app.network.geo import EARTH_RADIUS_M
+
+# Mode codes stored per edge. Index into this tuple to get the mode string back.
+MODES = ("walk", "bus", "metro")
+MODE_CODES = {m: i for i, m in enumerate(MODES)}
+
+# Fastest mode (metro) in m/s; dividing straight-line distance by it never overestimates
+MAX_SPEED_M_S = 10.0
+
+# Ids of the per-query nodes added by CSRGraph.with_endpoints
+VIRTUAL_SOURCE = "origin"
+VIRTUAL_TARGET = "destination"
+
+# "dijkstra" runs SciPy's full search, "astar" adds a haversine lower bound,
+# "alt" additionally uses landmark distances (A*, Landmarks, Triangle inequality)
+SEARCH_MODES = ("dijkstra", "astar", "alt")
+
+class CSRGraph:
+    """
+    Array-backed simple digraph for one time band.
+    Nodes are addressed by integer index (position in `node_ids`), and the outgoing
+    edges of node i live in `indices/weights/modes/lengths[indptr[i]:indptr[i+1]]`,
+    sorted by target. Shortest path searches run on SciPy's compiled Dijkstra over
+    these arrays.
+    The live overlay is kept apart from the arrays as `overrides`, {slot: (weight,
+    mode, length, zone)}: updating it only touches the changed slots and every array
+    stays shared between overlay versions. `weights` and `matrix` apply it on first
+    use by a search.
+    """
+    def __init__(self, node_ids, indptr, indices, weights, modes, lengths, lat=None, lon=None, zones=None, node_index=None):
+        self.node_ids = node_ids
+        self.node_index = {n: i for i, n in enumerate(node_ids)} if node_index is None else node_index
+        self.indptr = indptr
+        self.indices = indices
+        # Weights before any live overlay factors; modes, lengths and zones are also pre-overlay
+        self.base_weights = weights
+        self.overrides = {}
+        self._weights = None
+        self._matrix = None
+        self.modes = modes
+        self.lengths = lengths
+        # Congestion zone per edge (see app.network.zones)
+        self.zones = np.ones(len(indices), dtype=np.uint8) if zones is None else zones
+        # Node coordinates in radians, needed by the A* heuristic
+        self.lat = None if lat is None else np.radians(np.asarray(lat, dtype=np.float64))
+        self.lon = None if lon is None else np.radians(np.asarray(lon, dtype=np.float64))
+        self.landmarks = None
+        self.landmark_from = None
+        self.landmark_to = None
+        self._adjacency = None
+        # Optional ContractionHierarchy for these weights, used for unrestricted point-to-point searches
+        self.ch = None
+        self.ch_valid = True
+        # Set on with_endpoints() copies: (base node count, source costs, target costs)
+        self.virtual = None
+
+    @classmethod
+    def from_multigraph(cls, G, speeds):
+        """
+        Collapses a MultiDiGraph into CSR arrays, keeping the fastest parallel edge.
+        speeds: speed in m/s for each entry of MODES.
+        """
+        node_ids = list(G.nodes)
+        node_index = {n: i for i, n in enumerate(node_ids)}
+
+        n_edges = G.number_of_edges()
+        src = np.empty(n_edges, dtype=np.int32)
+        dst = np.empty(n_edges, dtype=np.int32)
+        modes = np.empty(n_edges, dtype=np.uint8)
+        lengths = np.empty(n_edges, dtype=np.float32)
+        zones = np.empty(n_edges, dtype=np.uint8)
+        lat = [G.nodes[n].get('lat', 0.0) for n in node_ids]
+        lon = [G.nodes[n].get('lon', 0.0) for n in node_ids]
+        for e, (u, v, d) in enumerate(G.edges(data=True)):
+            src[e] = node_index[u]
+            dst[e] = node_index[v]
+            modes[e] = MODE_CODES.get(d.get('mode', 'walk'), 0)
+            lengths[e] = d.get('length_m', 0.0)
+            zones[e] = d.get('zone', 1)
+
+        return cls.from_edges(node_ids, src, dst, modes, lengths, speeds, lat, lon, zones)
+
+    @classmethod
+    def from_edges(cls, node_ids, src, dst, modes, lengths, speeds, lat=None, lon=None, zones=None):
+        src, dst, weights, modes, lengths, zones = cls.collapse(src, dst, modes, lengths, zones, speeds)
+        indptr = np.zeros(len(node_ids) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(src, minlength=len(node_ids)), out=indptr[1:])
+
+        return cls(node_ids, indptr, dst.astype(np.int32), weights, modes, lengths, lat, lon, zones)
+
+    @staticmethod
+    def collapse(src, dst, modes, lengths, zones, speeds):
+        """
+        Fastest of the parallel per-mode edges for every (src, dst) pair under `speeds`.
+        Returns (src, dst, weights, modes, lengths, zones) sorted by (src, dst).
+        """
+        speed_table = np.maximum(np.asarray(speeds, dtype=np.float64), 1.0)
+        weights = lengths.astype(np.float64) / speed_table[modes]
+        zones = np.ones(len(src), dtype=np.uint8) if zones is None else np.asarray(zones, dtype=np.uint8)
+
+        # Sort by (src, dst, weight) so the first edge of every (src, dst) run is the fastest
+        order = np.lexsort((weights, dst, src))
+        src, dst, weights = src[order], dst[order], weights[order]
+        modes, lengths, zones = modes[order], lengths[order], zones[order]
+
+        keep = np.ones(len(src), dtype=bool)
+        keep[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+        return src[keep], dst[keep], weights[keep], modes[keep], lengths[keep], zones[keep]
+
+    def with_delta(self, node_ids, keep, moved, edges, speeds, lat=None, lon=None):
+        """
+        New graph after a stop delta; this one is left untouched.
+        node_ids: surviving nodes in their old order, then added ones
+        keep, moved: bool masks over this graph's nodes (survives / was moved)
+        edges: per-mode (src, dst, modes, lengths, zones) in new positions for every
+        pair touching a moved or added node
+        Collapsed edges away from those nodes are copied, keeping their overlay
+        overrides; the given pairs are collapsed again at base weight and merged in.
+        Landmarks are recomputed; the hierarchy is not kept.
+        """
+        new_index = np.cumsum(keep) - 1
+        src = np.repeat(np.arange(len(self.node_ids)), np.diff(self.indptr))
+        stay = keep[src] & keep[self.indices] & ~moved[src] & ~moved[self.indices]
+        k_src, k_dst = new_index[src[stay]], new_index[self.indices[stay]]
+        c_src, c_dst, c_weights, c_modes, c_lengths, c_zones = self.collapse(*edges, speeds)
+
+        # Both sets are sorted by (src, dst) and share no pair, so the new one is merged into place
+        n = len(node_ids)
+        at = np.searchsorted(k_src * n + k_dst, c_src * n + c_dst)
+        merge = lambda kept, new: np.insert(kept, at, new)
+        indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(merge(k_src, c_src), minlength=n), out=indptr[1:])
+
+        graph = CSRGraph(
+            node_ids, indptr, merge(k_dst, c_dst).astype(np.int32), merge(self.base_weights[stay], c_weights),
+            merge(self.modes[stay], c_modes), merge(self.lengths[stay], c_lengths), lat, lon,
+            merge(self.zones[stay], c_zones)
+        )
+        # Kept edge r lands after the new edges inserted before it
+        rank = np.cumsum(stay) - 1
+        graph.overrides = {
+            int(rank[slot] + np.searchsorted(at, rank[slot], side='right')): value
+            for slot, value in self.overrides.items() if stay[slot]
+        }
+        graph.ch_valid = graph._matches_base()
+        if self.landmarks is not None:
+            graph.build_landmarks(len(self.landmarks))
+        return graph
+
+    def with_endpoints(self, origin, destination, sources, targets):
+        """
+        Copy of the graph with a virtual origin node (index n) that has walk edges to
+        `sources` and a virtual destination (n + 1) reached by walk edges from `targets`,
+        so one search considers every candidate stop at both ends.
+        origin, destination: (lat, lon); sources, targets: {node index: (walk s, walk m)}
+        """
+        n = len(self.node_ids)
+        t_idx = np.array(sorted(targets), dtype=np.int64)
+        s_idx = np.array(sorted(sources), dtype=np.int64)
+        # Destination edges go at the end of each target's row, origin edges in a new row n
+        at = self.indptr[t_idx + 1]
+        def extend(base, t_values, s_values, dtype):
+            return np.concatenate([np.insert(base, at, np.asarray(t_values, dtype=dtype)), np.asarray(s_values, dtype=dtype)])
+
+        counts = np.diff(self.indptr)
+        counts[t_idx] += 1
+        indptr = np.zeros(n + 3, dtype=np.int64)
+        np.cumsum(np.concatenate([counts, [len(s_idx), 0]]), out=indptr[1:])
+
+        walk = MODE_CODES['walk']
+        base_weights = extend(self.base_weights, [targets[t][0] for t in t_idx], [sources[s][0] for s in s_idx], np.float64)
+        graph = CSRGraph(
+            list(self.node_ids) + [VIRTUAL_SOURCE, VIRTUAL_TARGET], indptr,
+            extend(self.indices, np.full(len(t_idx), n + 1), s_idx, np.int32), base_weights,
+            extend(self.modes, np.full(len(t_idx), walk), np.full(len(s_idx), walk), np.uint8),
+            extend(self.lengths, [targets[t][1] for t in t_idx], [sources[s][1] for s in s_idx], np.float32),
+            np.concatenate([np.degrees(self.lat), [origin[0], destination[0]]]) if self.lat is not None else None,
+            np.concatenate([np.degrees(self.lon), [origin[1], destination[1]]]) if self.lon is not None else None,
+            extend(self.zones, np.ones(len(t_idx)), np.ones(len(s_idx)), np.uint8),
+            {**self.node_index, VIRTUAL_SOURCE: n, VIRTUAL_TARGET: n + 1}
+        )
+        # Every edge slot moves up by the destination edges inserted before it
+        graph.overrides = {int(slot + np.searchsorted(at, slot, side='right')): value
+                           for slot, value in self.overrides.items()}
+        graph.ch, graph.ch_valid = self.ch, self.ch_valid
+        graph.virtual = (n, {s: sources[s][0] for s in s_idx.tolist()}, {t: targets[t][0] for t in t_idx.tolist()})
+
+        if self.landmarks is not None:
+            # Distances between landmarks and the virtual nodes, through their candidate stops
+            inf = np.full((len(self.landmarks), 1), np.inf)
+            to_target = (self.landmark_from[:, t_idx] + np.array([targets[t][0] for t in t_idx])).min(axis=1, keepdims=True)
+            from_source = (self.landmark_to[:, s_idx] + np.array([sources[s][0] for s in s_idx])).min(axis=1, keepdims=True)
+            graph.landmarks = self.landmarks
+            graph.landmark_from = np.hstack([self.landmark_from, inf, to_target])
+            graph.landmark_to = np.hstack([self.landmark_to, from_source, inf])
+        return graph
+
+    def _ch_query(self, source, target, stats):
+        if self.virtual is None:
+            return self.ch.query(source, target, stats)
+        n, sources, targets = self.virtual
+        found = self.ch.query_many(sources if source == n else {source: 0.0},
+                                   targets if target == n + 1 else {target: 0.0}, stats)
+        if found is None:
+            return None
+        # Costs already include the walk edges; only the virtual nodes are missing
+        cost, path = found
+        if source == n:
+            path = [n] + path
+        if target == n + 1:
+            path = path + [n + 1]
+        return cost, path
+
+    def _as_matrix(self, weights):
+        n = len(self.node_ids)
+        return csr_matrix((weights, self.indices, self.indptr), shape=(n, n), copy=False)
+
+    @property
+    def weights(self):
+        """Edge weights with the overlay overrides applied (np.inf where closed)."""
+        if not self.overrides:
+            return self.base_weights
+        if self._weights is None:
+            weights = self.base_weights.copy()
+            weights[np.fromiter(self.overrides, dtype=np.int64)] = [value[0] for value in self.overrides.values()]
+            self._weights = weights
+        return self._weights
+
+    @property
+    def matrix(self):
+        if self._matrix is None:
+            self._matrix = self._as_matrix(self.weights)
+        return self._matrix
+
+    def _matches_base(self):
+        return all(value[0] == self.base_weights[slot] for slot, value in self.overrides.items())
+
+    def edge_slot(self, u, v):
+        """Position of edge u -> v (integer indexes) in the edge arrays, or -1."""
+        start, end = int(self.indptr[u]), int(self.indptr[u + 1])
+        # Rows are sorted by target (see collapse)
+        slot = start + int(np.searchsorted(self.indices[start:end], v))
+        return slot if slot < end and self.indices[slot] == v else -1
+
+    def get_edge_data(self, u, v):
+        """Same contract as DiGraph.get_edge_data, keyed by node id."""
+        slot = self.edge_slot(self.node_index[u], self.node_index[v])
+        if slot < 0:
+            return None
+        if slot in self.overrides:
+            weight, mode, length, zone = self.overrides[slot]
+        else:
+            weight, mode, length, zone = self.base_weights[slot], self.modes[slot], self.lengths[slot], self.zones[slot]
+        return {
+            "mode": MODES[mode],
+            "length_m": float(length),
+            "zone": int(zone),
+            "dynamic_time": float(weight)
+        }
+
+    def build_landmarks(self, n_landmarks=8):
+        """
+        Picks landmarks by farthest-point sampling and stores exact travel times from
+        and to each of them, giving ALT its triangle-inequality lower bounds.
+        """
+        # Base weights: overlay factors only slow edges down, so the bounds stay admissible
+        matrix = self._as_matrix(self.base_weights)
+        reverse = matrix.T.tocsr()
+        landmarks = [int(np.argmax(self.lat))]
+        spread = np.full(len(self.node_ids), np.inf)
+        for _ in range(n_landmarks - 1):
+            d = self._haversine(landmarks[-1])
+            spread = np.minimum(spread, d)
+            landmarks.append(int(np.argmax(spread)))
+
+        self.landmarks = np.array(landmarks, dtype=np.int32)
+        self.landmark_from = dijkstra(matrix, indices=self.landmarks)
+        self.landmark_to = dijkstra(reverse, indices=self.landmarks)
+
+    def _haversine(self, target):
+        """Great-circle metres from every node to node index `target`."""
+        dphi = self.lat - self.lat[target]
+        dlambda = self.lon - self.lon[target]
+        a = np.sin(dphi / 2) ** 2 + np.cos(self.lat) * np.cos(self.lat[target]) * np.sin(dlambda / 2) ** 2
+        return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def heuristic(self, target, search="astar"):
+        """Lower bound on travel time (s) from every node to `target`."""
+        h = self._haversine(target) / MAX_SPEED_M_S
+        if search == "alt" and self.landmarks is not None:
+            with np.errstate(invalid='ignore'):
+                # d(v, t) >= d(L, t) - d(L, v) and d(v, t) >= d(v, L) - d(t, L)
+                forward = self.landmark_from[:, target][:, None] - self.landmark_from
+                backward = self.landmark_to - self.landmark_to[:, target][:, None]
+            bounds = np.concatenate([forward, backward])
+            bounds[~np.isfinite(bounds)] = 0.0
+            h = np.maximum(h, bounds.max(axis=0))
+        return h
+
+    def _adjacency_lists(self):
+        # Plain lists are much faster than NumPy scalars inside the Python A* loop
+        if self._adjacency is None:
+            self._adjacency = (self.indptr.tolist(), self.indices.tolist(), self.weights.tolist())
+        return self._adjacency
+
+    def edge_slots(self, u, v):
+        """edge_slot over sequences of integer indexes; -1 where there is no edge."""
+        return np.array([self.edge_slot(a, b) for a, b in zip(u, v)], dtype=np.int64)
+
+    def reweighted(self, slots, weights, modes, lengths, zones):
+        """
+        Copy of the graph with new weights and edge attributes at `slots` (np.inf
+        closes an edge), recorded as overrides; slots set back to their base values
+        drop out. Costs O(overrides): every array, landmarks and the hierarchy are
+        shared, and this graph is left untouched for searches running on it.
+        """
+        overrides = dict(self.overrides)
+        for slot, weight, mode, length, zone in zip(slots, weights, modes, lengths, zones):
+            slot = int(slot)
+            value = (float(weight), int(mode), float(length), int(zone))
+            # Lengths are stored as float32, so base values only match within rounding
+            if (mode == self.modes[slot] and zone == self.zones[slot]
+                    and math.isclose(weight, self.base_weights[slot], rel_tol=1e-6)
+                    and math.isclose(length, self.lengths[slot], rel_tol=1e-6)):
+                overrides.pop(slot, None)
+            else:
+                overrides[slot] = value
+        graph = copy.copy(self)
+        graph.overrides = overrides
+        graph._weights = graph._matrix = graph._adjacency = None
+        # The hierarchy encodes the base weights, so it is only usable while no factor applies
+        graph.ch_valid = graph._matches_base()
+        return graph
+
+    def shortest_path(self, source, target, banned_nodes=(), banned_edges=(), search="dijkstra", h=None, stats=None):
+        """
+        Returns (cost, [node indexes]) for the fastest source -> target path, or None.
+        banned_nodes lose all outgoing edges and banned_edges (u, v) are skipped,
+        which is what Yen's spur searches need.
+        search: one of SEARCH_MODES. h can pass in a precomputed heuristic for target.
+        stats: optional dict, "searches", "nodes_settled" and "edges_scanned" are incremented.
+        Without bans, a valid contraction hierarchy answers instead of any search mode.
+        """
+        if self.ch is not None and self.ch_valid and not banned_nodes and not banned_edges:
+            return self._ch_query(source, target, stats)
+        if search != "dijkstra" and self.lat is not None:
+            if h is None:
+                h = self.heuristic(target, search).tolist()
+            return self._astar(source, target, h, set(banned_nodes), set(banned_edges), stats)
+
+        matrix = self.matrix
+        if banned_nodes or banned_edges:
+            weights = self.weights.copy()
+            for u in banned_nodes:
+                weights[self.indptr[u]:self.indptr[u + 1]] = np.inf
+            for u, v in banned_edges:
+                slot = self.edge_slot(u, v)
+                if slot >= 0:
+                    weights[slot] = np.inf
+            matrix = self._as_matrix(weights)
+
+        dist, pred = dijkstra(matrix, indices=source, return_predecessors=True)
+        if stats is not None:
+            reached = np.isfinite(dist)
+            stats["searches"] = stats.get("searches", 0) + 1
+            stats["nodes_settled"] = stats.get("nodes_settled", 0) + int(reached.sum())
+            stats["edges_scanned"] = stats.get("edges_scanned", 0) + int(np.diff(self.indptr)[reached].sum())
+        if not np.isfinite(dist[target]):
+            return None
+
+        path = [target]
+        while path[-1] != source:
+            path.append(int(pred[path[-1]]))
+        path.reverse()
+        return float(dist[target]), path
+
+    def shortest_path_trees(self, sources):
+        """
+        One Dijkstra tree per source index in a single compiled call.
+        Returns (dist, pred) arrays of shape (len(sources), n_nodes).
+        """
+        dist, pred = dijkstra(self.matrix, indices=sources, return_predecessors=True)
+        return np.atleast_2d(dist), np.atleast_2d(pred)
+
+    def seeded_tree(self, seeds, limit=np.inf):
+        """
+        Travel times from several sources at once, each starting at its own offset
+        ({node index: seconds}, e.g. the walk to a candidate stop). Each seed gets a
+        search on the shared matrix bounded by what is left of `limit` after its
+        offset, so the cost follows the reachable area. Returns the per-node minimum
+        over the real nodes, np.inf beyond `limit`.
+        """
+        dist = np.full(len(self.node_ids), np.inf)
+        for seed, offset in seeds.items():
+            if offset <= limit:
+                np.minimum(dist, dijkstra(self.matrix, indices=seed, limit=limit - offset) + offset, out=dist)
+        return dist
+
+    @staticmethod
+    def path_from_tree(pred_row, source, target):
+        """Walks a predecessor row back from target; returns node indexes or None."""
+        if source != target and pred_row[target] < 0:
+            return None
+        path = [target]
+        while path[-1] != source:
+            path.append(int(pred_row[path[-1]]))
+        path.reverse()
+        return path
+
+    def _astar(self, source, target, h, banned_nodes, banned_edges, stats):
+        indptr, indices, weights = self._adjacency_lists()
+        inf = float('inf')
+        dist = [inf] * len(indptr)
+        dist[source] = 0.0
+        pred = {}
+        settled = bytearray(len(indptr))
+        n_settled = n_scanned = 0
+        heap = [(h[source], 0.0, source)]
+
+        while heap:
+            _, g, u = heapq.heappop(heap)
+            if settled[u]:
+                continue
+            settled[u] = 1
+            n_settled += 1
+            if u == target:
+                break
+            if u in banned_nodes:
+                continue
+            n_scanned += indptr[u + 1] - indptr[u]
+            for slot in range(indptr[u], indptr[u + 1]):
+                v = indices[slot]
+                if settled[v] or (banned_edges and (u, v) in banned_edges):
+                    continue
+                nd = g + weights[slot]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    pred[v] = u
+                    heapq.heappush(heap, (nd + h[v], nd, v))
+
+        if stats is not None:
+            stats["searches"] = stats.get("searches", 0) + 1
+            stats["nodes_settled"] = stats.get("nodes_settled", 0) + n_settled
+            stats["edges_scanned"] = stats.get("edges_scanned", 0) + n_scanned
+        if not settled[target]:
+            return None
+
+        path = [target]
+        while path[-1] != source:
+            path.append(pred[path[-1]])
+        path.reverse()
+        return dist[target], path
+
+    def alternative_paths(self, source_id, target_id, k, max_stretch, stats=None):
+        """
+        Up to k meaningfully different routes as lists of node ids, fastest first, from
+        one forward and one backward shortest-path tree (see alternatives.via_node_paths).
+        """
+        source = self.node_index[source_id]
+        target = self.node_index[target_id]
+        dist_s, pred_s = dijkstra(self.matrix, indices=source, return_predecessors=True)
+        dist_t, pred_t = dijkstra(self.matrix.T, indices=target, return_predecessors=True)
+        if stats is not None:
+            stats["searches"] = stats.get("searches", 0) + 2
+            reached_s, reached_t = np.isfinite(dist_s), np.isfinite(dist_t)
+            stats["nodes_settled"] = stats.get("nodes_settled", 0) + int(reached_s.sum() + reached_t.sum())
+            in_degree = np.bincount(self.indices, minlength=len(self.node_ids))
+            stats["edges_scanned"] = stats.get("edges_scanned", 0) + int(np.diff(self.indptr)[reached_s].sum() + in_degree[reached_t].sum())
+        if not np.isfinite(dist_s[target]):
+            return
+
+        total = dist_s + dist_t
+        candidates = np.nonzero(total <= dist_s[target] * (1 + max_stretch))[0]
+        candidates = candidates[np.argsort(total[candidates], kind='stable')]
+
+        def route_via(v):
+            head = self.path_from_tree(pred_s, source, v)
+            tail = self.path_from_tree(pred_t, target, v)[::-1]
+            costs = np.concatenate([np.diff(dist_s[head]), -np.diff(dist_t[tail])])
+            return head + tail[1:], costs.tolist()
+
+        for path in via_node_paths(candidates.tolist(), route_via, k):
+            yield [self.node_ids[i] for i in path]
+
+    def k_shortest_paths(self, source_id, target_id, k, search="dijkstra", stats=None):
+        """
+        Yen's algorithm over the CSR arrays. Yields up to k loopless paths as lists
+        of node ids, cheapest first, like nx.shortest_simple_paths.
+        """
+        source = self.node_index[source_id]
+        target = self.node_index[target_id]
+        # Every spur search shares the target, so the heuristic is computed once
+        h = self.heuristic(target, search).tolist() if search != "dijkstra" and self.lat is not None else None
+
+        first = self.shortest_path(source, target, search=search, h=h, stats=stats)
+        if first is None:
+            return
+        accepted = [first[1]]
+        yield [self.node_ids[i] for i in first[1]]
+
+        candidates = []
+        seen = {tuple(first[1])}
+        while len(accepted) < k:
+            last = accepted[-1]
+            root_cost = 0.0
+            for i in range(len(last) - 1):
+                root = last[:i + 1]
+                banned_edges = {(p[i], p[i + 1]) for p in accepted if len(p) > i + 1 and p[:i + 1] == root}
+                spur = self.shortest_path(last[i], target, banned_nodes=root[:-1], banned_edges=banned_edges,
+                                          search=search, h=h, stats=stats)
+                if spur is not None:
+                    path = root[:-1] + spur[1]
+                    if tuple(path) not in seen:
+                        seen.add(tuple(path))
+                        heapq.heappush(candidates, (root_cost + spur[0], path))
+                root_cost += self.weights[self.edge_slot(last[i], last[i + 1])]
+
+            if not candidates:
+                return
+            _, path = heapq.heappop(candidates)
+            accepted.append(path)
+            yield [self.node_ids[i] for i in path]
@@ -0,0 +1,41 @@
+import numpy as np
+
+EARTH_RADIUS_M = 6371000
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Vectorized great-circle distance in metres."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = np.radians(np.asarray(lon2) - np.asarray(lon1))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def project_local(lat, lon, lat0):
+    """
+    Equirectangular projection to metres on a plane tangent at latitude lat0. Over a
+    city the error is well under 1%, so Euclidean KD-tree distances are metric.
+    Returns an (n, 2) array of (x east, y north).
+    """
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    return np.column_stack([EARTH_RADIUS_M * lon * np.cos(np.radians(lat0)), EARTH_RADIUS_M * lat])
+
+def encode_polyline(lats, lons, precision=5):
+    """
+    Encoded polyline (Google's format, as read by Leaflet/MapLibre/mobile map SDKs):
+    zig-zag varints of coordinate deltas, five bits per printable character.
+    """
+    factor = 10 ** precision
+    coords = np.column_stack([np.round(np.asarray(lats, dtype=np.float64) * factor),
+                              np.round(np.asarray(lons, dtype=np.float64) * factor)]).astype(np.int64)
+    if len(coords) == 0:
+        return ""
+    deltas = np.diff(coords, axis=0, prepend=[[0, 0]]).ravel().tolist()
+    chars = []
+    for d in deltas:
+        v = ~(d << 1) if d < 0 else d << 1
+        while v >= 0x20:
+            chars.append(chr((0x20 | (v & 0x1f)) + 63))
+            v >>= 5
+        chars.append(chr(v + 63))
+    return "".join(chars)
@@ -1,95 +1,1058 @@
+import heapq
+import json
+import os
 import pickle
+import time
 from pathlib import Path
-import networkx as nx
+import numpy as np
+from collections import defaultdict
 from itertools import islice
+from scipy.spatial import KDTree
+# networkx is imported where it's used: the csr backend never needs it, and it's slow to import
+
+from app.metrics import current_stats, record, span
+from app.network.alternatives import ALT_MAX_STRETCH, via_node_paths
+from app.network.artifacts import MANIFEST, NodeTable, load_artifacts
+from app.network.cache import RouteCache
+from app.network.ch import ARRAY_NAMES as CH_ARRAYS, ContractionHierarchy
+from app.network.cow import GraphEditor
+from app.network.csr import CSRGraph, MODE_CODES, MODES, SEARCH_MODES, VIRTUAL_SOURCE, VIRTUAL_TARGET
+from app.network.geo import haversine_m, project_local
+from app.network.updates import link_nearby, parse_delta, patch_edges
+from app.network.zones import DEFAULT_ZONE, ZoneIndex
 
 DATA_DIR = Path("/home/jayant/gitgud/marg/marg/pump/data/processed")
 GRAPH_PATH = DATA_DIR / "multimodal_graph.gpickle"
 KDTREE_PATH = DATA_DIR / "spatial_index.pkl"
+# Memory-mappable arrays written by scripts/build_graph.py, used by the csr backend
+ARTIFACT_DIR = DATA_DIR / "multimodal_graph"
+# Congestion zone polygons; edges are tagged with their zone by scripts/build_graph.py
+ZONES_PATH = DATA_DIR / "congestion_zones.geojson"
+SOURCE_PATHS = (DATA_DIR / "bus_stops.json", DATA_DIR / "metro_stations.json", ZONES_PATH)
+
+# "networkx" keeps dict-of-dicts DiGraphs, "csr" uses the array-backed CSRGraph
+GRAPH_BACKEND = os.getenv("PUMP_GRAPH_BACKEND", "networkx")
+# Goal-directed search for the csr backend, one of SEARCH_MODES
+SEARCH_MODE = os.getenv("PUMP_SEARCH_MODE", "dijkstra")
+# Search results are cached per (source node, dest node, time band, k)
+ROUTE_CACHE_SIZE = int(os.getenv("PUMP_ROUTE_CACHE_SIZE", "1024"))
+ROUTE_CACHE_TTL = float(os.getenv("PUMP_ROUTE_CACHE_TTL", "300"))
+# Route alternatives: "yen" (k shortest simple paths) or "via" (via-node alternatives,
+# two shortest-path trees per query with bounded stretch and overlap)
+ALTERNATIVES = os.getenv("PUMP_ALTERNATIVES", "yen")
+# Artifact checksums at load: "auto" (only files whose size or mtime changed), "full" or "off"
+VERIFY_ARTIFACTS = os.getenv("PUMP_VERIFY_ARTIFACTS", "auto")
+# Use contraction hierarchies from scripts/build_ch.py for the first path when present (csr only)
+USE_CH = os.getenv("PUMP_USE_CH", "1") == "1"
+
+# Max reasonable walk to a node, in metres
+SNAP_RADIUS_M = float(os.getenv("PUMP_SNAP_RADIUS_M", "1500"))
+# Candidate stops per endpoint; routing searches from all of them at once
+SNAP_CANDIDATES = int(os.getenv("PUMP_SNAP_CANDIDATES", "4"))
+# Walk times are bucketed to this many seconds in route cache keys
+SNAP_CACHE_STEP_S = 30
+# Points closer than this to their stop, in metres, get no walk leg to it
+ACCESS_MIN_M = 1.0
+# Sources per batched Dijkstra call; bounds the (sources x nodes) result arrays
+BATCH_TREE_CHUNK = 256
+
+def open_edge_time(u, v, d):
+    """NetworkX weight function that hides edges closed by the live overlay."""
+    return None if d.get('closed') else d['dynamic_time']
+
+# Edge weights only depend on the mode and whether the departure falls in rush hour,
+# so every request maps onto one of these bands and shares its precomputed graph.
+TIME_BANDS = ("off_peak", "rush")
+
+def get_time_band(hour):
+    if (8 <= hour <= 11) or (17 <= hour <= 20):
+        return "rush"
+    return "off_peak"
+
+def mode_speed(mode, band):
+    """Approximate the ML model's rules (m/s) for rapid graph traversal."""
+    if mode == 'metro':
+        return 10.0
+    if mode == 'bus':
+        base_speed = 5.0
+        # Rush hour penalty
+        if band == "rush":
+            base_speed *= 0.5
+        return base_speed
+    return 1.4 # walk
 
 class RouteEngine:
-    def __init__(self):
+    def __init__(self, backend=GRAPH_BACKEND, search_mode=SEARCH_MODE, alternatives=ALTERNATIVES):
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {search_mode}")
+        if alternatives not in ("yen", "via"):
+            raise ValueError(f"Unknown alternatives method: {alternatives}")
+        self.backend = backend
+        self.search_mode = search_mode
+        self.alternatives = alternatives
         self.G = None
-        self.tree = None
+        self.nodes = None
+        self.edge_arrays = None
         self.node_ids = None
         self.coords = None
+        # KD-Tree over stops projected to metres (see geo.project_local)
+        self.metric_tree = None
+        self.metric_lat0 = None
+        self.zone_index = None
+        self.weighted_graphs = {}
+        self.route_cache = RouteCache(ROUTE_CACHE_SIZE, ROUTE_CACHE_TTL)
+        # Live overlay: entry id -> spec, entry id -> {(u, v, mode): factor}, and the merged factors
+        self.overlay_specs = {}
+        self.overlay_edges = {}
+        self.edge_factors = {}
+        # Lookups over edge_arrays for overlay updates (see _edge_index)
+        self._edge_lookup = None
         
     def load(self):
+        if self.backend == "csr" and (ARTIFACT_DIR / MANIFEST).exists():
+            self._load_artifacts()
+        else:
+            self._load_pickles()
+            
+        self._build_metric_index()
+        # Any previously collapsed graphs and cached routes belong to the old network
+        self._edge_lookup = None
+        self.weighted_graphs = {}
+        self.route_cache.clear()
+        for band in TIME_BANDS:
+            self.get_weighted_graph(band)
+        print(f"Loaded {len(self.nodes)} nodes into engine.")
+        
+    def _load_pickles(self):
         print("Loading Route Engine Graph and KD-Tree...")
+        # Read one after the other: the KD-tree pickle is a few ms next to the graph's,
+        # and unpickling holds the GIL, so a thread per file wouldn't overlap them
         with open(GRAPH_PATH, 'rb') as f:
             self.G = pickle.load(f)
+        self.nodes = self.G.nodes
+        self.edge_arrays = None
             
         with open(KDTREE_PATH, 'rb') as f:
             index_data = pickle.load(f)
-            self.tree = index_data['tree']
             self.node_ids = index_data['node_ids']
             self.coords = index_data['coords']
-        print(f"Loaded {len(self.G.nodes)} nodes into engine.")
+            
+    def _load_artifacts(self):
+        print("Memory-mapping Route Engine Graph artifacts...")
+        data = load_artifacts(ARTIFACT_DIR, verify=VERIFY_ARTIFACTS, sources=SOURCE_PATHS)
+        self.G = None
+        self.node_ids = [n.decode() for n in data['node_ids']]
+        self.nodes = NodeTable(self.node_ids, data['node_attrs'])
+        self.edge_arrays = data
+        self.coords = np.column_stack([data['node_lat'], data['node_lon']])
         
+    def _mode_edges(self):
+        """Per-mode edge arrays (src, dst, mode, length_m, zone) over node positions, sorted by source."""
+        if self.edge_arrays is not None:
+            arrays = self.edge_arrays
+            src = np.repeat(np.arange(len(self.node_ids)), np.diff(arrays['edge_indptr']))
+            return (src, np.asarray(arrays['edge_dst']), np.asarray(arrays['edge_mode']),
+                    np.asarray(arrays['edge_length_m']), np.asarray(arrays['edge_zone']))
+        position = {n: i for i, n in enumerate(self.node_ids)}
+        edges = sorted(
+            ((position[u], position[v], MODES.index(d.get('mode', 'walk')), d.get('length_m', 0.0),
+              d.get('zone', DEFAULT_ZONE))
+             for u, v, d in self.G.edges(data=True)),
+            key=lambda e: e[0]
+        )
+        src, dst, mode, length, zone = (list(col) for col in zip(*edges)) if edges else ([], [], [], [], [])
+        return (np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64), np.array(mode, dtype=np.uint8),
+                np.array(length, dtype=np.float32), np.array(zone, dtype=np.uint8))
+
+    def apply_delta(self, delta):
+        """
+        Returns a new engine with stops added, removed or moved (see updates.parse_delta).
+        Only the edges around the changed stops are rebuilt: on networkx the new graphs
+        share every untouched row with this engine's (cow.GraphEditor), on csr the edge
+        arrays are patched in a few vectorized passes. This engine is not modified, so
+        in-flight searches on it are unaffected. Contraction hierarchies no longer match
+        the network and are dropped.
+        """
+        if self.nodes is None:
+            raise ValueError("Engine not loaded")
+        remove, moves, adds = parse_delta(delta, self.nodes)
+        if self.zone_index is None:
+            self.zone_index = ZoneIndex.load(ZONES_PATH)
+
+        engine = RouteEngine(self.backend, self.search_mode, self.alternatives)
+        engine.zone_index = self.zone_index
+        # Nodes: surviving stops keep their order, added ones go on the end
+        keep = np.array([n not in remove for n in self.node_ids], dtype=bool)
+        moved = np.array([n in moves for n in self.node_ids], dtype=bool)
+        engine.node_ids = [n for n, k in zip(self.node_ids, keep) if k] + [stop['id'] for stop in adds]
+        position = {n: i for i, n in enumerate(engine.node_ids)}
+        added = [(float(stop['lat']), float(stop['lon'])) for stop in adds]
+        coords = np.vstack([np.asarray(self.coords, dtype=np.float64)[keep], np.reshape(added, (-1, 2))])
+        for node_id, point in moves.items():
+            coords[position[node_id]] = point
+        engine.coords = coords
+        engine._build_metric_index()
+        lat, lon = coords[:, 0], coords[:, 1]
+
+        # Proximity edges of moved and added stops; only the linked stops' types are looked up
+        added_attrs = {stop['id']: stop for stop in adds}
+        def is_bus(indexes):
+            ids = [engine.node_ids[i] for i in indexes.tolist()]
+            return np.array([(added_attrs.get(n) or self.nodes[n]).get('type') == 'bus_stop' for n in ids], dtype=bool)
+        relink = np.array(sorted(position[n] for n in [*moves, *added_attrs]), dtype=np.int64)
+        links = link_nearby(lat, lon, is_bus, relink, self.zone_index)
+
+        # Overlay factors carry over except around the changed stops, whose edges are
+        # rebuilt at base speed; re-resolving every entry below restores those
+        changed = remove | set(moves) | set(added_attrs)
+        untouched = lambda edge: edge[0] not in changed and edge[1] not in changed
+        engine.edge_factors = {e: f for e, f in self.edge_factors.items() if untouched(e)}
+        engine.overlay_specs = dict(self.overlay_specs)
+        engine.overlay_edges = {
+            entry_id: {e: f for e, f in edges.items() if untouched(e)}
+            for entry_id, edges in self.overlay_edges.items()
+        }
+
+        if self.backend == "csr":
+            self._delta_arrays(engine, keep, moved, moves, adds, links)
+        else:
+            self._delta_graphs(engine, remove, moves, adds, links)
+
+        if any(getattr(G_simple, 'ch', None) is not None for G_simple in self.weighted_graphs.values()):
+            print("Graph delta applied: contraction hierarchies no longer match the network and are "
+                  f"disabled; searches use {self.search_mode} until the graph is rebuilt "
+                  "(scripts/build_graph.py, scripts/build_ch.py) and the API restarted.")
+        for entry_id, spec in self.overlay_specs.items():
+            try:
+                engine.set_overlay(entry_id, spec)
+            except ValueError:
+                # The entry referred to a stop the delta removed
+                engine.clear_overlay(entry_id)
+        return engine
+
+    def _delta_arrays(self, engine, keep, moved, moves, adds, links):
+        """apply_delta for the csr backend: patched per-mode arrays, re-collapsed bands."""
+        lat, lon = engine.coords[:, 0], engine.coords[:, 1]
+        src, dst, mode, length, zone = patch_edges(self._mode_edges(), keep, moved, lat, lon, links, self.zone_index)
+        indptr = np.zeros(len(engine.node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(engine.node_ids)), out=indptr[1:])
+        engine.edge_arrays = {
+            "edge_indptr": indptr,
+            "edge_dst": dst.astype(np.int32),
+            "edge_mode": mode,
+            "edge_length_m": length,
+            "edge_zone": zone,
+            "node_lat": lat,
+            "node_lon": lon,
+        }
+
+        if isinstance(self.nodes, NodeTable):
+            attrs = [a for a, k in zip(self.nodes.attrs, keep) if k]
+        else:
+            attrs = [json.dumps(self.nodes[n]) for n, k in zip(self.node_ids, keep) if k]
+        attrs += [json.dumps(stop) for stop in adds]
+        position = {n: i for i, n in enumerate(engine.node_ids)}
+        for node_id, (stop_lat, stop_lon) in moves.items():
+            i = position[node_id]
+            attrs[i] = json.dumps({**json.loads(attrs[i]), "lat": stop_lat, "lon": stop_lon})
+        engine.nodes = NodeTable(engine.node_ids, attrs)
+
+        # Band graphs keep their collapsed edges away from the changed stops; pairs
+        # touching moved or added stops are collapsed again from the patched arrays
+        touched = np.zeros(len(engine.node_ids), dtype=bool)
+        touched[np.cumsum(keep)[moved] - 1] = True
+        touched[len(touched) - len(adds):] = True
+        near = touched[src] | touched[dst]
+        for band, G_simple in self.weighted_graphs.items():
+            engine.weighted_graphs[band] = G_simple.with_delta(
+                engine.node_ids, keep, moved, (src[near], dst[near], mode[near], length[near], zone[near]),
+                [mode_speed(m, band) for m in MODES], lat, lon
+            )
+
+    def _delta_graphs(self, engine, remove, moves, adds, links):
+        """
+        apply_delta for the networkx backend: edits copy-on-write views of the
+        MultiDiGraph and of every band graph, re-collapsing only the node pairs
+        around moved and added stops.
+        """
+        ids = engine.node_ids
+        lat, lon = engine.coords[:, 0], engine.coords[:, 1]
+        position = {n: i for i, n in enumerate(ids)}
+        edit = GraphEditor(self.G)
+        H = edit.graph
+        for n in remove:
+            edit.remove_node(n)
+
+        # Moved stops keep only their metro line edges, re-measured
+        metro = []
+        for n, (stop_lat, stop_lon) in moves.items():
+            edit.set_node(n, {**H._node[n], "lat": stop_lat, "lon": stop_lon})
+            for u, v in [(n, v) for v in H._succ[n]] + [(u, n) for u in H._pred[n]]:
+                if (u, v) in metro or not H._succ[u].get(v):
+                    continue
+                keydict = {k: d for k, d in H._succ[u][v].items() if d.get('mode') == 'metro'}
+                if keydict:
+                    edit.set_edge(u, v, keydict)
+                    metro.append((u, v))
+                else:
+                    edit.remove_edge(u, v)
+        if metro:
+            m_src = np.array([position[u] for u, _ in metro], dtype=np.int64)
+            m_dst = np.array([position[v] for _, v in metro], dtype=np.int64)
+            lengths = haversine_m(lat[m_src], lon[m_src], lat[m_dst], lon[m_dst])
+            zones = self.zone_index.edge_zones(lat, lon, m_src, m_dst)
+            for (u, v), length, zone in zip(metro, lengths.tolist(), zones.tolist()):
+                edit.set_edge(u, v, {k: {**d, "length_m": length, "zone": zone} for k, d in H._succ[u][v].items()})
+
+        for stop in adds:
+            edit.set_node(stop['id'], dict(stop))
+        for s, d, m, length, zone in zip(*(col.tolist() for col in links)):
+            u, v, mode = ids[s], ids[d], MODES[m]
+            edit.set_edge(u, v, {**H._succ[u].get(v, {}), f"{mode}_{u}_{v}": {"mode": mode, "length_m": length, "zone": zone}})
+        engine.G = H
+        engine.nodes = H.nodes
+
+        # Band graphs: every pair touching a moved or added stop is collapsed again
+        relinked = set(moves) | {stop['id'] for stop in adds}
+        pairs = {(n, v) for n in relinked for v in H._succ[n]} | {(u, n) for n in relinked for u in H._pred[n]}
+        for band, G_simple in self.weighted_graphs.items():
+            band_edit = GraphEditor(G_simple)
+            B = band_edit.graph
+            for n in remove:
+                band_edit.remove_node(n)
+            for stop in adds:
+                band_edit.set_node(stop['id'], {})
+            for n in moves:
+                for v in list(B._succ[n]):
+                    band_edit.remove_edge(n, v)
+                for u in list(B._pred[n]):
+                    band_edit.remove_edge(u, n)
+            for u, v in pairs:
+                band_edit.set_edge(u, v, self._collapse_pair(H._succ[u][v].values(), band))
+            engine.weighted_graphs[band] = B
+
+    def _build_metric_index(self):
+        coords = np.asarray(self.coords, dtype=np.float64)
+        self.metric_lat0 = float(coords[:, 0].mean())
+        self.metric_tree = KDTree(project_local(coords[:, 0], coords[:, 1], self.metric_lat0))
+
+    def snap_candidates(self, points, k=SNAP_CANDIDATES, radius_m=SNAP_RADIUS_M):
+        """
+        The k nearest stops within radius_m of every (lat, lon) point, in one batched query.
+        Returns (indexes, metres), both (n, k) and nearest first; missing candidates have
+        index -1 and distance inf.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        xy = project_local(points[:, 0], points[:, 1], self.metric_lat0)
+        dist, idx = self.metric_tree.query(xy, k=k, distance_upper_bound=radius_m)
+        dist, idx = dist.reshape(len(points), k), idx.reshape(len(points), k)
+        idx[~np.isfinite(dist)] = -1
+        return idx, dist
+
     def get_nearest_node(self, lat, lon):
-        dist, idx = self.tree.query([lat, lon])
-        return self.node_ids[idx], dist
+        """Nearest stop id and its distance in metres (None beyond SNAP_RADIUS_M)."""
+        (node_id,), dist = self.snap_points([(lat, lon)])
+        return node_id, float(dist[0])
 
-    def k_shortest_paths(self, source_lat, source_lon, dest_lat, dest_lon, k=5, departure_hour=10, departure_day=0):
+    def snap_points(self, points):
         """
-        Uses NetworkX's built-in `shortest_simple_paths` (Yen's algorithm implementation)
-        to find top k routes minimizing dynamic time-based weights instead of mere distance.
+        Vectorized get_nearest_node for an (n, 2) array of (lat, lon).
+        Returns (node ids, metres); points farther than SNAP_RADIUS_M get None and inf.
         """
-        if self.G is None:
+        idx, dist = self.snap_candidates(points, k=1)
+        node_ids = [self.node_ids[i] if i >= 0 else None for i in idx[:, 0].tolist()]
+        return node_ids, dist[:, 0]
+
+    def _walk_seeds(self, points, band):
+        """
+        Candidate stops of every (lat, lon) point with the walk to each, as one
+        {node index: walk seconds} dict per point (empty when nothing is in range).
+        """
+        idx, dist = self.snap_candidates(points)
+        walk = dist / mode_speed('walk', band)
+        return [{i: w for i, w in zip(row_idx, row_walk) if i >= 0}
+                for row_idx, row_walk in zip(idx.tolist(), walk.tolist())]
+
+    def _seeded_times(self, G_simple, seeds, limit):
+        """
+        Travel time to every node reachable within `limit` seconds when the search
+        starts from all `seeds` ({node index: offset s}) at once, as {node id: seconds}.
+        Offsets are included, so each node gets its best candidate stop.
+        """
+        if self.backend == "csr":
+            dist = G_simple.seeded_tree(seeds, limit)
+            reached = np.nonzero(np.isfinite(dist))[0]
+            return {G_simple.node_ids[i]: float(dist[i]) for i in reached}
+
+        # NetworkX has no multi-source search with per-source offsets, so run Dijkstra here
+        times = {}
+        heap = [(t, self.node_ids[i]) for i, t in seeds.items()]
+        heapq.heapify(heap)
+        while heap:
+            t, u = heapq.heappop(heap)
+            if t > limit:
+                break
+            if u in times:
+                continue
+            times[u] = t
+            for v, d in G_simple.adj[u].items():
+                w = open_edge_time(u, v, d)
+                if w is not None and v not in times:
+                    heapq.heappush(heap, (t + w, v))
+        return times
+
+    def isochrone(self, lat, lon, budget_s=1800, departure_hour=10):
+        """
+        Stops reachable from a point within `budget_s` seconds, using the time band's
+        graph weights plus the walk to the start. Like route search, every candidate
+        stop near the point seeds the search with its own walk time. The search stops
+        at the budget, so its cost grows with the reachable area rather than the graph.
+        Returns [{"stop": node attributes, "arrival_s": seconds}] sorted by arrival.
+        """
+        if self.nodes is None:
             raise ValueError("Engine not loaded")
-            
-        source_id, s_dist = self.get_nearest_node(source_lat, source_lon)
-        dest_id, d_dist = self.get_nearest_node(dest_lat, dest_lon)
-        
-        # Max reasonable walk to a node (approx 1.5km)
-        if s_dist > 0.015 or d_dist > 0.015:
+
+        band = get_time_band(departure_hour)
+        (seeds,) = self._walk_seeds([(lat, lon)], band)
+        if not seeds:
             return []
+
+        times = self._seeded_times(self.get_weighted_graph(band), seeds, budget_s)
+        reachable = sorted(times.items(), key=lambda item: item[1])
+        return [{"stop": self.nodes[n], "arrival_s": round(t, 1)} for n, t in reachable]
+
+    def travel_time_matrix(self, origins, destinations, departure_hour=10, max_time_s=None):
+        """
+        Many-to-many travel times (s) between (lat, lon) points, including the walks
+        to and from the stops. Both ends use every candidate stop in range, so each
+        entry is the best combination; pairs within SNAP_RADIUS_M of each other can
+        also just walk there. One search per distinct set of origin candidates,
+        bounded by max_time_s when given. Unreachable entries are None.
+        """
+        if self.nodes is None:
+            raise ValueError("Engine not loaded")
+
+        band = get_time_band(departure_hour)
+        origin_seeds = self._walk_seeds(origins, band)
+        dest_walks = [{self.node_ids[i]: w for i, w in seeds.items()}
+                      for seeds in self._walk_seeds(destinations, band)]
+        G_simple = self.get_weighted_graph(band)
+        limit = np.inf if max_time_s is None else max_time_s
+
+        # Straight walk between every origin and destination, where it's short enough
+        o = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+        d = np.asarray(destinations, dtype=np.float64).reshape(-1, 2)
+        walk_m = haversine_m(o[:, 0, None], o[:, 1, None], d[None, :, 0], d[None, :, 1])
+        direct = np.where(walk_m <= SNAP_RADIUS_M, walk_m / mode_speed('walk', band), np.inf).tolist()
+
+        trees = {}
+        matrix = []
+        for seeds, direct_row in zip(origin_seeds, direct):
+            times = {}
+            if seeds:
+                key = tuple(sorted(seeds.items()))
+                if key not in trees:
+                    trees[key] = self._seeded_times(G_simple, seeds, limit)
+                times = trees[key]
+            row = []
+            for walks, walk_s in zip(dest_walks, direct_row):
+                total = min([times[n] + w for n, w in walks.items() if n in times] + [walk_s])
+                row.append(round(float(total), 1) if np.isfinite(total) and total <= limit else None)
+            matrix.append(row)
+        return matrix
+
+    def get_weighted_graph(self, band):
+        """
+        Returns the simple graph collapsed from the MultiDiGraph for a time band, building it
+        on first use. shortest_simple_paths does not support MultiGraphs natively, so
+        parallel edges are reduced to the fastest one under the band's speeds.
+        """
+        G_simple = self.weighted_graphs.get(band)
+        if G_simple is not None:
+            return G_simple
             
-        # Update graph edge weights dynamically *before* route calculation
-        # and project the MultiDiGraph to a DiGraph since shortest_simple_paths
-        # does not support MultiGraphs natively.
+        if self.backend == "csr":
+            speeds = [mode_speed(m, band) for m in MODES]
+            if self.G is not None:
+                G_simple = CSRGraph.from_multigraph(self.G, speeds)
+            else:
+                arrays = self.edge_arrays
+                src = np.repeat(np.arange(len(self.node_ids), dtype=np.int32), np.diff(arrays['edge_indptr']))
+                G_simple = CSRGraph.from_edges(
+                    self.node_ids, src, arrays['edge_dst'], arrays['edge_mode'], arrays['edge_length_m'],
+                    speeds, arrays['node_lat'], arrays['node_lon'], arrays['edge_zone']
+                )
+            if self.search_mode == "alt":
+                G_simple.build_landmarks()
+            if USE_CH and self.edge_arrays is not None:
+                G_simple.ch = self._load_ch(band, speeds)
+            G_simple = self._with_factors(G_simple, band, self._factored_pairs())
+            self.weighted_graphs[band] = G_simple
+            return G_simple
+            
+        import networkx as nx
         G_simple = nx.DiGraph()
-        
-        for u, v, key, d in self.G.edges(keys=True, data=True):
-            mode = d.get('mode', 'walk')
-            length = d.get('length_m', 0.0)
-            
-            # Approximate the ML models rules for rapid graph traversal
-            speed_m_s = 1.4 # walk
-            if mode == 'metro':
-                speed_m_s = 10.0
-            elif mode == 'bus':
-                base_speed = 5.0
-                # Rush hour penalty
-                if (8 <= departure_hour <= 11) or (17 <= departure_hour <= 20):
-                    base_speed *= 0.5
-                speed_m_s = base_speed
+        G_simple.add_nodes_from(self.G.nodes)
+        G_simple.add_edges_from(
+            (u, v, self._collapse_pair(keydict.values(), band))
+            for u, nbrs in self.G.adjacency() for v, keydict in nbrs.items()
+        )
+            
+        G_simple = self._with_factors(G_simple, band, self._factored_pairs())
+        self.weighted_graphs[band] = G_simple
+        return G_simple
+
+    @staticmethod
+    def _collapse_pair(edges, band, factors=None):
+        """
+        Attributes of the collapsed u -> v edge, from its parallel per-mode edge dicts:
+        the fastest under the band's speeds (the first one on ties) after the live
+        overlay's {mode: factor}. base_time is the fastest time without factors. When
+        every mode is closed the unfactored fastest edge is kept, marked closed.
+        """
+        base_time, base, best_time, best = None, None, None, None
+        for d in edges:
+            time_s = d.get('length_m', 0.0) / max(mode_speed(d.get('mode', 'walk'), band), 1.0)
+            if base is None or time_s < base_time:
+                base_time, base = time_s, d
+            if factors:
+                time_s *= factors.get(d.get('mode', 'walk'), 1.0)
+            if np.isfinite(time_s) and (best is None or time_s < best_time):
+                best_time, best = time_s, d
+        if best is None:
+            return {**base, 'dynamic_time': base_time, 'base_time': base_time, 'closed': True}
+        return {**best, 'dynamic_time': best_time, 'base_time': base_time}
+
+    def _load_ch(self, band, speeds):
+        """The band's contraction hierarchy from the artifacts, if it was built for these speeds."""
+        info = self.edge_arrays.get("manifest", {}).get("contraction_hierarchies", {}).get(band)
+        if info is None:
+            return None
+        if info["speeds"] != speeds:
+            print(f"Contraction hierarchy for {band} was built for other speeds; rerun scripts/build_ch.py")
+            return None
+        return ContractionHierarchy({name: self.edge_arrays[f"ch_{band}_{name}"] for name in CH_ARRAYS})
+
+    def _edge_index(self):
+        """
+        Lookups over the per-mode edge arrays, built on first use: the source of every
+        edge, edge positions sorted by (src, dst) key, and edge positions grouped by
+        target (edge_indptr already groups them by source). Edges only change through
+        apply_delta, which makes a new engine, so every overlay update reuses them.
+        """
+        if self._edge_lookup is None:
+            n = len(self.node_ids)
+            indptr = np.asarray(self.edge_arrays['edge_indptr'], dtype=np.int64)
+            dst = np.asarray(self.edge_arrays['edge_dst'], dtype=np.int64)
+            src = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+            keys = src * n + dst
+            by_pair = np.argsort(keys, kind='stable')
+            in_indptr = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(np.bincount(dst, minlength=n), out=in_indptr[1:])
+            self._edge_lookup = {
+                "indptr": indptr, "src": src, "dst": dst,
+                "pair_keys": keys[by_pair], "by_pair": by_pair,
+                "in_indptr": in_indptr, "by_target": np.argsort(dst, kind='stable'),
+            }
+        return self._edge_lookup
+
+    def _edges_touching(self, node_ids, both_ends=False):
+        """(u, v, mode) of per-mode edges touching node_ids (or inside it, with both_ends)."""
+        if self.G is None:
+            look = self._edge_index()
+            members = [self.nodes.node_index[n] for n in node_ids]
+            slots = np.unique(np.concatenate(
+                [np.arange(look['indptr'][i], look['indptr'][i + 1]) for i in members]
+                + [look['by_target'][look['in_indptr'][i]:look['in_indptr'][i + 1]] for i in members]
+                + [np.empty(0, dtype=np.int64)]
+            ))
+            src, dst = look['src'][slots], look['dst'][slots]
+            if both_ends:
+                inside = np.isin(src, members) & np.isin(dst, members)
+                slots, src, dst = slots[inside], src[inside], dst[inside]
+            mode = np.asarray(self.edge_arrays['edge_mode'])[slots]
+            ids = self.node_ids
+            return [(ids[u], ids[v], MODES[m]) for u, v, m in zip(src.tolist(), dst.tolist(), mode.tolist())]
+        node_ids = set(node_ids)
+        edges = set()
+        for n in node_ids:
+            for u, v, d in list(self.G.out_edges(n, data=True)) + list(self.G.in_edges(n, data=True)):
+                if not both_ends or (u in node_ids and v in node_ids):
+                    edges.add((u, v, d.get('mode', 'walk')))
+        return sorted(edges)
+
+    def _pair_edges(self, pairs):
+        """Per-mode edge dicts ({"mode", "length_m", "zone"}) of every (u, v) pair, in graph order."""
+        if self.G is not None:
+            return {(u, v): list(self.G[u][v].values()) for u, v in pairs}
+        look = self._edge_index()
+        pairs = list(pairs)
+        n, index = len(self.node_ids), self.nodes.node_index
+        wanted = np.array([index[u] * n + index[v] for u, v in pairs], dtype=np.int64)
+        starts = np.searchsorted(look['pair_keys'], wanted, side='left')
+        ends = np.searchsorted(look['pair_keys'], wanted, side='right')
+        arrays = self.edge_arrays
+        edges = {}
+        for pair, start, end in zip(pairs, starts.tolist(), ends.tolist()):
+            # A stable sort keeps each pair's edges in graph order
+            slots = look['by_pair'][start:end]
+            edges[pair] = [
+                {"mode": MODES[m], "length_m": l, "zone": z}
+                for m, l, z in zip(np.asarray(arrays['edge_mode'])[slots].tolist(),
+                                   np.asarray(arrays['edge_length_m'])[slots].tolist(),
+                                   np.asarray(arrays['edge_zone'])[slots].tolist())
+            ]
+        return edges
+
+    def _factored_pairs(self):
+        return {(u, v) for u, v, _ in self.edge_factors}
+
+    def _with_factors(self, G_simple, band, pairs, edges=None):
+        """
+        Copy of a band graph with the given (u, v) pairs collapsed again from their
+        per-mode edges under the current edge_factors. Untouched parts are shared
+        (copy-on-write rows on networkx, overrides over shared arrays on csr) and
+        G_simple itself is not modified, so searches running on it see a consistent graph.
+        """
+        if not pairs:
+            return G_simple
+        if edges is None:
+            edges = self._pair_edges(pairs)
+        collapsed = {}
+        for u, v in pairs:
+            factors = {m: self.edge_factors[(u, v, m)] for m in MODES if (u, v, m) in self.edge_factors}
+            collapsed[(u, v)] = self._collapse_pair(edges[(u, v)], band, factors)
+
+        if self.backend == "csr":
+            index = G_simple.node_index
+            slots = G_simple.edge_slots([index[u] for u, _ in collapsed], [index[v] for _, v in collapsed])
+            values = list(collapsed.values())
+            return G_simple.reweighted(
+                slots,
+                [np.inf if d.get('closed') else d['dynamic_time'] for d in values],
+                [MODE_CODES[d.get('mode', 'walk')] for d in values],
+                [d.get('length_m', 0.0) for d in values],
+                [d.get('zone', DEFAULT_ZONE) for d in values]
+            )
+        edit = GraphEditor(G_simple)
+        for (u, v), d in collapsed.items():
+            edit.set_edge(u, v, d)
+        return edit.graph
+
+    def resolve_overlay(self, spec):
+        """
+        Turns an overlay spec into {(u, v, mode): factor} over the per-mode edges, so a
+        "modes" filter only slows or closes those modes and parallel edges of other
+        modes stay usable.
+        spec keys: "edges" [{"from", "to"}], "stops" [ids] (every edge touching them),
+        "zone" {"lat", "lng", "radius_m"} (edges with both ends inside), optional
+        "modes" filter, and either "factor" (travel time multiplier >= 1) or "closed".
+        """
+        if spec.get('closed'):
+            factor = np.inf
+        else:
+            factor = float(spec.get('factor', 1.0))
+            # Only slow-downs keep the A* and landmark lower bounds admissible
+            if factor < 1.0:
+                raise ValueError("Overlay factors must be >= 1 (remove the entry to restore speed)")
+                
+        selected = []
+        for edge in spec.get('edges') or []:
+            if edge['from'] not in self.nodes or edge['to'] not in self.nodes:
+                raise ValueError(f"Unknown stop in edge {edge['from']} -> {edge['to']}")
+            selected.extend(e for e in self._edges_touching([edge['from']]) if e[0] == edge['from'] and e[1] == edge['to'])
+        for stop in spec.get('stops') or []:
+            if stop not in self.nodes:
+                raise ValueError(f"Unknown stop: {stop}")
+        if spec.get('stops'):
+            selected.extend(self._edges_touching(spec['stops']))
+        zone = spec.get('zone')
+        if zone:
+            lat, lng, radius_m = zone['lat'], zone['lng'], zone['radius_m']
+            # A little slack covers the projection error before the exact check
+            center = project_local([lat], [lng], self.metric_lat0)[0]
+            candidates = self.metric_tree.query_ball_point(center, r=radius_m * 1.01)
+            coords = np.asarray(self.coords, dtype=np.float64)
+            inside = [
+                self.node_ids[i] for i in candidates
+                if haversine_m(lat, lng, coords[i][0], coords[i][1]) <= radius_m
+            ]
+            if inside:
+                selected.extend(self._edges_touching(inside, both_ends=True))
                 
-            dynamic_time = length / max(speed_m_s, 1.0)
+        modes = spec.get('modes')
+        return {(u, v, mode): factor for u, v, mode in selected if not modes or mode in modes}
+
+    def set_overlay(self, entry_id, spec):
+        """Adds or replaces a live overlay entry; returns the number of edges it covers."""
+        edges = self.resolve_overlay(spec)
+        previous = self.overlay_edges.get(entry_id, {})
+        self.overlay_specs[entry_id] = spec
+        self.overlay_edges[entry_id] = edges
+        self._merge_overlay(set(previous) | set(edges))
+        return len(edges)
+
+    def clear_overlay(self, entry_id):
+        previous = self.overlay_edges.pop(entry_id, None)
+        self.overlay_specs.pop(entry_id, None)
+        if previous:
+            self._merge_overlay(set(previous))
+        return previous is not None
+
+    def _merge_overlay(self, changed):
+        """
+        Recomputes merged factors for the changed (u, v, mode) edges only, collapses
+        their pairs again in copies of the weighted graphs, swaps those in and
+        invalidates the cached routes they can affect.
+        """
+        updates = {}
+        got_faster = False
+        for edge in changed:
+            factor = max((edges[edge] for edges in self.overlay_edges.values() if edge in edges), default=1.0)
+            if factor == self.edge_factors.get(edge, 1.0):
+                continue
+            got_faster = got_faster or factor < self.edge_factors.get(edge, 1.0)
+            updates[edge] = factor
+            if factor == 1.0:
+                self.edge_factors.pop(edge, None)
+            else:
+                self.edge_factors[edge] = factor
+                
+        if not updates:
+            return
+        pairs = {(u, v) for u, v, _ in updates}
+        edges = self._pair_edges(pairs)
+        self.weighted_graphs = {
+            band: self._with_factors(G_simple, band, pairs, edges)
+            for band, G_simple in self.weighted_graphs.items()
+        }
             
-            if G_simple.has_edge(u, v):
-                if dynamic_time < G_simple[u][v]['dynamic_time']:
-                    # Overwrite with faster edge
-                    G_simple.add_edge(u, v, **d)
-                    G_simple[u][v]['dynamic_time'] = dynamic_time
+        if got_faster:
+            # A cheaper edge can create a better route anywhere
+            self.route_cache.clear()
+        else:
+            # Slower edges only change routes that used them
+            self.route_cache.invalidate_where(lambda key, paths: any(
+                (leg['from_node']['id'], leg['to_node']['id']) in pairs
+                for path in paths for leg in path['legs']
+            ))
+
+    def k_shortest_paths(self, source_lat, source_lon, dest_lat, dest_lon, k=5, departure_hour=10, departure_day=0, stats=None):
+        """
+        Uses Yen's algorithm (NetworkX's `shortest_simple_paths`, or CSRGraph's own
+        implementation on the csr backend) to find top k routes minimizing dynamic
+        time-based weights instead of mere distance.
+        stats: optional dict filled with search counters ("searches", "nodes_settled",
+        "edges_scanned") on the csr backend; defaults to the current trace's (app.metrics).
+        Results are cached on the snapped nodes, so nearby clicks share entries. Callers
+        must not mutate the returned paths.
+        """
+        return list(self.iter_shortest_paths(
+            source_lat, source_lon, dest_lat, dest_lon,
+            k=k, departure_hour=departure_hour, departure_day=departure_day, stats=stats
+        ))
+
+    def iter_shortest_paths(self, source_lat, source_lon, dest_lat, dest_lon, k=5, departure_hour=10, departure_day=0, stats=None):
+        """
+        Generator form of k_shortest_paths: yields each formatted path as soon as the
+        alternatives method produces it. Only fully consumed searches are cached.
+        """
+        if self.nodes is None:
+            raise ValueError("Engine not loaded")
+            
+        if stats is None:
+            stats = current_stats()
+        with span("snap"):
+            idx, dist = self.snap_candidates([(source_lat, source_lon), (dest_lat, dest_lon)])
+        if idx[0, 0] < 0 or idx[1, 0] < 0:
+            return
+        band = get_time_band(departure_hour)
+        with span("graph_prep"):
+            G_simple = self.get_weighted_graph(band)
+        
+        # Search from every candidate stop at once through virtual endpoint nodes,
+        # each candidate costing its walk from the point
+        walk_speed = mode_speed('walk', band)
+        sources, targets = (
+            {i: (d / walk_speed, d) for i, d in zip(idx[row].tolist(), dist[row].tolist()) if i >= 0}
+            for row in (0, 1)
+        )
+        endpoints = (
+            {"id": VIRTUAL_SOURCE, "name": "Origin", "lat": source_lat, "lon": source_lon},
+            {"id": VIRTUAL_TARGET, "name": "Destination", "lat": dest_lat, "lon": dest_lon},
+            {self.node_ids[i]: m for i, (_, m) in sources.items()},
+            {self.node_ids[i]: m for i, (_, m) in targets.items()},
+        )
+        # Cached paths are stop to stop; the walks from and to this request's points
+        # are attached per request
+        cache_key = tuple(
+            tuple((self.node_ids[i], int(cost[0] // SNAP_CACHE_STEP_S)) for i, cost in sorted(c.items()))
+            for c in (sources, targets)
+        ) + (band, k)
+            
+        cached = self.route_cache.get(cache_key)
+        if cached is not None:
+            if stats is not None:
+                stats["cache_hits"] = stats.get("cache_hits", 0) + 1
+            for core in cached:
+                yield self._with_walks(core, *endpoints)
+            return
+            
+        with span("graph_prep"):
+            if self.backend == "csr":
+                G_search = G_simple.with_endpoints((source_lat, source_lon), (dest_lat, dest_lon), sources, targets)
             else:
-                G_simple.add_edge(u, v, **d)
-                G_simple[u][v]['dynamic_time'] = dynamic_time
+                G_search = self._nx_with_endpoints(
+                    G_simple,
+                    {self.node_ids[i]: cost for i, cost in sources.items()},
+                    {self.node_ids[i]: cost for i, cost in targets.items()}
+                )
+        source_id, dest_id = VIRTUAL_SOURCE, VIRTUAL_TARGET
+        cores = []
 
+        # We use the dynamically calculated attribute as the weight on the Simple DiGraph
+        if self.alternatives == "via":
+            paths_gen = self._via_alternatives(G_search, source_id, dest_id, k, stats)
+        elif self.backend == "csr":
+            paths_gen = G_search.k_shortest_paths(source_id, dest_id, k, search=self.search_mode, stats=stats)
+        else:
+            paths_gen = self._nx_simple_paths(G_search, source_id, dest_id)
+        
+        # Each path's search time is the wait for the generator, not counting the consumer
+        start = time.perf_counter()
+        for path in islice(paths_gen, k):
+            record("path", time.perf_counter() - start)
+            with span("format"):
+                core = self._format_path(path[1:-1], G_simple)
+                formatted = self._with_walks(core, *endpoints)
+            cores.append(core)
+            yield formatted
+            start = time.perf_counter()
+            
+        self.route_cache.put(cache_key, cores)
+        
+    def _nx_with_endpoints(self, G_simple, sources, targets):
+        """
+        networkx counterpart of CSRGraph.with_endpoints: the band graph plus virtual
+        origin/destination nodes with walk edges to and from the candidate stops.
+        Built copy-on-write, so only the candidates' rows are copied.
+        sources, targets: {stop id: (walk s, walk m)}
+        """
+        editor = GraphEditor(G_simple)
+        editor.set_node(VIRTUAL_SOURCE, {})
+        editor.set_node(VIRTUAL_TARGET, {})
+        walk = lambda s, m: {"mode": "walk", "length_m": m, "zone": DEFAULT_ZONE, "dynamic_time": s, "base_time": s}
+        for n, (s, m) in sources.items():
+            editor.set_edge(VIRTUAL_SOURCE, n, walk(s, m))
+        for n, (s, m) in targets.items():
+            editor.set_edge(n, VIRTUAL_TARGET, walk(s, m))
+        return editor.graph
+        
+    def _with_walks(self, core, origin, destination, access_m, egress_m):
+        """
+        A stop-to-stop path from _format_path with walk legs from `origin` to its
+        first stop and from its last stop to `destination` added. Walks under
+        ACCESS_MIN_M (the point is on the stop) get no leg.
+        access_m, egress_m: {candidate stop id: walk metres} for this request
+        """
+        first, last = core["stops"]
+        legs = list(core["legs"])
+        if access_m[first] >= ACCESS_MIN_M:
+            legs.insert(0, {"from_node": origin, "to_node": self.nodes[first], "mode": "walk",
+                            "length_m": access_m[first], "zone": DEFAULT_ZONE})
+        if egress_m[last] >= ACCESS_MIN_M:
+            legs.append({"from_node": self.nodes[last], "to_node": destination, "mode": "walk",
+                         "length_m": egress_m[last], "zone": DEFAULT_ZONE})
+        return {
+            "legs": legs,
+            "total_distance_m": core["total_distance_m"] + access_m[first] + egress_m[last],
+            "transfers": self._count_transfers(legs)
+        }
+        
+    @staticmethod
+    def _nx_simple_paths(G_simple, source_id, dest_id):
+        """NetworkX's Yen's algorithm, ending quietly when no path exists."""
+        import networkx as nx
         try:
-            # We use the dynamically calculated attribute as the weight on the Simple DiGraph
-            paths_gen = nx.shortest_simple_paths(G_simple, source=source_id, target=dest_id, weight='dynamic_time')
+            yield from nx.shortest_simple_paths(G_simple, source=source_id, target=dest_id, weight=open_edge_time)
+        except nx.NetworkXNoPath:
+            return
             
-            top_k_paths = []
-            for path in islice(paths_gen, k):
-                top_k_paths.append(self._format_path(path, G_simple))
-            return top_k_paths
+    def _via_alternatives(self, G_simple, source_id, dest_id, k, stats=None):
+        """Via-node alternatives (see alternatives.via_node_paths) on either backend."""
+        if self.backend == "csr":
+            yield from G_simple.alternative_paths(source_id, dest_id, k, ALT_MAX_STRETCH, stats)
+            return
             
-        except nx.NetworkXNoPath:
-            return []
+        import networkx as nx
+        pred_s, dist_s = nx.dijkstra_predecessor_and_distance(G_simple, source_id, weight=open_edge_time)
+        if dest_id not in dist_s:
+            return
+        pred_t, dist_t = nx.dijkstra_predecessor_and_distance(G_simple.reverse(copy=False), dest_id, weight=open_edge_time)
+        if stats is not None:
+            stats["searches"] = stats.get("searches", 0) + 2
+            stats["nodes_settled"] = stats.get("nodes_settled", 0) + len(dist_s) + len(dist_t)
+            stats["edges_scanned"] = stats.get("edges_scanned", 0) + sum(d for _, d in G_simple.out_degree(dist_s)) + sum(d for _, d in G_simple.in_degree(dist_t))
+            
+        limit = dist_s[dest_id] * (1 + ALT_MAX_STRETCH)
+        totals = sorted((dist_s[v] + dist_t[v], v) for v in dist_s if v in dist_t)
+        candidates = [v for total, v in totals if total <= limit]
+        
+        def route_via(v):
+            head = [v]
+            while head[-1] != source_id:
+                head.append(pred_s[head[-1]][0])
+            head.reverse()
+            tail = [v]
+            while tail[-1] != dest_id:
+                tail.append(pred_t[tail[-1]][0])
+            costs = [dist_s[b] - dist_s[a] for a, b in zip(head, head[1:])]
+            costs += [dist_t[a] - dist_t[b] for a, b in zip(tail, tail[1:])]
+            return head + tail[1:], costs
             
+        yield from via_node_paths(candidates, route_via, k)
+            
+    def batch_shortest_paths(self, pairs, departure_hour=10, include_paths=False):
+        """
+        Fastest path for many origin-destination pairs at once.
+        pairs: sequence of (source_lat, source_lon, dest_lat, dest_lon)
+        Returns one compact result per pair (see solve_batch), or None when a point
+        can't be snapped or no path exists.
+        """
+        if self.nodes is None:
+            raise ValueError("Engine not loaded")
+            
+        band = get_time_band(departure_hour)
+        snapped = self.batch_queries(pairs, [band] * len(pairs))
+        queries = [(i, *query) for i, query in enumerate(snapped) if query is not None]
+        results = [None] * len(snapped)
+        for i, result in self.solve_batch(queries, band, include_paths):
+            results[i] = result
+        return results
+
+    def batch_queries(self, pairs, bands):
+        """
+        Snaps (source_lat, source_lon, dest_lat, dest_lon) pairs for solve_batch, each
+        end to every candidate stop in range like route search. Returns one
+        (sources, targets, direct) per pair: {stop id: (walk s, walk m)} for both
+        ends, and the straight walk (s, m) between the points when it is within
+        SNAP_RADIUS_M, else None. Pairs with nothing to route on get None.
+        """
+        pairs = np.asarray(pairs, dtype=np.float64).reshape(-1, 4)
+        s_idx, s_dist = self.snap_candidates(pairs[:, :2])
+        d_idx, d_dist = self.snap_candidates(pairs[:, 2:])
+        direct_m = haversine_m(pairs[:, 0], pairs[:, 1], pairs[:, 2], pairs[:, 3])
+        ids = self.node_ids
+        snapped = []
+        for band, si, sd, di, dd, walk_m in zip(bands, s_idx.tolist(), s_dist.tolist(), d_idx.tolist(),
+                                                d_dist.tolist(), direct_m.tolist()):
+            speed = mode_speed('walk', band)
+            sources = {ids[i]: (m / speed, m) for i, m in zip(si, sd) if i >= 0}
+            targets = {ids[i]: (m / speed, m) for i, m in zip(di, dd) if i >= 0}
+            direct = (walk_m / speed, walk_m) if walk_m <= SNAP_RADIUS_M else None
+            snapped.append((sources, targets, direct) if (sources and targets) or direct else None)
+        return snapped
+
+    def solve_batch(self, queries, band, include_paths=False):
+        """
+        queries: (key, sources, targets, direct) from batch_queries
+        Each candidate stop's shortest-path tree is built once and serves every query
+        starting there. A result is the best candidate pair with both walks added, or
+        the direct walk when that is faster, so time_s and distance_m compare with
+        /routes/search and /routes/matrix. Returns (key, result) pairs where result
+        is None or {"time_s", "distance_m", "transfers"} plus "nodes" (the stops
+        travelled through; empty for a direct walk) when include_paths is set.
+        """
+        G_simple = self.get_weighted_graph(band)
+        results = []
+        if self.backend == "csr":
+            # Queries sharing candidate stops go in the same chunk of trees
+            chunks, chunk, stops = [], [], set()
+            for query in sorted(queries, key=lambda q: sorted(q[1])):
+                if chunk and len(stops | set(query[1])) > BATCH_TREE_CHUNK:
+                    chunks.append((chunk, stops))
+                    chunk, stops = [], set()
+                chunk.append(query)
+                stops |= set(query[1])
+            if chunk:
+                chunks.append((chunk, stops))
+
+            index = G_simple.node_index
+            for chunk, stops in chunks:
+                order = sorted(stops)
+                row = {n: r for r, n in enumerate(order)}
+                if order:
+                    dist, pred = G_simple.shortest_path_trees([index[n] for n in order])
+                for key, sources, targets, direct in chunk:
+                    best = None
+                    for s, (s_time, s_m) in sources.items():
+                        for t, (t_time, t_m) in targets.items():
+                            total = dist[row[s], index[t]] + s_time + t_time
+                            if np.isfinite(total) and (best is None or total < best[0]):
+                                best = (total, s, t, s_m + t_m)
+                    path_of = lambda s, t: [G_simple.node_ids[i] for i in G_simple.path_from_tree(pred[row[s]], index[s], index[t])]
+                    results.append((key, self._batch_result(G_simple, best, direct, path_of, include_paths)))
+        else:
+            import networkx as nx
+            by_source = defaultdict(list)
+            for query in queries:
+                by_source[tuple(sorted(query[1].items()))].append(query)
+            for seeds, group in by_source.items():
+                dist, paths = {}, {}
+                if seeds:
+                    # One search from a virtual node with a walk edge to each candidate stop
+                    G_search = self._nx_with_endpoints(G_simple, dict(seeds), {})
+                    dist, paths = nx.single_source_dijkstra(G_search, VIRTUAL_SOURCE, weight=open_edge_time)
+                for key, sources, targets, direct in group:
+                    best = None
+                    for t, (t_time, t_m) in targets.items():
+                        if t in dist and (best is None or dist[t] + t_time < best[0]):
+                            s = paths[t][1]
+                            best = (dist[t] + t_time, s, t, sources[s][1] + t_m)
+                    path_of = lambda s, t: paths[t][1:]
+                    results.append((key, self._batch_result(G_simple, best, direct, path_of, include_paths)))
+        return results
+
+    def _batch_result(self, G_simple, best, direct, path_of, include_paths):
+        """
+        solve_batch result from the best (time s, source stop, target stop, walk m)
+        through the network and the direct walk (s, m); path_of(source, target) gives
+        the stop path.
+        """
+        if best is not None and (direct is None or best[0] <= direct[0]):
+            time_s, s, t, walk_m = best
+            return self._summarize_path(path_of(s, t), G_simple, time_s, include_paths, walk_m)
+        if direct is None:
+            return None
+        summary = {"time_s": round(direct[0], 1), "distance_m": round(direct[1], 1), "transfers": 0}
+        if include_paths:
+            summary["nodes"] = []
+        return summary
+
+    def _summarize_path(self, node_list, G_simple, time_s, include_paths, walk_m=0.0):
+        """
+        Compact path summary for batch results; skips node attribute lookups.
+        walk_m: access and egress walks, added to the distance.
+        """
+        legs = []
+        for n1, n2 in zip(node_list, node_list[1:]):
+            edge = G_simple.get_edge_data(n1, n2)
+            legs.append({"mode": edge.get("mode", "walk"), "length_m": edge.get("length_m", 0.0)})
+        summary = {
+            "time_s": round(float(time_s), 1),
+            "distance_m": round(walk_m + sum(leg['length_m'] for leg in legs), 1),
+            "transfers": self._count_transfers(legs)
+        }
+        if include_paths:
+            summary["nodes"] = node_list
+        return summary
+
     def _format_path(self, node_list, G_simple):
-        """Converts raw node list into a structure suitable for the ML layer."""
+        """
+        Converts raw node list into a structure suitable for the ML layer.
+        "stops" holds the first and last stop, where _with_walks attaches the
+        request's own walks.
+        """
         legs = []
         path_distance = 0.0
         
@@ -100,16 +1063,18 @@ class RouteEngine:
             best_edge = G_simple.get_edge_data(n1, n2)
             
             leg = {
-                "from_node": self.G.nodes[n1],
-                "to_node": self.G.nodes[n2],
+                "from_node": self.nodes[n1],
+                "to_node": self.nodes[n2],
                 "mode": best_edge.get("mode", "walk"),
-                "length_m": best_edge.get("length_m", 0.0)
+                "length_m": best_edge.get("length_m", 0.0),
+                "zone": best_edge.get("zone", DEFAULT_ZONE)
             }
             path_distance += leg['length_m']
             legs.append(leg)
             
         return {
             "legs": legs,
+            "stops": (node_list[0], node_list[-1]),
             "total_distance_m": path_distance,
             "transfers": self._count_transfers(legs)
         }
@@ -129,5 +1094,21 @@ class RouteEngine:
             current_mode = leg['mode']
         return transfers
 
+class EngineHandle:
+    """
+    Stable reference to the live RouteEngine. Attribute access is forwarded to the
+    current engine, so a method call runs start to finish on one network even if
+    swap() installs a new one meanwhile.
+    """
+    def __init__(self, current):
+        self.current = current
+        
+    def __getattr__(self, name):
+        return getattr(self.current, name)
+        
+    def swap(self, new_engine):
+        old, self.current = self.current, new_engine
+        return old
+
 # Singleton instances
-engine = RouteEngine()
+engine = EngineHandle(RouteEngine())
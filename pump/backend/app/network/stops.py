@@ -0,0 +1,127 @@
+import json
+import os
+import numpy as np
+from pathlib import Path
+
+# Grid cell size of the stop index, in degrees (~1.1 km)
+STOP_CELL_DEG = 0.01
+# Bus stops closer than this many screen pixels are drawn as one cluster
+CLUSTER_PX = 64
+# From this zoom level on, every stop is returned individually
+CLUSTER_MAX_ZOOM = 15
+# Zoom assumed for map requests that don't send one: a city-wide overview, so a bare
+# request stays small. Set PUMP_STOPS_DEFAULT_ZOOM empty for every stop unclustered.
+_default_zoom = os.getenv("PUMP_STOPS_DEFAULT_ZOOM", "11")
+DEFAULT_ZOOM = int(_default_zoom) if _default_zoom else None
+# Stop types that get clustered; metro stations are always drawn
+CLUSTER_TYPES = ("bus_stop",)
+STOP_FILES = ("metro_stations.json", "bus_stops.json")
+
+def cell_deg_at_zoom(zoom, px=CLUSTER_PX):
+    """Width in degrees of `px` screen pixels at a web map zoom level (256 px tiles)."""
+    return px * 360.0 / (256 * 2 ** zoom)
+
+class StopIndex:
+    """
+    Every stop held in memory, bucketed into a uniform lat/lon grid. Stops are sorted
+    by cell key (column-major), so a bounding box is one binary search per grid
+    column plus an exact filter of the few boundary cells.
+    """
+    def __init__(self, cell_deg=STOP_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.stops = []
+        self.lat = np.empty(0)
+        self.lon = np.empty(0)
+        self.clusterable = np.empty(0, dtype=bool)
+        self.keys = np.empty(0, dtype=np.int64)
+
+    @staticmethod
+    def _cell_key(x, y):
+        return x * 1_000_003 + y
+
+    def load(self, data_dir):
+        stops = []
+        for name in STOP_FILES:
+            path = Path(data_dir) / name
+            if path.exists():
+                with open(path) as f:
+                    stops.extend(json.load(f))
+        self.build(stops)
+        print(f"Stop index loaded: {len(self.stops)} stops.")
+
+    def build(self, stops):
+        lat = np.array([s['lat'] for s in stops], dtype=np.float64)
+        lon = np.array([s['lon'] for s in stops], dtype=np.float64)
+        keys = self._cell_key(np.floor(lon / self.cell_deg).astype(np.int64),
+                              np.floor(lat / self.cell_deg).astype(np.int64))
+        order = np.argsort(keys, kind='stable')
+        self.stops = [stops[i] for i in order.tolist()]
+        self.lat, self.lon, self.keys = lat[order], lon[order], keys[order]
+        self.clusterable = np.array([s.get('type') in CLUSTER_TYPES for s in self.stops], dtype=bool)
+
+    def bounds(self):
+        if not self.stops:
+            return (0.0, 0.0, 0.0, 0.0)
+        return (float(self.lat.min()), float(self.lon.min()), float(self.lat.max()), float(self.lon.max()))
+
+    def snap_bbox(self, bbox, zoom=None):
+        """
+        Grows (min_lat, min_lon, max_lat, max_lon) outwards to the clustering grid of
+        the zoom level, so small pans give the same box (and the same cached response)
+        and clusters never straddle its edge. A missing bbox means every stop.
+        """
+        if bbox is None:
+            bbox = self.bounds()
+        cell = cell_deg_at_zoom(zoom) if zoom is not None else self.cell_deg
+        min_lat, min_lon, max_lat, max_lon = bbox
+        return tuple(round(float(v), 6) for v in (
+            np.floor(min_lat / cell) * cell, np.floor(min_lon / cell) * cell,
+            np.ceil(max_lat / cell) * cell, np.ceil(max_lon / cell) * cell
+        ))
+
+    def within(self, bbox):
+        """Indexes of the stops inside (min_lat, min_lon, max_lat, max_lon)."""
+        min_lat, min_lon, max_lat, max_lon = bbox
+        if not self.stops or min_lat > max_lat or min_lon > max_lon:
+            return np.empty(0, dtype=np.int64)
+        x0, x1 = int(np.floor(min_lon / self.cell_deg)), int(np.floor(max_lon / self.cell_deg))
+        y0, y1 = int(np.floor(min_lat / self.cell_deg)), int(np.floor(max_lat / self.cell_deg))
+        columns = np.arange(x0, x1 + 1, dtype=np.int64)
+        starts = np.searchsorted(self.keys, self._cell_key(columns, y0), side='left')
+        ends = np.searchsorted(self.keys, self._cell_key(columns, y1), side='right')
+        idx = np.concatenate([np.arange(s, e) for s, e in zip(starts.tolist(), ends.tolist())] or [np.empty(0, dtype=np.int64)])
+        lat, lon = self.lat[idx], self.lon[idx]
+        return idx[(lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)]
+
+    def query(self, bbox=None, zoom=None):
+        """
+        Stops in the (snapped) viewport: {"bbox", "zoom", "stops", "clusters"}. Below
+        CLUSTER_MAX_ZOOM, bus stops sharing a CLUSTER_PX sized cell are replaced by one
+        {"lat", "lon", "count"} cluster at their centroid; lone stops stay stops.
+        Without a zoom level nothing is clustered.
+        """
+        bbox = self.snap_bbox(bbox, zoom)
+        idx = self.within(bbox)
+        clusters = []
+        if zoom is not None and zoom < CLUSTER_MAX_ZOOM and len(idx):
+            cell = cell_deg_at_zoom(zoom)
+            grouped = idx[self.clusterable[idx]]
+            cells = self._cell_key(np.floor(self.lon[grouped] / cell).astype(np.int64),
+                                   np.floor(self.lat[grouped] / cell).astype(np.int64))
+            _, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+            lat = np.bincount(inverse, weights=self.lat[grouped]) / counts
+            lon = np.bincount(inverse, weights=self.lon[grouped]) / counts
+            many = counts > 1
+            clusters = [{"lat": round(a, 6), "lon": round(o, 6), "count": c}
+                        for a, o, c in zip(lat[many].tolist(), lon[many].tolist(), counts[many].tolist())]
+            idx = np.concatenate([idx[~self.clusterable[idx]], grouped[~many[inverse]]])
+            idx.sort()
+        return {
+            "bbox": list(bbox),
+            "zoom": zoom,
+            "stops": [self.stops[i] for i in idx.tolist()],
+            "clusters": clusters
+        }
+
+# Singleton instance
+stop_index = StopIndex()
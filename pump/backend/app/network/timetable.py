@@ -0,0 +1,419 @@
+import csv
+import os
+from bisect import bisect_left
+from collections import defaultdict
+from pathlib import Path
+import numpy as np
+from scipy.spatial import KDTree
+
+from app.metrics import span
+from app.network.geo import haversine_m
+
+# GTFS-style feed directory (stops.txt, trips.txt, stop_times.txt, optional routes.txt and transfers.txt)
+GTFS_DIR = Path(os.getenv("PUMP_GTFS_DIR", "/home/jayant/gitgud/marg/marg/pump/data/gtfs"))
+
+# "raptor" returns a Pareto set of (arrival, transfers) journeys, "csa" the single earliest arrival
+TIMETABLE_ALGORITHMS = ("raptor", "csa")
+MAX_ROUNDS = 5 # Trips per journey, i.e. up to 4 transfers
+WALK_SPEED_M_S = 1.4
+ACCESS_MAX_M = 1000 # Walk from the origin / to the destination
+TRANSFER_MAX_M = 400 # Footpaths between stops, same radius as the proximity graph
+MIN_TRANSFER_S = 60 # Time to board a vehicle after arriving at a stop
+INF = float('inf')
+
+# GTFS route_type -> our mode names
+ROUTE_TYPE_MODES = {0: "metro", 1: "metro", 2: "metro", 3: "bus"}
+
+def parse_gtfs_time(value):
+    """HH:MM:SS to seconds after midnight; hours may run past 24 for overnight trips."""
+    h, m, s = value.strip().split(':')
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+def format_gtfs_time(seconds):
+    seconds = int(round(seconds))
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def read_gtfs_table(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return list(csv.DictReader(f))
+
+class Timetable:
+    """
+    Scheduled transit network in the array layout used by RAPTOR and CSA.
+    Trips with the same stop sequence are grouped into a pattern ("route" in RAPTOR
+    terms) whose times are a (trips x stops) matrix sorted by first departure.
+    Every trip is assumed to run every day; calendar.txt is not read.
+    """
+    def __init__(self, gtfs_dir=GTFS_DIR):
+        self.gtfs_dir = Path(gtfs_dir)
+        self.stop_ids = None
+
+    @property
+    def loaded(self):
+        return self.stop_ids is not None
+
+    @property
+    def available(self):
+        """Whether there is a feed to load; with search workers only they load it."""
+        return (self.gtfs_dir / "stop_times.txt").exists()
+
+    def load(self):
+        if not self.available:
+            print(f"No GTFS feed in {self.gtfs_dir}; timetable routing disabled.")
+            return
+        print("Loading GTFS timetable...")
+        stops = read_gtfs_table(self.gtfs_dir / "stops.txt")
+        # `loaded` keys on stop_ids, so it is only set once everything else is built
+        stop_ids = [s['stop_id'] for s in stops]
+        self.stop_index = {s: i for i, s in enumerate(stop_ids)}
+        self.stop_names = [s.get('stop_name', s['stop_id']) for s in stops]
+        self.lat = np.array([float(s['stop_lat']) for s in stops])
+        self.lon = np.array([float(s['stop_lon']) for s in stops])
+        self.tree = KDTree(np.column_stack([self.lat, self.lon]))
+
+        route_modes, route_names = {}, {}
+        if (self.gtfs_dir / "routes.txt").exists():
+            for r in read_gtfs_table(self.gtfs_dir / "routes.txt"):
+                route_modes[r['route_id']] = ROUTE_TYPE_MODES.get(int(r.get('route_type') or 3), "bus")
+                route_names[r['route_id']] = r.get('route_short_name') or r.get('route_long_name') or r['route_id']
+        trip_routes = {t['trip_id']: t['route_id'] for t in read_gtfs_table(self.gtfs_dir / "trips.txt")}
+
+        # stop_times rows grouped per trip in stop_sequence order
+        trip_rows = defaultdict(list)
+        for row in read_gtfs_table(self.gtfs_dir / "stop_times.txt"):
+            trip_rows[row['trip_id']].append((
+                int(row['stop_sequence']), self.stop_index[row['stop_id']],
+                parse_gtfs_time(row['arrival_time'] or row['departure_time']),
+                parse_gtfs_time(row['departure_time'] or row['arrival_time'])
+            ))
+
+        patterns = defaultdict(list)
+        for trip_id, rows in trip_rows.items():
+            rows.sort()
+            route_id = trip_routes.get(trip_id, trip_id)
+            key = (route_id, tuple(r[1] for r in rows))
+            patterns[key].append((rows[0][3], trip_id, [r[2] for r in rows], [r[3] for r in rows]))
+
+        # Patterns: stop sequences, per-pattern (trips x stops) time matrices and trip ids
+        self.pattern_stops = []
+        self.pattern_arr = []
+        self.pattern_dep = []
+        self.pattern_trips = []
+        self.pattern_mode = []
+        self.pattern_name = []
+        stop_patterns = defaultdict(list)
+        for (route_id, stop_seq), trips in patterns.items():
+            trips.sort()
+            p = len(self.pattern_stops)
+            self.pattern_stops.append(list(stop_seq))
+            self.pattern_arr.append(np.array([t[2] for t in trips], dtype=np.int64))
+            self.pattern_dep.append(np.array([t[3] for t in trips], dtype=np.int64))
+            self.pattern_trips.append([t[1] for t in trips])
+            self.pattern_mode.append(route_modes.get(route_id, "bus"))
+            self.pattern_name.append(route_names.get(route_id, route_id))
+            for pos, stop in enumerate(stop_seq):
+                stop_patterns[stop].append((p, pos))
+        self.stop_patterns = [stop_patterns.get(s, []) for s in range(len(stop_ids))]
+        # Departure columns as lists for bisect during route scans
+        self.pattern_dep_cols = [dep.T.tolist() for dep in self.pattern_dep]
+
+        self._build_transfers()
+        self._build_connections()
+        self.stop_ids = stop_ids
+        print(f"Timetable loaded: {len(self.stop_ids)} stops, {len(self.pattern_stops)} patterns, "
+              f"{len(trip_rows)} trips, {len(self.conn_dep_time)} connections.")
+
+    def _build_transfers(self):
+        """Footpaths between stops: transfers.txt if present, else everything within TRANSFER_MAX_M."""
+        self.transfers = [[] for _ in self.stop_names]
+        if (self.gtfs_dir / "transfers.txt").exists():
+            for t in read_gtfs_table(self.gtfs_dir / "transfers.txt"):
+                a, b = self.stop_index.get(t['from_stop_id']), self.stop_index.get(t['to_stop_id'])
+                if a is not None and b is not None and a != b:
+                    self.transfers[a].append((b, float(t.get('min_transfer_time') or 0)))
+            return
+        pairs = self.tree.query_pairs(r=TRANSFER_MAX_M / 100000, output_type='ndarray')
+        if len(pairs) == 0:
+            return
+        dist = haversine_m(self.lat[pairs[:, 0]], self.lon[pairs[:, 0]], self.lat[pairs[:, 1]], self.lon[pairs[:, 1]])
+        for (a, b), d in zip(pairs.tolist(), dist.tolist()):
+            if d <= TRANSFER_MAX_M:
+                self.transfers[a].append((b, d / WALK_SPEED_M_S))
+                self.transfers[b].append((a, d / WALK_SPEED_M_S))
+
+    def _build_connections(self):
+        """Elementary (stop -> next stop) hops of every trip sorted by departure, for CSA."""
+        dep_stop, arr_stop, dep_time, arr_time, trip, pos = [], [], [], [], [], []
+        trip_offset = 0
+        self.conn_trip_pattern = []
+        for p, stops in enumerate(self.pattern_stops):
+            arr, dep = self.pattern_arr[p], self.pattern_dep[p]
+            n_trips, n_stops = dep.shape
+            for t in range(n_trips):
+                self.conn_trip_pattern.append((p, t))
+                for i in range(n_stops - 1):
+                    dep_stop.append(stops[i])
+                    arr_stop.append(stops[i + 1])
+                    dep_time.append(int(dep[t, i]))
+                    arr_time.append(int(arr[t, i + 1]))
+                    trip.append(trip_offset + t)
+                    pos.append(i)
+            trip_offset += n_trips
+        order = np.argsort(np.array(dep_time, dtype=np.int64), kind='stable')
+        self.conn_dep_stop = np.array(dep_stop, dtype=np.int32)[order].tolist()
+        self.conn_arr_stop = np.array(arr_stop, dtype=np.int32)[order].tolist()
+        self.conn_dep_time = np.array(dep_time, dtype=np.int64)[order].tolist()
+        self.conn_arr_time = np.array(arr_time, dtype=np.int64)[order].tolist()
+        self.conn_trip = np.array(trip, dtype=np.int32)[order].tolist()
+        self.conn_pos = np.array(pos, dtype=np.int32)[order].tolist()
+
+    def _nearby_stops(self, lat, lon):
+        """{stop index: walking seconds} for stops within ACCESS_MAX_M of a point."""
+        candidates = self.tree.query_ball_point([lat, lon], r=ACCESS_MAX_M / 100000)
+        if not candidates:
+            return {}
+        dist = haversine_m(lat, lon, self.lat[candidates], self.lon[candidates])
+        return {s: d / WALK_SPEED_M_S for s, d in zip(candidates, dist.tolist()) if d <= ACCESS_MAX_M}
+
+    def plan(self, source_lat, source_lng, dest_lat, dest_lng, departure_s, algorithm="raptor"):
+        """
+        Journeys from a point to a point leaving at departure_s (seconds after midnight).
+        Returns route dicts (legs with real times, transfers, total_time_mins), best first.
+        """
+        if not self.loaded:
+            raise ValueError("No GTFS timetable loaded")
+        if algorithm not in TIMETABLE_ALGORITHMS:
+            raise ValueError(f"Unknown timetable algorithm: {algorithm}")
+        with span("snap"):
+            sources = self._nearby_stops(source_lat, source_lng)
+            targets = self._nearby_stops(dest_lat, dest_lng)
+        if not sources or not targets:
+            return []
+        origin = {"id": "origin", "name": "Origin", "lat": source_lat, "lon": source_lng}
+        destination = {"id": "destination", "name": "Destination", "lat": dest_lat, "lon": dest_lng}
+
+        with span(algorithm):
+            if algorithm == "csa":
+                found = self._csa(sources, targets, departure_s)
+                journeys = [found] if found else []
+            else:
+                journeys = self._raptor(sources, targets, departure_s)
+        with span("format"):
+            return [self._format_journey(j, origin, destination, departure_s) for j in journeys]
+
+    def _raptor(self, sources, targets, departure_s):
+        """
+        Round k finds the earliest arrival at every stop using at most k trips. Only
+        patterns serving a stop improved in the previous round are scanned.
+        Returns Pareto-optimal journeys (fewer trips, or earlier arrival) as
+        (target stop, egress s, [legs from the origin]) tuples.
+        """
+        n = len(self.stop_ids)
+        best = [INF] * n
+        labels = [INF] * n
+        parents = [{}]
+        for s, walk_s in sources.items():
+            labels[s] = best[s] = departure_s + walk_s
+            parents[0][s] = ('access', walk_s)
+        rounds = [labels]
+        marked = set(sources)
+        best_target = INF
+        journeys = []
+
+        for k in range(1, MAX_ROUNDS + 1):
+            prev = rounds[-1]
+            labels = list(prev)
+            parent = {}
+            slack = 0 if k == 1 else MIN_TRANSFER_S
+
+            queue = {}
+            for s in marked:
+                for p, pos in self.stop_patterns[s]:
+                    if pos < queue.get(p, len(self.pattern_stops[p])):
+                        queue[p] = pos
+
+            improved = set()
+            for p, start in queue.items():
+                stops = self.pattern_stops[p]
+                arr = self.pattern_arr[p]
+                dep_cols = self.pattern_dep_cols[p]
+                trip, board = -1, -1
+                for i in range(start, len(stops)):
+                    s = stops[i]
+                    if trip >= 0:
+                        t_arr = int(arr[trip, i])
+                        if t_arr < best[s] and t_arr < best_target:
+                            labels[s] = best[s] = t_arr
+                            parent[s] = ('ride', p, trip, board, i)
+                            improved.add(s)
+                    ready = prev[s] + slack
+                    if ready < INF:
+                        col = dep_cols[i]
+                        t = bisect_left(col, ready)
+                        if t < len(col) and (trip < 0 or t < trip):
+                            trip, board = t, i
+
+            # Footpaths, only from stops reached by riding this round
+            for s in list(improved):
+                for nb, walk_s in self.transfers[s]:
+                    t_arr = labels[s] + walk_s
+                    if t_arr < best[nb] and t_arr < best_target:
+                        labels[nb] = best[nb] = t_arr
+                        parent[nb] = ('walk', s, walk_s)
+                        improved.add(nb)
+
+            parents.append(parent)
+            rounds.append(labels)
+            arrival, target = min(((labels[t] + e, t) for t, e in targets.items()), default=(INF, None))
+            if arrival < best_target:
+                best_target = arrival
+                journeys.append(self._raptor_legs(parents, k, target, targets[target]))
+            marked = improved
+            if not marked:
+                break
+        return journeys
+
+    def _raptor_legs(self, parents, k, stop, egress_s):
+        legs = []
+        while True:
+            entry = parents[k].get(stop)
+            if entry is None:
+                k -= 1
+                continue
+            if entry[0] == 'access':
+                legs.append(('access', stop, entry[1]))
+                break
+            if entry[0] == 'walk':
+                legs.append(('walk', entry[1], stop, entry[2]))
+                stop = entry[1]
+                continue
+            _, p, trip, board, alight = entry
+            legs.append(('ride', p, trip, board, alight))
+            stop = self.pattern_stops[p][board]
+            k -= 1
+        return legs[::-1], egress_s
+
+    def _csa(self, sources, targets, departure_s):
+        """Single pass over connections in departure order; returns the earliest-arrival journey."""
+        n = len(self.stop_ids)
+        arrival = [INF] * n
+        ready = [INF] * n
+        parent = [None] * n
+        for s, walk_s in sources.items():
+            arrival[s] = ready[s] = departure_s + walk_s
+            parent[s] = ('access', walk_s)
+        boarded = {}
+        best_target = INF
+
+        start = bisect_left(self.conn_dep_time, departure_s)
+        for c in range(start, len(self.conn_dep_time)):
+            dep_t = self.conn_dep_time[c]
+            if dep_t >= best_target:
+                break
+            trip = self.conn_trip[c]
+            if trip not in boarded:
+                if ready[self.conn_dep_stop[c]] > dep_t:
+                    continue
+                boarded[trip] = self.conn_pos[c]
+            s, arr_t = self.conn_arr_stop[c], self.conn_arr_time[c]
+            if arr_t >= arrival[s]:
+                continue
+            arrival[s], ready[s] = arr_t, arr_t + MIN_TRANSFER_S
+            p, t = self.conn_trip_pattern[trip]
+            parent[s] = ('ride', p, t, boarded[trip], self.conn_pos[c] + 1)
+            if s in targets:
+                best_target = min(best_target, arr_t + targets[s])
+            for nb, walk_s in self.transfers[s]:
+                if arr_t + walk_s < arrival[nb]:
+                    arrival[nb] = arr_t + walk_s
+                    ready[nb] = arrival[nb] + MIN_TRANSFER_S
+                    parent[nb] = ('walk', s, walk_s)
+                    if nb in targets:
+                        best_target = min(best_target, arrival[nb] + targets[nb])
+
+        total, target = min(((arrival[t] + e, t) for t, e in targets.items()), default=(INF, None))
+        if total == INF:
+            return None
+        legs, stop = [], target
+        while parent[stop][0] != 'access':
+            entry = parent[stop]
+            if entry[0] == 'walk':
+                legs.append(('walk', entry[1], stop, entry[2]))
+                stop = entry[1]
+            else:
+                legs.append(entry)
+                stop = self.pattern_stops[entry[1]][entry[3]]
+        legs.append(('access', stop, parent[stop][1]))
+        return legs[::-1], targets[target]
+
+    def _stop(self, s):
+        return {"id": self.stop_ids[s], "name": self.stop_names[s], "lat": float(self.lat[s]), "lon": float(self.lon[s])}
+
+    def _format_journey(self, journey, origin, destination, departure_s):
+        """Turns raw RAPTOR/CSA legs into the API's route structure."""
+        raw_legs, egress_s = journey
+        legs = []
+        clock = departure_s
+        at = origin
+        for leg in raw_legs:
+            if leg[0] == 'access':
+                legs.append(self._walk_leg(at, self._stop(leg[1]), leg[2], clock))
+            elif leg[0] == 'walk':
+                legs.append(self._walk_leg(at, self._stop(leg[2]), leg[3], clock))
+            else:
+                _, p, trip, board, alight = leg
+                stops = self.pattern_stops[p][board:alight + 1]
+                dep_t = int(self.pattern_dep[p][trip, board])
+                arr_t = int(self.pattern_arr[p][trip, alight])
+                lats, lons = self.lat[stops], self.lon[stops]
+                legs.append({
+                    "from_node": self._stop(stops[0]),
+                    "to_node": self._stop(stops[-1]),
+                    "mode": self.pattern_mode[p],
+                    "route": self.pattern_name[p],
+                    "trip_id": self.pattern_trips[p][trip],
+                    "stops": len(stops) - 1,
+                    "length_m": round(float(haversine_m(lats[:-1], lons[:-1], lats[1:], lons[1:]).sum()), 1),
+                    "departure": format_gtfs_time(dep_t),
+                    "arrival": format_gtfs_time(arr_t),
+                    "wait_sec": dep_t - clock,
+                    "duration_sec": arr_t - dep_t
+                })
+                clock = dep_t
+            clock += legs[-1]['duration_sec']
+            at = legs[-1]['to_node']
+        legs.append(self._walk_leg(at, destination, egress_s, clock))
+        clock += egress_s
+
+        for leg in legs:
+            leg['duration_mins'] = int(np.ceil(leg['duration_sec'] / 60))
+        rides = sum(1 for leg in legs if leg['mode'] != 'walk')
+        return {
+            "legs": legs,
+            "transfers": max(0, rides - 1),
+            "arrival": format_gtfs_time(clock),
+            "total_time_mins": int(np.ceil((clock - departure_s) / 60))
+        }
+
+    def _walk_leg(self, a, b, walk_s, clock):
+        return {
+            "from_node": a,
+            "to_node": b,
+            "mode": "walk",
+            "length_m": round(walk_s * WALK_SPEED_M_S, 1),
+            "departure": format_gtfs_time(clock),
+            "arrival": format_gtfs_time(clock + walk_s),
+            "duration_sec": round(walk_s, 1)
+        }
+
+    def stats(self):
+        if not self.loaded:
+            return {"loaded": False, "available": self.available}
+        return {
+            "loaded": True,
+            "stops": len(self.stop_ids),
+            "patterns": len(self.pattern_stops),
+            "connections": len(self.conn_dep_time)
+        }
+
+timetable = Timetable()
@@ -0,0 +1,117 @@
+import numpy as np
+from scipy.spatial import KDTree
+
+from app.network.csr import MODE_CODES
+from app.network.geo import haversine_m
+from app.network.zones import DEFAULT_ZONE
+
+# Same linking rules as scripts/build_graph.py
+LINK_QUERY_DEG = 0.005
+LINK_MAX_M = 400
+
+def parse_delta(delta, known):
+    """
+    Validates a stop delta against the `known` stop ids.
+    delta: {"add": [stop dicts with id/lat/lon/type], "remove": [stop ids],
+            "move": [{"id", "lat", "lon"}]}
+    Returns (ids to remove, {moved id: (lat, lon)}, added stop dicts).
+    Removed stops lose all their edges. Moved and added stops lose their proximity
+    (bus/walk) edges and are relinked to everything within LINK_MAX_M; metro line
+    edges of moved stations are kept with updated lengths. New metro stations are
+    only linked by walking, as line order isn't part of the delta.
+    """
+    remove = set(delta.get('remove') or [])
+    moves = {m['id']: (float(m['lat']), float(m['lon'])) for m in delta.get('move') or []}
+    adds = [dict(stop) for stop in delta.get('add') or []]
+
+    for node_id in list(remove) + list(moves):
+        if node_id not in known:
+            raise ValueError(f"Unknown stop: {node_id}")
+    if remove & set(moves):
+        raise ValueError("A stop can't be both moved and removed")
+    for stop in adds:
+        if 'id' not in stop or 'lat' not in stop or 'lon' not in stop:
+            raise ValueError("Added stops need id, lat and lon")
+        if stop['id'] in known and stop['id'] not in remove:
+            raise ValueError(f"Stop already exists: {stop['id']}")
+    return remove, moves, adds
+
+def link_nearby(lat, lon, is_bus, subset, zone_index=None):
+    """
+    Proximity edges between the `subset` node indexes and every node within LINK_MAX_M,
+    in both directions: a bus edge between two bus stops plus a walk edge for every pair.
+    is_bus: callable mapping an array of node indexes to a bool array, only asked
+    about the nodes that end up linked.
+    Returns (src, dst, mode, length_m, zone) arrays; zones come from zone_index
+    (DEFAULT_ZONE without it).
+    """
+    empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64),
+             np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.float64), np.empty(0, dtype=np.uint8))
+    if len(subset) == 0:
+        return empty
+
+    coords = np.column_stack([lat, lon])
+    neighbours = KDTree(coords).query_ball_point(coords[subset], r=LINK_QUERY_DEG)
+    a = np.repeat(subset, [len(n) for n in neighbours])
+    b = np.concatenate([np.asarray(n, dtype=np.int64) for n in neighbours])
+
+    # Pairs inside the subset are found from both ends, so dedupe after expanding directions
+    pairs = np.column_stack([np.concatenate([a, b]), np.concatenate([b, a])])
+    pairs = np.unique(pairs[pairs[:, 0] != pairs[:, 1]], axis=0)
+    if len(pairs) == 0:
+        return empty
+    src, dst = pairs[:, 0], pairs[:, 1]
+
+    dist = haversine_m(lat[src], lon[src], lat[dst], lon[dst])
+    close = dist <= LINK_MAX_M
+    src, dst, dist = src[close], dst[close], dist[close]
+
+    linked = np.unique(np.concatenate([src, dst]))
+    bus_node = np.zeros(len(lat), dtype=bool)
+    bus_node[linked] = is_bus(linked)
+    bus = bus_node[src] & bus_node[dst]
+    src = np.concatenate([src[bus], src])
+    dst = np.concatenate([dst[bus], dst])
+    if zone_index is not None:
+        zone = zone_index.edge_zones(lat, lon, src, dst)
+    else:
+        zone = np.full(len(src), DEFAULT_ZONE, dtype=np.uint8)
+    return (
+        src, dst,
+        np.concatenate([np.full(bus.sum(), MODE_CODES['bus'], dtype=np.uint8),
+                        np.full(len(bus), MODE_CODES['walk'], dtype=np.uint8)]),
+        np.concatenate([dist[bus], dist]),
+        zone
+    )
+
+def patch_edges(edges, keep, moved, lat, lon, links, zone_index=None):
+    """
+    Applies a parsed delta to per-mode edge arrays and returns new ones; the inputs
+    are left untouched.
+    edges: (src, dst, mode, length_m, zone) over the old node positions
+    keep, moved: bool masks over the old nodes (survives the delta / was moved)
+    lat, lon: coordinates of the new nodes; surviving ones keep their order and
+    added ones go on the end
+    links: proximity edges of moved and added stops from link_nearby, in new positions
+    Returns (src, dst, mode, length_m, zone) sorted by source.
+    """
+    src, dst, mode, length, zone = edges
+    new_index = np.cumsum(keep) - 1
+
+    # Drop everything on removed stops and proximity edges on moved stops
+    metro = mode == MODE_CODES['metro']
+    stale = moved[src] | moved[dst]
+    edge_keep = keep[src] & keep[dst] & (metro | ~stale)
+    stale = stale[edge_keep]
+    src, dst = new_index[src[edge_keep]], new_index[dst[edge_keep]]
+    mode, length, zone = mode[edge_keep], length[edge_keep].astype(np.float64), zone[edge_keep].copy()
+
+    # Metro edges of moved stations are re-measured
+    length[stale] = haversine_m(lat[src[stale]], lon[src[stale]], lat[dst[stale]], lon[dst[stale]])
+    if zone_index is not None:
+        zone[stale] = zone_index.edge_zones(lat, lon, src[stale], dst[stale])
+
+    src, dst, mode, length, zone = (np.concatenate([a, b]) for a, b in zip((src, dst, mode, length, zone), links))
+    order = np.argsort(src, kind='stable')
+    return (src[order], dst[order], mode[order].astype(np.uint8),
+            length[order].astype(np.float32), zone[order].astype(np.uint8))
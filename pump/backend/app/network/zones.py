@@ -0,0 +1,92 @@
+import json
+import numpy as np
+from pathlib import Path
+
+# Zone for points outside every polygon (the model's lowest congestion level)
+DEFAULT_ZONE = 1
+# Grid cell size of the polygon index, in degrees (~1.1 km)
+ZONE_CELL_DEG = 0.01
+
+def points_in_ring(lat, lon, ring):
+    """Even-odd ray casting of every (lat, lon) point against one closed [lon, lat] ring."""
+    ring = np.asarray(ring, dtype=np.float64)
+    x1, y1 = ring[:, 0], ring[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    inside = np.zeros(len(lat), dtype=bool)
+    for ax, ay, bx, by in zip(x1, y1, x2, y2):
+        if ay == by:
+            continue
+        crosses = (ay > lat) != (by > lat)
+        x_at = ax + (lat - ay) * (bx - ax) / (by - ay)
+        inside ^= crosses & (lon < x_at)
+    return inside
+
+class ZoneIndex:
+    """
+    Congestion zone polygons bucketed into a uniform lat/lon grid. A point is only
+    tested against the polygons whose bounding box overlaps its cell, and the highest
+    zone wins where polygons overlap.
+    """
+    def __init__(self, polygons, zones, cell_deg=ZONE_CELL_DEG):
+        # polygons: lists of GeoJSON rings ([lon, lat] pairs; holes after the outer ring)
+        self.polygons = polygons
+        self.zones = np.asarray(zones, dtype=np.uint8)
+        self.cell_deg = cell_deg
+        self.cells = []
+        for rings in polygons:
+            outer = np.asarray(rings[0], dtype=np.float64)
+            lo = np.floor(outer.min(axis=0) / cell_deg).astype(np.int64)
+            hi = np.floor(outer.max(axis=0) / cell_deg).astype(np.int64)
+            xs, ys = np.meshgrid(np.arange(lo[0], hi[0] + 1), np.arange(lo[1], hi[1] + 1))
+            self.cells.append(self._cell_key(xs.ravel(), ys.ravel()))
+
+    @staticmethod
+    def _cell_key(x, y):
+        return x * 1_000_003 + y
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a GeoJSON FeatureCollection of Polygon/MultiPolygon features with an
+        integer `zone` property. A missing file gives an empty index (every point
+        falls back to DEFAULT_ZONE).
+        """
+        path = Path(path)
+        if not path.exists():
+            return cls([], [])
+        with open(path) as f:
+            features = json.load(f)['features']
+
+        polygons, zones = [], []
+        for feature in features:
+            geometry = feature['geometry']
+            parts = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+            for rings in parts:
+                polygons.append(rings)
+                zones.append(int(feature['properties']['zone']))
+        return cls(polygons, zones)
+
+    def lookup(self, lat, lon):
+        """Congestion zone for every point; lat and lon are equal-length arrays."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        result = np.full(len(lat), DEFAULT_ZONE, dtype=np.uint8)
+        if len(lat) == 0:
+            return result
+
+        keys = self._cell_key(np.floor(lon / self.cell_deg).astype(np.int64),
+                              np.floor(lat / self.cell_deg).astype(np.int64))
+        for rings, zone, cells in zip(self.polygons, self.zones, self.cells):
+            candidates = np.nonzero(np.isin(keys, cells))[0]
+            if len(candidates) == 0:
+                continue
+            inside = np.zeros(len(candidates), dtype=bool)
+            for ring in rings:
+                inside ^= points_in_ring(lat[candidates], lon[candidates], ring)
+            hit = candidates[inside]
+            result[hit] = np.maximum(result[hit], zone)
+        return result
+
+    def edge_zones(self, lat, lon, src, dst):
+        """Zone of each edge, taken at its midpoint."""
+        return self.lookup((lat[src] + lat[dst]) / 2, (lon[src] + lon[dst]) / 2)
@@ -0,0 +1,275 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from app.metrics import span
+from app.network.graph import engine
+from app.network.timetable import timetable
+from app.readiness import load_parallel
+from app.ml.inference import predictor
+from app.scoring.ranker import rank_routes, score_and_rank_routes, score_routes, score_timetable_routes
+
+# 0 runs searches on the event loop's default thread pool instead of worker processes
+SEARCH_WORKERS = int(os.getenv("PUMP_SEARCH_WORKERS", "0"))
+# Searches allowed in flight (running + queued) before new ones are rejected
+SEARCH_QUEUE_LIMIT = int(os.getenv("PUMP_SEARCH_QUEUE_LIMIT", "32"))
+SEARCH_TIMEOUT_S = float(os.getenv("PUMP_SEARCH_TIMEOUT", "10"))
+
+class PoolBusy(Exception):
+    """Raised when the search queue is full."""
+
+# Overlay entries this worker has applied, compared against the snapshot sent with each task
+_worker_overlay = {}
+# Entries in _worker_overlay this worker could not apply, with the error
+_worker_overlay_errors = {}
+# Number of graph deltas from the API process's log this worker has applied
+_worker_deltas = 0
+
+def _init_worker():
+    # Spawned workers start empty and load the graph, model and timetable once for their lifetime
+    loaders = {}
+    if engine.nodes is None:
+        loaders["graph"] = engine.load
+    if predictor.model is None:
+        loaders["model"] = predictor.load
+    if not timetable.loaded:
+        loaders["timetable"] = timetable.load
+    for name, (_, error) in load_parallel(loaders).items():
+        if error:
+            raise RuntimeError(f"Search worker could not load {name}: {error}")
+
+def _sync_overlay(specs):
+    """Applies only the overlay entries that changed since this worker's last task."""
+    for entry_id in list(_worker_overlay):
+        if entry_id not in specs:
+            engine.clear_overlay(entry_id)
+            del _worker_overlay[entry_id]
+            _worker_overlay_errors.pop(entry_id, None)
+    for entry_id, spec in specs.items():
+        if _worker_overlay.get(entry_id) != spec:
+            try:
+                engine.set_overlay(entry_id, spec)
+                _worker_overlay_errors.pop(entry_id, None)
+            except ValueError as e:
+                # Recorded as applied anyway so the same version isn't retried on every task
+                print(f"Search worker {os.getpid()} could not apply overlay {entry_id}: {e}")
+                _worker_overlay_errors[entry_id] = str(e)
+            _worker_overlay[entry_id] = spec
+
+def _sync_deltas(deltas):
+    """Applies graph deltas from the API process's log that this worker hasn't seen yet."""
+    global _worker_deltas
+    for delta in deltas[_worker_deltas:]:
+        engine.swap(engine.apply_delta(delta))
+        _worker_deltas += 1
+
+def _run_synced(deltas, specs, fn, *args):
+    """
+    Runs a task in a worker; returns (result, worker pid, worker route cache stats,
+    overlay entries the worker failed to apply).
+    """
+    _sync_deltas(deltas)
+    _sync_overlay(specs)
+    result = fn(*args)
+    return result, os.getpid(), engine.route_cache.stats(), dict(_worker_overlay_errors)
+
+def run_search(source_lat, source_lng, dest_lat, dest_lng, hour, day, k=5):
+    """Path generation plus scoring; runs inside a pool worker or thread."""
+    # 1. Path Generation (Top k dynamically shortest based on time of day)
+    k_paths = engine.k_shortest_paths(
+        source_lat, source_lng, dest_lat, dest_lng,
+        k=k, departure_hour=hour, departure_day=day
+    )
+    if not k_paths:
+        return []
+    # 2. Score & Rank (ML Travel time + Penalty heuristics)
+    with span("score"):
+        return score_and_rank_routes(k_paths, departure_hour=hour, departure_day=day)
+
+def run_score(paths, hour, day):
+    """Scores paths found elsewhere (see the streaming endpoint) in their given order."""
+    return score_routes(paths, departure_hour=hour, departure_day=day)
+
+def run_timetable_search(source_lat, source_lng, dest_lat, dest_lng, departure_s, algorithm):
+    """Scheduled journeys from the GTFS timetable (RAPTOR or CSA), scored and ranked."""
+    journeys = timetable.plan(source_lat, source_lng, dest_lat, dest_lng, departure_s, algorithm)
+    with span("score"):
+        return rank_routes(score_timetable_routes(journeys))
+
+def run_batch(queries, band, include_paths=False):
+    """One chunk of a batch request; see RouteEngine.solve_batch."""
+    return engine.solve_batch(queries, band, include_paths)
+
+def run_isochrone(lat, lng, budget_s, hour):
+    return engine.isochrone(lat, lng, budget_s=budget_s, departure_hour=hour)
+
+def run_matrix(origins, destinations, hour, max_time_s=None):
+    return engine.travel_time_matrix(origins, destinations, departure_hour=hour, max_time_s=max_time_s)
+
+class SearchPool:
+    """
+    Dispatches searches to worker processes with a bound on outstanding work.
+    Requests beyond `queue_limit` fail fast with PoolBusy, and callers stop waiting
+    after `timeout` seconds (the worker still finishes and frees its slot).
+    """
+    def __init__(self, workers=SEARCH_WORKERS, queue_limit=SEARCH_QUEUE_LIMIT, timeout=SEARCH_TIMEOUT_S):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self.executor = None
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.deltas = []
+        # One no-op task per worker; each completes once its worker has loaded
+        self.warmup = []
+        # Live overlay entries (see RouteEngine.set_overlay), shipped to workers with each task
+        self.overlay = {}
+        # Latest route cache stats and failed overlay entries reported by each worker, by pid
+        self.worker_caches = {}
+        self.worker_overlay_errors = {}
+        self._lock = threading.Lock()
+
+    def _new_executor(self):
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker
+        )
+        # Processes are spawned on demand; start them now so the first searches don't pay for loading
+        self.warmup = [executor.submit(int) for _ in range(self.workers)]
+        return executor
+
+    def start(self):
+        if self.workers > 0 and self.executor is None:
+            self.executor = self._new_executor()
+
+    def ready(self):
+        """True once every worker has loaded (always, when searches run in-process)."""
+        return all(f.done() and f.exception() is None for f in self.warmup)
+
+    def apply_delta(self, delta):
+        """
+        Records a graph delta. The log is shipped with every task, and each worker
+        applies the entries it hasn't seen before running it (an incremental patch,
+        see RouteEngine.apply_delta), so workers keep serving throughout.
+        """
+        # A new list rather than append(): queued tasks are pickled later and must keep theirs
+        self.deltas = self.deltas + [delta]
+
+    def set_overlay(self, specs):
+        """Records the API process's overlay entries; workers catch up on their next task."""
+        self.overlay = dict(specs)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def _unpack(self, reply):
+        result, pid, cache, overlay_errors = reply
+        with self._lock:
+            self.worker_caches[pid] = cache
+            self.worker_overlay_errors[pid] = overlay_errors
+        return result
+
+    def _release(self, _future):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+
+    async def submit(self, fn, *args):
+        with self._lock:
+            if self.in_flight >= self.queue_limit:
+                self.rejected += 1
+                raise PoolBusy(f"{self.in_flight} searches already in flight")
+            self.in_flight += 1
+
+        loop = asyncio.get_running_loop()
+        pooled = self.executor is not None
+        try:
+            if not pooled:
+                future = loop.run_in_executor(None, fn, *args)
+            else:
+                future = loop.run_in_executor(self.executor, _run_synced, self.deltas, self.overlay, fn, *args)
+        except Exception:
+            with self._lock:
+                self.in_flight -= 1
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            # shield() keeps the executor future alive so its slot is released on completion
+            reply = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            raise
+        return self._unpack(reply) if pooled else reply
+
+    def call(self, fn, *args):
+        """
+        Blocking submit for code that already runs off the event loop, such as a
+        streaming response's generator. Same queue limit as submit(); the timeout
+        only applies with worker processes, since in-process calls run on the
+        caller's own thread.
+        """
+        with self._lock:
+            if self.in_flight >= self.queue_limit:
+                self.rejected += 1
+                raise PoolBusy(f"{self.in_flight} searches already in flight")
+            self.in_flight += 1
+        if self.executor is None:
+            try:
+                return fn(*args)
+            finally:
+                self._release(None)
+        future = self.executor.submit(_run_synced, self.deltas, self.overlay, fn, *args)
+        future.add_done_callback(self._release)
+        try:
+            reply = future.result(self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            raise
+        return self._unpack(reply)
+
+    def stats(self):
+        with self._lock:
+            busy = self.workers if self.workers > 0 else self.in_flight
+            return {
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "in_flight": self.in_flight,
+                "queued": max(0, self.in_flight - busy),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                # Overlay entries some worker couldn't apply: {entry_id: {pid: error}}
+                "overlay_errors": self._overlay_errors()
+            }
+
+    def _overlay_errors(self):
+        errors = {}
+        for pid, entries in self.worker_overlay_errors.items():
+            for entry_id, error in entries.items():
+                if entry_id in self.overlay:
+                    errors.setdefault(entry_id, {})[pid] = error
+        return errors
+
+    def route_cache_stats(self):
+        """
+        Route cache counters summed over the API process (streaming searches run
+        there) and each worker's latest report, with the breakdown by process.
+        """
+        with self._lock:
+            caches = {"api": engine.route_cache.stats()}
+            caches.update((f"worker_{pid}", stats) for pid, stats in self.worker_caches.items())
+        totals = {key: sum(stats[key] for stats in caches.values()) for key in caches["api"]}
+        totals["processes"] = caches
+        return totals
+
+search_pool = SearchPool()
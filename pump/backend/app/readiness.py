@@ -0,0 +1,82 @@
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+def load_parallel(loaders, on_done=None):
+    """
+    Runs {name: load function} on one thread each and waits for all of them.
+    Loading is mostly file reads and NumPy work that releases the GIL, so the
+    components overlap; files within one component (e.g. the graph pickle and the
+    KD-tree, see RouteEngine.load) still load one after the other. Returns
+    {name: (seconds, error message or None)};
+    on_done(name, seconds, error) is called as each one finishes.
+    """
+    def timed(fn):
+        start = time.perf_counter()
+        try:
+            fn()
+            return time.perf_counter() - start, None
+        except Exception as e:
+            traceback.print_exc()
+            return time.perf_counter() - start, f"{type(e).__name__}: {e}"
+
+    with ThreadPoolExecutor(max_workers=max(len(loaders), 1), thread_name_prefix="load") as pool:
+        futures = {pool.submit(timed, fn): name for name, fn in loaders.items()}
+        results = {}
+        for future in as_completed(futures):
+            name = futures[future]
+            results[name] = future.result()
+            if on_done:
+                on_done(name, *results[name])
+        return {name: results[name] for name in loaders}
+
+class Readiness:
+    """
+    Loads the service's components in the background so the API answers
+    /api/v1/health right away, and tracks which components are ready for
+    /api/v1/ready and for endpoints that need them.
+    """
+    def __init__(self):
+        self.components = {}
+        self.checks = {}
+        self.started = None
+        self._lock = threading.Lock()
+
+    def start(self, loaders, checks=None):
+        """
+        loaders: {name: load function}, run in parallel on a background thread.
+        checks: {name: function returning True once ready}, for components that come
+        up on their own (e.g. pool workers).
+        """
+        self.started = time.perf_counter()
+        self.checks = dict(checks or {})
+        with self._lock:
+            for name in loaders:
+                self.components[name] = {"state": "loading"}
+
+        def done(name, seconds, error):
+            with self._lock:
+                self.components[name] = {"state": "failed" if error else "ready", "seconds": round(seconds, 2)}
+                if error:
+                    self.components[name]["error"] = error
+
+        def run():
+            load_parallel(loaders, on_done=done)
+            print(f"Components loaded in {time.perf_counter() - self.started:.1f}s: "
+                  + ", ".join(f"{n} {c['state']}" for n, c in self.stats().items()))
+        threading.Thread(target=run, name="readiness", daemon=True).start()
+
+    def is_ready(self, *names):
+        """True once every named component (all of them when none are named) is ready."""
+        states = self.stats()
+        return all(states.get(name, {}).get("state") == "ready" for name in (names or states))
+
+    def stats(self):
+        with self._lock:
+            states = {name: dict(c) for name, c in self.components.items()}
+        for name, check in self.checks.items():
+            states[name] = {"state": "ready" if check() else "loading"}
+        return states
+
+readiness = Readiness()
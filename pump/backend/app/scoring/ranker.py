@@ -1,5 +1,6 @@
 import math
 from app.ml.inference import predictor
+from app.network.csr import VIRTUAL_SOURCE, VIRTUAL_TARGET
 
 TRANSFER_PENALTY_MINS = 10.0
 MODE_PENALTY = {
@@ -8,29 +9,47 @@ MODE_PENALTY = {
     "walk": 15.0    # Heavy walk penalty to minimize raw walking
 }
 
+def mode_penalty(legs):
+    """
+    Sum of MODE_PENALTY over legs. Walks from the origin and to the destination
+    only count their time: every route has them, and the penalty is meant to
+    discourage walking between stops.
+    """
+    return sum(
+        MODE_PENALTY.get(leg['mode'], 5.0) for leg in legs
+        if leg['from_node'].get('id') != VIRTUAL_SOURCE and leg['to_node'].get('id') != VIRTUAL_TARGET
+    )
+
 def score_and_rank_routes(top_k_paths, departure_hour=10, departure_day=0):
     """
     Takes the raw structurally-viable paths from Yen's Algorithm and scores them.
     Total Cost = TravelTime + (Transfers * TransferPenalty) + ModePenalties
     """
-    ranked_routes = []
+    return rank_routes(score_routes(top_k_paths, departure_hour, departure_day))
+
+def score_routes(top_k_paths, departure_hour=10, departure_day=0):
+    """Scores paths in their given order, without ranking them."""
+    # Legs are copied because the engine may hand the same cached paths to other requests
+    route_legs = [[dict(leg) for leg in path['legs']] for path in top_k_paths]
     
-    for path in top_k_paths:
-        total_time_sec = 0
-        total_mode_penalty = 0
-        
-        for leg in path['legs']:
-            duration_sec = predictor.predict_leg_time(
-                mode_str=leg['mode'],
-                distance_m=leg['length_m'],
-                hour=departure_hour,
-                day_of_week=departure_day
-            )
-            leg['duration_sec'] = duration_sec
-            leg['duration_mins'] = math.ceil(duration_sec / 60)
-            
-            total_time_sec += duration_sec
-            total_mode_penalty += MODE_PENALTY.get(leg['mode'], 5.0)
+    # Predict every leg of every candidate route in a single model call
+    all_legs = [leg for legs in route_legs for leg in legs]
+    durations = predictor.predict_leg_times(
+        [leg['mode'] for leg in all_legs],
+        [leg['length_m'] for leg in all_legs],
+        hour=departure_hour,
+        day_of_week=departure_day,
+        zones=[leg.get('zone', 1) for leg in all_legs]
+    )
+    for leg, duration_sec in zip(all_legs, durations.tolist()):
+        leg['duration_sec'] = duration_sec
+        leg['duration_mins'] = math.ceil(duration_sec / 60)
+    
+    scored_routes = []
+    
+    for path, legs in zip(top_k_paths, route_legs):
+        total_time_sec = sum(leg['duration_sec'] for leg in legs)
+        total_mode_penalty = mode_penalty(legs)
             
         total_time_mins = total_time_sec / 60
         transfers = path['transfers']
@@ -38,13 +57,32 @@ def score_and_rank_routes(top_k_paths, departure_hour=10, departure_day=0):
         # Scoring Formula
         score = total_time_mins + (transfers * TRANSFER_PENALTY_MINS) + total_mode_penalty
         
-        ranked_routes.append({
+        scored_routes.append({
             "score": round(score, 2),
             "total_time_mins": math.ceil(total_time_mins),
             "transfers": transfers,
-            "legs": path['legs']
+            "legs": legs
         })
         
+    return scored_routes
+
+def score_timetable_routes(journeys):
+    """
+    Scores timetable journeys (see Timetable.plan) with the same formula. Their leg
+    durations and transfer counts come from the schedule, so the model isn't used.
+    """
+    scored_routes = []
+    for journey in journeys:
+        total_time_mins = journey['total_time_mins']
+        total_mode_penalty = mode_penalty(journey['legs'])
+        score = total_time_mins + (journey['transfers'] * TRANSFER_PENALTY_MINS) + total_mode_penalty
+        scored_routes.append({**journey, "score": round(score, 2)})
+    return scored_routes
+
+def rank_routes(scored_routes):
+    """Orders scored routes best first and assigns their rank."""
+    ranked_routes = list(scored_routes)
+    
     # Sort ascending by score (lowest is best)
     ranked_routes.sort(key=lambda x: x['score'])
     
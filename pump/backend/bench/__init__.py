@@ -0,0 +1,5 @@
+"""
+Routing benchmarks: fixed OD query sets (queries), per-stage micro-benchmarks
+(micro), a concurrent load test against the API (load) and JSON reports that can
+be compared between runs (report). Run `python -m bench --help` from pump/backend.
+"""
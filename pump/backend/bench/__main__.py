@@ -0,0 +1,73 @@
+import argparse
+import json
+import sys
+
+from bench.queries import SEED, build_query_sets
+from bench.report import REGRESSION_THRESHOLD, print_comparison, run_metadata, write_report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Routing benchmarks (run from pump/backend)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="micro-benchmarks and/or a load test, written to a JSON report")
+    run.add_argument("--out", default="bench_report.json")
+    run.add_argument("--skip-micro", action="store_true")
+    run.add_argument("--skip-load", action="store_true")
+    run.add_argument("--per-set", type=int, default=25, help="queries per distance class and time band")
+    run.add_argument("--seed", type=int, default=SEED)
+    run.add_argument("--k", type=int, default=5, help="routes per search in the micro-benchmarks")
+    run.add_argument("--requests", type=int, default=300)
+    run.add_argument("--concurrency", type=int, default=8)
+    run.add_argument("--compact", action="store_true", help="load test with compact responses")
+    run.add_argument("--url", help="load test a running server instead of starting one")
+
+    queries = sub.add_parser("queries", help="write the OD query sets as JSON")
+    queries.add_argument("--out", default="bench_queries.json")
+    queries.add_argument("--per-set", type=int, default=25)
+    queries.add_argument("--seed", type=int, default=SEED)
+
+    compare = sub.add_parser("compare", help="compare two reports; exits 1 on regressions")
+    compare.add_argument("base")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        return 1 if print_comparison(base, new, args.threshold) else 0
+
+    query_sets = build_query_sets(per_set=args.per_set, seed=args.seed)
+    if args.command == "queries":
+        with open(args.out, 'w') as f:
+            json.dump(query_sets, f, indent=1)
+        print(f"Wrote {sum(len(q) for q in query_sets.values())} queries to {args.out}")
+        return 0
+
+    report = {
+        "meta": run_metadata(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("command", "out")},
+        "results": {}
+    }
+    if not args.skip_micro:
+        # Imported here so `compare` works without the app's dependencies
+        from bench.micro import run_micro
+        print("Running micro-benchmarks...")
+        report["results"]["micro"] = run_micro(query_sets, k=args.k)
+    if not args.skip_load:
+        from bench.load import LocalServer, run_load
+        print(f"Running load test ({args.requests} requests, concurrency {args.concurrency})...")
+        if args.url:
+            report["results"]["load"] = run_load(query_sets, args.url, args.requests, args.concurrency, args.compact)
+        else:
+            with LocalServer() as server:
+                report["results"]["load"] = run_load(query_sets, server.url, args.requests, args.concurrency,
+                                                     args.compact, server_pid=server.proc.pid)
+    write_report(args.out, report)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import http.client
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from bench.report import summarize
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+SEARCH_PATH = "/api/v1/routes/search"
+STARTUP_TIMEOUT_S = 300
+RSS_SAMPLE_S = 0.2
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _process_tree(pid):
+    """pid plus every descendant (search pool workers), read from /proc."""
+    pids, stack = [], [pid]
+    while stack:
+        p = stack.pop()
+        pids.append(p)
+        try:
+            for task in os.listdir(f"/proc/{p}/task"):
+                with open(f"/proc/{p}/task/{task}/children") as f:
+                    stack.extend(int(c) for c in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+def _tree_rss_mb(pid):
+    total_kb = 0
+    for p in _process_tree(pid):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            pass
+    return total_kb / 1024
+
+class LocalServer:
+    """uvicorn serving app.main on a free local port, in a child process."""
+    def __init__(self, env=None):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = {**os.environ, **(env or {})}
+        self.proc = None
+
+    def __enter__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=self.env
+        )
+        deadline = time.monotonic() + STARTUP_TIMEOUT_S
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"Server exited during startup with code {self.proc.returncode}")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=2)
+                # Health answers before anything has loaded; wait until searches can be served
+                conn.request("GET", "/api/v1/ready")
+                if conn.getresponse().status == 200:
+                    return self
+            except OSError:
+                pass
+            time.sleep(0.5)
+        raise RuntimeError("Server did not become ready in time")
+
+    def __exit__(self, *exc):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+def run_load(query_sets, url, requests=200, concurrency=8, compact=False, server_pid=None):
+    """
+    Sends `requests` route searches, cycling through every query set, from
+    `concurrency` threads with one keep-alive connection each. Reports latency
+    percentiles of the 200s (so fast rejections can't flatter them) and per status
+    class ("2xx", "5xx", "error", ...), throughput, and the server's peak RSS
+    including pool workers when its pid is known.
+    """
+    target = urlsplit(url)
+    queries = [dict(q, compact=compact) for qs in query_sets.values() for q in qs]
+    work = iter(itertools.islice(itertools.cycle(queries), requests))
+    lock = threading.Lock()
+    latencies, statuses = [], {}
+    by_class = {}
+    ok_latencies = []
+
+    def client():
+        conn = http.client.HTTPConnection(target.hostname, target.port, timeout=60)
+        while True:
+            with lock:
+                q = next(work, None)
+            if q is None:
+                break
+            body = json.dumps(q)
+            start = time.perf_counter()
+            try:
+                conn.request("POST", SEARCH_PATH, body=body, headers={"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(target.hostname, target.port, timeout=60)
+                status = "error"
+            took = time.perf_counter() - start
+            status_class = status if status == "error" else f"{status // 100}xx"
+            with lock:
+                latencies.append(took)
+                statuses[status] = statuses.get(status, 0) + 1
+                by_class.setdefault(status_class, []).append(took)
+                if status == 200:
+                    ok_latencies.append(took)
+        conn.close()
+
+    peak_rss = [0.0]
+    done = threading.Event()
+    def sample_rss():
+        while not done.is_set():
+            peak_rss[0] = max(peak_rss[0], _tree_rss_mb(server_pid))
+            done.wait(RSS_SAMPLE_S)
+    sampler = threading.Thread(target=sample_rss, daemon=True) if server_pid else None
+    if sampler:
+        sampler.start()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    wall = time.perf_counter() - start
+    done.set()
+    if sampler:
+        sampler.join()
+
+    ok = statuses.get(200, 0)
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "compact": compact,
+        "errors": len(latencies) - ok,
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(ok / wall, 2) if wall else 0.0,
+        "latency": summarize(ok_latencies),
+        "latency_by_status": {k: summarize(v) for k, v in sorted(by_class.items())},
+        "server_peak_rss_mb": round(peak_rss[0], 1) if server_pid else None
+    }
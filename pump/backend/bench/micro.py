@@ -0,0 +1,85 @@
+import time
+from datetime import datetime
+
+from app.compact import compact_routes
+from app.main import json_body
+from app.ml.inference import predictor
+from app.network.cache import RouteCache
+from app.network.graph import TIME_BANDS, RouteEngine
+from app.scoring.ranker import score_and_rank_routes
+from bench.report import peak_rss_mb, summarize
+
+WEIGHTING_REPEATS = 3
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+def run_micro(query_sets, k=5):
+    """
+    Times each stage of a route search in-process, per call: snapping, collapsing
+    a band's weighted graph, path search (route cache off), leg time prediction,
+    scoring and response serialization (the API's json_body, full vs compact).
+    Returns {"stages": {stage: summary}, "path_search": {query set: summary}, ...}.
+    """
+    start = time.perf_counter()
+    engine = RouteEngine()
+    engine.load()
+    predictor.load()
+    load_s = time.perf_counter() - start
+    # Every search should do the full work
+    engine.route_cache = RouteCache(maxsize=0)
+
+    samples = {stage: [] for stage in ("snapping", "weighting", "path_search", "predict", "scoring",
+                                       "serialize_full", "serialize_compact")}
+    per_set = {}
+    found = 0
+    queries = [(name, q) for name, qs in query_sets.items() for q in qs]
+    for name, q in queries[:1]:
+        # Warm up lazily built state (NumPy kernels, model trees) outside the timings
+        engine.k_shortest_paths(q['source']['lat'], q['source']['lng'], q['destination']['lat'], q['destination']['lng'], k=k)
+
+    for band in TIME_BANDS:
+        for _ in range(WEIGHTING_REPEATS):
+            engine.weighted_graphs.pop(band, None)
+            took, _ = _timed(engine.get_weighted_graph, band)
+            samples["weighting"].append(took)
+
+    for name, q in queries:
+        dt = datetime.fromisoformat(q['departure_time'])
+        hour, day = dt.hour, dt.weekday()
+        points = [(q['source']['lat'], q['source']['lng']), (q['destination']['lat'], q['destination']['lng'])]
+
+        took, _ = _timed(engine.snap_candidates, points)
+        samples["snapping"].append(took)
+
+        took, paths = _timed(engine.k_shortest_paths, *points[0], *points[1], k=k, departure_hour=hour, departure_day=day)
+        samples["path_search"].append(took)
+        per_set.setdefault(name, []).append(took)
+        if not paths:
+            continue
+        found += 1
+
+        legs = [leg for path in paths for leg in path['legs']]
+        took, _ = _timed(predictor.predict_leg_times, [leg['mode'] for leg in legs], [leg['length_m'] for leg in legs],
+                         hour=hour, day_of_week=day, zones=[leg.get('zone', 1) for leg in legs])
+        samples["predict"].append(took)
+
+        took, ranked = _timed(score_and_rank_routes, paths, departure_hour=hour, departure_day=day)
+        samples["scoring"].append(took)
+
+        took, _ = _timed(json_body, {"routes": ranked})
+        samples["serialize_full"].append(took)
+        took, _ = _timed(lambda: json_body(compact_routes(ranked)))
+        samples["serialize_compact"].append(took)
+
+    return {
+        "engine": {"backend": engine.backend, "search_mode": engine.search_mode, "alternatives": engine.alternatives, "k": k},
+        "load_s": round(load_s, 3),
+        "queries": len(queries),
+        "routed": found,
+        "stages": {stage: summarize(s) for stage, s in samples.items()},
+        "path_search": {name: summarize(s) for name, s in per_set.items()},
+        "peak_rss_mb": peak_rss_mb()
+    }
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import numpy as np
+from pathlib import Path
+
+from app.network.geo import haversine_m
+
+DATA_DIR = Path("/home/jayant/gitgud/marg/marg/pump/data/processed")
+STOP_FILES = ("bus_stops.json", "metro_stations.json")
+
+# Straight-line OD distance classes in metres, [low, high)
+DISTANCE_CLASSES = {
+    "short": (500, 3000),
+    "medium": (3000, 10000),
+    "cross_city": (12000, 40000),
+}
+# A Monday departure in each time band (see app.network.graph.get_time_band)
+DEPARTURES = {
+    "rush": "2026-02-23T18:30:00",
+    "off_peak": "2026-02-23T14:00:00",
+}
+# Query points are moved up to this far off their stop so snapping has work to do
+JITTER_M = 150
+SEED = 7
+
+def data_fingerprint(data_dir=DATA_DIR):
+    """Hash of the stop files; query sets are only comparable for the same data."""
+    digest = hashlib.sha1()
+    for name in STOP_FILES:
+        path = Path(data_dir) / name
+        if path.exists():
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+def load_stops(data_dir=DATA_DIR):
+    stops = []
+    for name in STOP_FILES:
+        path = Path(data_dir) / name
+        if path.exists():
+            with open(path) as f:
+                stops.extend(json.load(f))
+    return stops
+
+def build_query_sets(per_set=25, seed=SEED, data_dir=DATA_DIR):
+    """
+    Deterministic OD queries for every (distance class, time band) pair, e.g.
+    "medium/rush": [{"source": {lat, lng}, "destination": {...}, "departure_time"}].
+    The same seed, per_set and stop data always give the same queries.
+    """
+    stops = load_stops(data_dir)
+    lat = np.array([s['lat'] for s in stops])
+    lon = np.array([s['lon'] for s in stops])
+    rng = np.random.default_rng(seed)
+
+    sets = {}
+    for name, (low, high) in DISTANCE_CLASSES.items():
+        pairs = []
+        # Draw candidate pairs in blocks and keep those in the distance class
+        for _ in range(200):
+            a = rng.integers(len(stops), size=1000)
+            b = rng.integers(len(stops), size=1000)
+            d = haversine_m(lat[a], lon[a], lat[b], lon[b])
+            keep = np.nonzero((d >= low) & (d < high))[0]
+            pairs.extend(zip(a[keep].tolist(), b[keep].tolist()))
+            if len(pairs) >= per_set * len(DEPARTURES):
+                break
+        pairs = pairs[:per_set * len(DEPARTURES)]
+
+        # ~111 km per degree; the longitude jitter is a little wider at Pune's latitude
+        jitter = rng.uniform(-JITTER_M, JITTER_M, size=(len(pairs), 4)) / 111000
+        for i, band in enumerate(DEPARTURES):
+            queries = []
+            for j in range(i * per_set, min((i + 1) * per_set, len(pairs))):
+                a, b = pairs[j]
+                queries.append({
+                    "source": {"lat": round(float(lat[a] + jitter[j, 0]), 6), "lng": round(float(lon[a] + jitter[j, 1]), 6)},
+                    "destination": {"lat": round(float(lat[b] + jitter[j, 2]), 6), "lng": round(float(lon[b] + jitter[j, 3]), 6)},
+                    "departure_time": DEPARTURES[band]
+                })
+            sets[f"{name}/{band}"] = queries
+    return sets
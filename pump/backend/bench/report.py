@@ -0,0 +1,106 @@
+import json
+import os
+import platform
+import resource
+import subprocess
+import time
+import numpy as np
+from pathlib import Path
+
+from bench.queries import data_fingerprint
+
+# Relative change beyond which compare() flags a metric
+REGRESSION_THRESHOLD = 0.10
+# Metrics where a larger value is better; every other metric is a cost
+HIGHER_IS_BETTER = ("throughput_rps",)
+# Latency changes smaller than this are timer noise, whatever their relative size
+MIN_DELTA_MS = 0.5
+# Sizes of the run rather than measurements, and single outliers; shown but never flagged
+UNFLAGGED_METRICS = ("n", "k", "queries", "routed", "requests", "errors", "concurrency", "max_ms")
+
+def summarize(samples_s):
+    """Latency summary in milliseconds for a list of per-call durations in seconds."""
+    ms = np.asarray(samples_s, dtype=np.float64) * 1000
+    if len(ms) == 0:
+        return {"n": 0}
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99]).tolist()
+    return {
+        "n": len(ms),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(p50, 3),
+        "p95_ms": round(p95, 3),
+        "p99_ms": round(p99, 3),
+        "max_ms": round(float(ms.max()), 3)
+    }
+
+def peak_rss_mb():
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux)."""
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def run_metadata():
+    """Where and on what a report was produced, so two reports can be judged comparable."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "data": data_fingerprint(),
+        "env": {k: v for k, v in sorted(os.environ.items()) if k.startswith("PUMP_") and k != "PUMP_ADMIN_TOKEN"}
+    }
+
+def write_report(path, report):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote report to {path}")
+
+def _flatten(d, prefix=""):
+    flat = {}
+    for k, v in d.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            flat.update(_flatten(v, key + "."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            flat[key] = v
+    return flat
+
+def compare(base, new, threshold=REGRESSION_THRESHOLD):
+    """
+    Relative change of every shared latency/throughput/RSS metric between two
+    reports. Returns (rows, regressions); a row is (metric, base, new, change).
+    Counts (n, requests, errors) and max_ms are reported but never flagged.
+    """
+    a, b = _flatten(base.get("results", {})), _flatten(new.get("results", {}))
+    rows, regressions = [], []
+    for key in sorted(a.keys() & b.keys()):
+        old, cur = a[key], b[key]
+        change = (cur - old) / old if old else 0.0
+        rows.append((key, old, cur, change))
+        metric = key.rsplit(".", 1)[-1]
+        # Per-status breakdowns are detail; the 200s' latency is flagged on its own
+        if metric in UNFLAGGED_METRICS or ".statuses." in key or ".latency_by_status." in key:
+            continue
+        if metric.endswith("_ms") and abs(cur - old) < MIN_DELTA_MS:
+            continue
+        worse = -change if metric in HIGHER_IS_BETTER else change
+        if worse > threshold:
+            regressions.append(key)
+    return rows, regressions
+
+def print_comparison(base, new, threshold=REGRESSION_THRESHOLD):
+    rows, regressions = compare(base, new, threshold)
+    for field in ("commit", "data", "env"):
+        if base["meta"].get(field) != new["meta"].get(field):
+            print(f"note: {field} differs: {base['meta'].get(field)} -> {new['meta'].get(field)}")
+    flagged = set(regressions)
+    width = max((len(r[0]) for r in rows), default=10)
+    for key, old, cur, change in rows:
+        mark = "  REGRESSION" if key in flagged else ""
+        print(f"{key:<{width}}  {old:>12.3f}  {cur:>12.3f}  {change:>+8.1%}{mark}")
+    print(f"{len(regressions)} regression(s) over {threshold:.0%}")
+    return regressions
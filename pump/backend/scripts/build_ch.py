@@ -0,0 +1,39 @@
+import sys
+import time
+from pathlib import Path
+
+# Share the engine's graph construction and artifact format with the API
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app.network.artifacts import add_artifact_arrays
+from app.network.ch import ContractionHierarchy
+from app.network.csr import MODES
+from app.network.graph import ARTIFACT_DIR, TIME_BANDS, RouteEngine, mode_speed
+
+def build_ch():
+    """
+    Contracts each time band's collapsed graph and stores the hierarchies next to the
+    graph artifacts. Run after scripts/build_graph.py, which writes a fresh manifest.
+    """
+    engine = RouteEngine(backend="csr", search_mode="dijkstra")
+    engine.load()
+
+    arrays, info = {}, {}
+    for band in TIME_BANDS:
+        print(f"Contracting {band} graph...")
+        start = time.perf_counter()
+        ch = ContractionHierarchy.build(engine.get_weighted_graph(band))
+        took = time.perf_counter() - start
+        for name, arr in ch.arrays.items():
+            arrays[f"ch_{band}_{name}"] = arr
+        info[band] = {
+            "speeds": [mode_speed(m, band) for m in MODES],
+            "shortcuts": ch.n_shortcuts(),
+            "build_s": round(took, 1)
+        }
+        print(f"{band}: {ch.n_shortcuts()} shortcuts in {took:.1f}s")
+
+    add_artifact_arrays(ARTIFACT_DIR, arrays, "contraction_hierarchies", info)
+    print(f"Saved contraction hierarchies to {ARTIFACT_DIR}")
+
+if __name__ == "__main__":
+    build_ch()
@@ -1,22 +1,22 @@
 import json
+import sys
 import networkx as nx
 from pathlib import Path
-import math
 import pickle
+import numpy as np
 from scipy.spatial import KDTree
 
+# Share the artifact format with the API
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app.network.artifacts import write_artifacts
+from app.network.geo import haversine_m
+from app.network.zones import ZoneIndex
+
 DATA_DIR = Path("/home/jayant/gitgud/marg/marg/pump/data/processed")
 GRAPH_OUT = DATA_DIR / "multimodal_graph.gpickle"
 KDTREE_OUT = DATA_DIR / "spatial_index.pkl"
-
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371000 # radius of Earth in meters
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-    return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+ARTIFACT_OUT = DATA_DIR / "multimodal_graph"
+ZONES_IN = DATA_DIR / "congestion_zones.geojson"
 
 def build_graph():
     print("Loading nodes...")
@@ -52,7 +52,7 @@ def build_graph():
         for i in range(len(line)-1):
             n1 = line[i]
             n2 = line[i+1]
-            dist = haversine(n1['lat'], n1['lon'], n2['lat'], n2['lon'])
+            dist = float(haversine_m(n1['lat'], n1['lon'], n2['lat'], n2['lon']))
             
             # Bidirectional metro edges
             G.add_edge(n1['id'], n2['id'], mode="metro", length_m=dist, key=f"metro_{n1['id']}_{n2['id']}")
@@ -66,32 +66,46 @@ def build_graph():
     print("Building spatial index for transfers and bus routing...")
     tree = KDTree(node_coords)
     
-    # Connect stops within 400 meters
-    for i, (lat, lon) in enumerate(node_coords):
-        n1_id = node_ids[i]
-        n1_type = G.nodes[n1_id].get('type')
-        
-        # Find neighbors within ~400 meters (approx 0.004 degrees)
-        # Using KDTree in Euclidean space on lat/lon is technically flawed but acceptable for 400m
-        # For precision, we query larger and filter by Haversine.
-        neighbors = tree.query_ball_point([lat, lon], r=0.005) 
-        
-        for j in neighbors:
-            if i != j:
-                n2_id = node_ids[j]
-                n2_type = G.nodes[n2_id].get('type')
-                
-                n2_lat, n2_lon = node_coords[j]
-                dist = haversine(lat, lon, n2_lat, n2_lon)
-                
-                if dist <= 400:
-                    mode = "walk"
-                    if n1_type == 'bus_stop' and n2_type == 'bus_stop':
-                        # Allow bus travel between nearby stops to simulate the road network
-                        G.add_edge(n1_id, n2_id, mode="bus", length_m=dist, key=f"bus_{n1_id}_{n2_id}")
-                    
-                    # Also add a walk edge for transfers
-                    G.add_edge(n1_id, n2_id, mode="walk", length_m=dist, key=f"walk_{n1_id}_{n2_id}")
+    # Connect stops within 400 meters.
+    # Find all candidate pairs within ~500 meters (0.005 degrees) in one batched query.
+    # Using KDTree in Euclidean space on lat/lon is technically flawed but acceptable for 400m,
+    # so for precision we query larger and filter by Haversine.
+    pairs = tree.query_pairs(r=0.005, output_type='ndarray')
+    # Both directions, ordered by source then target so the build is deterministic
+    src = np.concatenate([pairs[:, 0], pairs[:, 1]])
+    dst = np.concatenate([pairs[:, 1], pairs[:, 0]])
+    order = np.lexsort((dst, src))
+    src, dst = src[order], dst[order]
+    
+    coords = np.asarray(node_coords)
+    dists = haversine_m(coords[src, 0], coords[src, 1], coords[dst, 0], coords[dst, 1])
+    close = dists <= 400
+    src, dst, dists = src[close], dst[close], dists[close]
+    
+    is_bus = np.array([G.nodes[n].get('type') == 'bus_stop' for n in node_ids])
+    bus_pair = is_bus[src] & is_bus[dst]
+    
+    edges = []
+    for i, j, dist, bus in zip(src.tolist(), dst.tolist(), dists.tolist(), bus_pair.tolist()):
+        n1_id, n2_id = node_ids[i], node_ids[j]
+        if bus:
+            # Allow bus travel between nearby stops to simulate the road network
+            edges.append((n1_id, n2_id, f"bus_{n1_id}_{n2_id}", {"mode": "bus", "length_m": dist}))
+        # Also add a walk edge for transfers
+        edges.append((n1_id, n2_id, f"walk_{n1_id}_{n2_id}", {"mode": "walk", "length_m": dist}))
+    G.add_edges_from(edges)
+
+    # 5. Tag every edge with its congestion zone so the API never runs polygon tests
+    zone_index = ZoneIndex.load(ZONES_IN)
+    print(f"Tagging edges with {len(zone_index.polygons)} congestion zone polygons...")
+    position = {n: i for i, n in enumerate(node_ids)}
+    edge_list = list(G.edges(keys=True))
+    e_src = np.array([position[u] for u, _, _ in edge_list], dtype=np.int64)
+    e_dst = np.array([position[v] for _, v, _ in edge_list], dtype=np.int64)
+    edge_zones = zone_index.edge_zones(coords[:, 0], coords[:, 1], e_src, e_dst)
+    nx.set_edge_attributes(G, dict(zip(edge_list, edge_zones.tolist())), "zone")
+    zone_ids, counts = np.unique(edge_zones, return_counts=True)
+    print(f"Edges per zone: {dict(zip(zone_ids.tolist(), counts.tolist()))}")
 
     print(f"Graph built with {len(G.nodes)} nodes and {len(G.edges)} edges.")
     
@@ -108,7 +122,14 @@ def build_graph():
     with open(KDTREE_OUT, 'wb') as f:
         pickle.dump(index_data, f)
         
-    print("Saved Graph and KD-Tree successfully.")
+    # Save memory-mappable arrays for the csr backend
+    manifest = write_artifacts(
+        ARTIFACT_OUT, G, node_ids, node_coords,
+        sources=[p for p in (DATA_DIR / "bus_stops.json", DATA_DIR / "metro_stations.json", ZONES_IN) if p.exists()]
+    )
+    print(f"Saved {manifest['format']} v{manifest['version']} artifacts to {ARTIFACT_OUT}")
+        
+    print("Saved Graph and KD-Tree successfully. Run scripts/build_ch.py to add contraction hierarchies.")
 
 if __name__ == "__main__":
     build_graph()
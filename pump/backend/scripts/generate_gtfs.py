@@ -0,0 +1,80 @@
+import csv
+import json
+import math
+from pathlib import Path
+
+# Writes a GTFS-style feed for the metro lines so the timetable engine (engine=raptor/csa)
+# has something to route on. Swap in a real operator feed by pointing PUMP_GTFS_DIR at it.
+DATA_DIR = Path("/home/jayant/gitgud/marg/marg/pump/data/processed")
+OUT_DIR = Path("/home/jayant/gitgud/marg/marg/pump/data/gtfs")
+
+SERVICE_START = 6 * 3600
+SERVICE_END = 23 * 3600
+RUSH_HOURS = [(8, 11), (17, 21)]
+RUSH_HEADWAY_S = 7 * 60 + 30
+OFF_PEAK_HEADWAY_S = 10 * 60
+RUN_SPEED_M_S = 10.0
+DWELL_S = 30
+
+def haversine(lat1, lon1, lat2, lon2):
+    R = 6371000 # radius of Earth in meters
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+
+    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
+    return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+def gtfs_time(seconds):
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def headway(t):
+    hour = t // 3600
+    return RUSH_HEADWAY_S if any(a <= hour < b for a, b in RUSH_HOURS) else OFF_PEAK_HEADWAY_S
+
+def write_table(name, fields, rows):
+    with open(OUT_DIR / name, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        writer.writerows(rows)
+
+def generate_gtfs():
+    with open(DATA_DIR / "metro_stations.json", 'r') as f:
+        metro_stops = json.load(f)
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+
+    # Same line membership and station order as scripts/build_graph.py
+    lines = {
+        "Aqua": [s for s in metro_stops if "Aqua" in s.get('line', '')],
+        "Purple": [s for s in metro_stops if "Purple" in s.get('line', '')],
+    }
+
+    stops = {s['id']: s for s in metro_stops}
+    write_table("stops.txt", ["stop_id", "stop_name", "stop_lat", "stop_lon"],
+                [(s['id'], s['name'], s['lat'], s['lon']) for s in stops.values()])
+    write_table("routes.txt", ["route_id", "route_short_name", "route_long_name", "route_type"],
+                [(name, name, f"{name} Line", 1) for name in lines])
+
+    trips, stop_times = [], []
+    for name, line in lines.items():
+        for direction, seq in ((0, line), (1, line[::-1])):
+            # (arrive, depart) offsets from the first departure, dwelling at intermediate stops
+            offsets = [(0, 0)]
+            for i, (a, b) in enumerate(zip(seq, seq[1:]), start=1):
+                arrive = offsets[-1][1] + round(haversine(a['lat'], a['lon'], b['lat'], b['lon']) / RUN_SPEED_M_S)
+                offsets.append((arrive, arrive if i == len(seq) - 1 else arrive + DWELL_S))
+
+            t = SERVICE_START
+            while t <= SERVICE_END:
+                trip_id = f"{name}_{direction}_{gtfs_time(t).replace(':', '')}"
+                trips.append((name, trip_id, direction))
+                for i, (stop, (arrive, depart)) in enumerate(zip(seq, offsets)):
+                    stop_times.append((trip_id, gtfs_time(t + arrive), gtfs_time(t + depart), stop['id'], i + 1))
+                t += headway(t)
+
+    write_table("trips.txt", ["route_id", "trip_id", "direction_id"], trips)
+    write_table("stop_times.txt", ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"], stop_times)
+    print(f"Wrote {len(stops)} stops, {len(trips)} trips and {len(stop_times)} stop times to {OUT_DIR}")
+
+if __name__ == "__main__":
+    generate_gtfs()
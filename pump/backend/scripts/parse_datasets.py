@@ -2,87 +2,165 @@ import xml.etree.ElementTree as ET
 import pandas as pd
 import json
 import os
+import sys
+import time
+from itertools import islice
 from pathlib import Path
 
+# Source checksums use the same helper as the graph artifacts
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app.checksums import file_checksum
+
 # Paths
 DATA_DIR = Path("/home/jayant/gitgud/marg/marg/Datasets")
 OUT_DIR = Path("/home/jayant/gitgud/marg/marg/pump/data/processed")
-OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 STOPS_KML = DATA_DIR / "pune PMPML Bus Stops Map.kml"
 ROUTES_CSV = DATA_DIR / "pune PMPML Bus Routes List.csv"
+DEPOTS_KML = DATA_DIR / "pune PMPML Bus Depots Map.kml"
+
+# Source checksum per output; outputs whose source is unchanged are not rebuilt
+MANIFEST = OUT_DIR / "ingest_manifest.json"
+# Bump when the parsers change, so every output is rebuilt once
+PARSER_VERSION = 2
+# Rows per pandas chunk while reading route CSVs
+CSV_CHUNK_ROWS = 5000
+# Records serialized per write
+WRITE_BATCH = 1000
+
+KML_NS = '{http://www.opengis.net/kml/2.2}'
+CONTAINER_TAGS = (KML_NS + 'Folder', KML_NS + 'Document')
+
+def iter_kml_placemarks(kml_path):
+    """
+    Streams (coordinates, SimpleData fields) for each Placemark with iterparse.
+    Placemarks are cleared once read and containers once they end, so only an
+    empty shell per Placemark of the current folder stays in memory.
+    """
+    for _, elem in ET.iterparse(kml_path):
+        if elem.tag in CONTAINER_TAGS:
+            elem.clear()
+            continue
+        if elem.tag != KML_NS + 'Placemark':
+            continue
+
+        coords = None
+        point = elem.find(f'.//{KML_NS}Point/{KML_NS}coordinates')
+        if point is not None and point.text:
+            parts = point.text.strip().split(',')
+            coords = (float(parts[0]), float(parts[1]))
+        fields = {d.get('name'): d.text for d in elem.iter(KML_NS + 'SimpleData')}
+        yield coords, fields
+        elem.clear()
 
 def parse_kml_stops(kml_path):
+    """Bus stops from the PMPML stops KML, one dict at a time."""
     print("Parsing KML Stops...")
-    tree = ET.parse(kml_path)
-    root = tree.getroot()
-    
-    # KML parsing (handling namespaces is tricky, we'll strip them for easy search)
-    namespaces = {'kml': 'http://www.opengis.net/kml/2.2'}
-    
-    stops = []
-    
-    # Find all Placemarks
-    for placemark in root.findall('.//kml:Placemark', namespaces):
-        stop_data = {}
-        
-        # Get coordinates
-        point = placemark.find('.//kml:Point/kml:coordinates', namespaces)
-        if point is not None:
-            coords = point.text.strip().split(',')
-            stop_data['lon'] = float(coords[0])
-            stop_data['lat'] = float(coords[1])
-            
-        # Get ExtendedData (SchemaData -> SimpleData)
-        schema_data = placemark.find('.//kml:SchemaData', namespaces)
-        if schema_data is not None:
-            for simple_data in schema_data.findall('.//kml:SimpleData', namespaces):
-                name = simple_data.get('name')
-                value = simple_data.text
-                if name == 'stop_id':
-                    stop_data['id'] = f"bus_{value}"
-                elif name == 'stop_name':
-                    stop_data['name'] = value
-                elif name == 'stop_code':
-                    stop_data['code'] = value
-        
-        if 'id' in stop_data and 'lat' in stop_data:
-            stop_data['type'] = 'bus_stop'
-            stops.append(stop_data)
-            
-    print(f"Total bus stops parsed: {len(stops)}")
-    return stops
-
-def parse_routes_csv(csv_path):
-    print("Parsing Routes CSV...")
-    df = pd.read_csv(csv_path)
-    routes = []
-    
-    for _, row in df.iterrows():
-        route = {
-            'id': f"route_{row['Route ID']}",
-            'name': row['Route ID'],
-            'description': row['Route Description'],
-            'length_km': float(row['Kilometer']) if not pd.isna(row['Kilometer']) else 0.0
+    for coords, fields in iter_kml_placemarks(kml_path):
+        if coords is None or fields.get('stop_id') is None:
+            continue
+        stop_data = {'lon': coords[0], 'lat': coords[1]}
+        # Keys follow the KML's field order
+        for name, value in fields.items():
+            if name == 'stop_id':
+                stop_data['id'] = f"bus_{value}"
+            elif name == 'stop_name':
+                stop_data['name'] = value
+            elif name == 'stop_code':
+                stop_data['code'] = value
+        stop_data['type'] = 'bus_stop'
+        yield stop_data
+
+def parse_kml_depots(kml_path):
+    """Bus depots from the PMPML depots KML; ids follow file order."""
+    print("Parsing KML Depots...")
+    n = 0
+    for coords, fields in iter_kml_placemarks(kml_path):
+        if coords is None:
+            continue
+        yield {
+            'id': f"depot_{n}",
+            'name': fields.get('name'),
+            'address': fields.get('address'),
+            'lat': coords[1],
+            'lon': coords[0],
+            'type': 'bus_depot'
         }
-        routes.append(route)
-        
-    print(f"Total routes parsed: {len(routes)}")
-    return routes
+        n += 1
+
+def parse_routes_csv(csv_path, chunksize=CSV_CHUNK_ROWS):
+    """
+    Routes from the PMPML routes CSV, read in chunks of `chunksize` rows. Rows with
+    a blank Route ID are skipped (they used to come out as "route_nan"), and a
+    blank description is null.
+    """
+    print("Parsing Routes CSV...")
+    skipped = 0
+    for df in pd.read_csv(csv_path, chunksize=chunksize, dtype={'Route ID': str, 'Route Description': str}):
+        has_id = df['Route ID'].notna()
+        skipped += int((~has_id).sum())
+        df = df[has_id]
+        chunk = pd.DataFrame({
+            'id': "route_" + df['Route ID'],
+            'name': df['Route ID'],
+            'description': df['Route Description'].astype(object).where(df['Route Description'].notna(), None),
+            'length_km': pd.to_numeric(df['Kilometer'], errors='coerce').fillna(0.0).astype(float)
+        })
+        yield from chunk.to_dict('records')
+    if skipped:
+        print(f"Skipped {skipped} routes with no Route ID.")
+
+def write_json_array(path, items, batch_size=WRITE_BATCH):
+    """
+    Writes items as a JSON array laid out like json.dump(..., indent=2), a batch
+    at a time. The file is written next to `path` and renamed over it at the end,
+    so an interrupted run never leaves a truncated output.
+    """
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    n = 0
+    with open(tmp, 'w', encoding='utf-8') as f:
+        it = iter(items)
+        while batch := list(islice(it, batch_size)):
+            # Each batch is dumped as a list and written without its brackets
+            f.write('[\n' if n == 0 else ',\n')
+            f.write(json.dumps(batch, indent=2, ensure_ascii=False)[2:-2])
+            n += len(batch)
+        f.write('\n]' if n else '[]')
+    os.replace(tmp, path)
+    return n
+
+def load_manifest():
+    if MANIFEST.exists():
+        with open(MANIFEST) as f:
+            manifest = json.load(f)
+        if manifest.get('parser_version') == PARSER_VERSION:
+            return manifest
+    return {'parser_version': PARSER_VERSION, 'outputs': {}}
+
+def ingest(manifest, out_name, source, parse, force=False):
+    """Parses `source` into OUT_DIR/out_name unless its checksum matches the last run."""
+    out_path = OUT_DIR / out_name
+    if not source.exists():
+        print(f"No {source.name} in {source.parent}; skipping {out_name}.")
+        return
+    checksum = file_checksum(source)
+    previous = manifest['outputs'].get(out_name, {})
+    if not force and previous.get('sha256') == checksum and out_path.exists():
+        print(f"{source.name} unchanged; keeping {out_name} ({previous['count']} records).")
+        return
+
+    start = time.perf_counter()
+    count = write_json_array(out_path, parse(source))
+    manifest['outputs'][out_name] = {'source': source.name, 'sha256': checksum, 'count': count}
+    print(f"Saved {count} records to {out_path} in {time.perf_counter() - start:.2f}s")
 
 if __name__ == "__main__":
-    stops = parse_kml_stops(STOPS_KML)
-    routes = parse_routes_csv(ROUTES_CSV)
-    
-    # Save to processed JSON
-    stops_file = OUT_DIR / "bus_stops.json"
-    routes_file = OUT_DIR / "bus_routes.json"
-    
-    with open(stops_file, 'w', encoding='utf-8') as f:
-        json.dump(stops, f, indent=2, ensure_ascii=False)
-        
-    with open(routes_file, 'w', encoding='utf-8') as f:
-        json.dump(routes, f, indent=2, ensure_ascii=False)
-        
-    print(f"Saved {len(stops)} stops to {stops_file}")
-    print(f"Saved {len(routes)} routes to {routes_file}")
+    force = '--force' in sys.argv[1:]
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest()
+    ingest(manifest, "bus_stops.json", STOPS_KML, parse_kml_stops, force)
+    ingest(manifest, "bus_routes.json", ROUTES_CSV, parse_routes_csv, force)
+    ingest(manifest, "bus_depots.json", DEPOTS_KML, parse_kml_depots, force)
+
+    with open(MANIFEST, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
@@ -0,0 +1,87 @@
+import pickle
+import sys
+from pathlib import Path
+
+import networkx as nx
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app.network import graph
+from app.network.artifacts import write_artifacts
+from app.network.geo import haversine_m
+
+# Synthetic network: a GRID x GRID block of bus stops STEP_DEG apart with walk edges
+# between neighbours and bus lines along the rows, plus a metro line down column 2
+GRID = 5
+STEP_DEG = 0.003
+ORIGIN = (18.50, 73.85)
+
+def stop(node_id, lat, lon, kind):
+    return node_id, {"id": node_id, "name": node_id, "lat": lat, "lon": lon, "type": kind}
+
+def add_edge(G, u, v, mode):
+    a, b = G.nodes[u], G.nodes[v]
+    length = float(haversine_m(a['lat'], a['lon'], b['lat'], b['lon']))
+    G.add_edge(u, v, key=f"{mode}_{u}_{v}", mode=mode, length_m=length, zone=1)
+
+def build_network():
+    G = nx.MultiDiGraph()
+    for r in range(GRID):
+        for c in range(GRID):
+            G.add_nodes_from([stop(f"bus_{r}{c}", ORIGIN[0] + r * STEP_DEG, ORIGIN[1] + c * STEP_DEG, "bus_stop")])
+    for r in range(GRID):
+        G.add_nodes_from([stop(f"metro_t_{r}", ORIGIN[0] + r * STEP_DEG, ORIGIN[1] + 2 * STEP_DEG + 0.0005, "metro_station")])
+
+    for r in range(GRID):
+        for c in range(GRID):
+            for dr, dc in ((0, 1), (1, 0)):
+                if r + dr < GRID and c + dc < GRID:
+                    u, v = f"bus_{r}{c}", f"bus_{r + dr}{c + dc}"
+                    for a, b in ((u, v), (v, u)):
+                        if dr == 0:
+                            add_edge(G, a, b, "bus")
+                        add_edge(G, a, b, "walk")
+        station = f"metro_t_{r}"
+        for a, b in ((station, f"bus_{r}2"), (f"bus_{r}2", station)):
+            add_edge(G, a, b, "walk")
+        if r + 1 < GRID:
+            add_edge(G, station, f"metro_t_{r + 1}", "metro")
+            add_edge(G, f"metro_t_{r + 1}", station, "metro")
+    return G
+
+def write_network(G, directory):
+    """Writes G as the pickles and artifacts RouteEngine.load() reads."""
+    node_ids = list(G.nodes)
+    coords = np.array([[G.nodes[n]['lat'], G.nodes[n]['lon']] for n in node_ids])
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / "multimodal_graph.gpickle", 'wb') as f:
+        pickle.dump(G, f)
+    with open(directory / "spatial_index.pkl", 'wb') as f:
+        pickle.dump({"node_ids": node_ids, "coords": coords}, f)
+    write_artifacts(directory / "multimodal_graph", G, node_ids, coords)
+
+def use_network(monkeypatch, directory):
+    """Points the engine module at a network written by write_network()."""
+    monkeypatch.setattr(graph, "GRAPH_PATH", directory / "multimodal_graph.gpickle")
+    monkeypatch.setattr(graph, "KDTREE_PATH", directory / "spatial_index.pkl")
+    monkeypatch.setattr(graph, "ARTIFACT_DIR", directory / "multimodal_graph")
+    monkeypatch.setattr(graph, "ZONES_PATH", directory / "congestion_zones.geojson")
+    monkeypatch.setattr(graph, "SOURCE_PATHS", ())
+
+@pytest.fixture
+def network(tmp_path, monkeypatch):
+    """Writes the synthetic network and points the engine module at it."""
+    G = build_network()
+    write_network(G, tmp_path)
+    use_network(monkeypatch, tmp_path)
+    return G
+
+@pytest.fixture
+def make_engine(network):
+    """Loaded RouteEngine over the synthetic network for a backend ("networkx" or "csr")."""
+    def make(backend, **kwargs):
+        engine = graph.RouteEngine(backend=backend, **kwargs)
+        engine.load()
+        return engine
+    return make
@@ -0,0 +1,31 @@
+import pytest
+
+from conftest import ORIGIN, STEP_DEG
+
+POINTS = [
+    (ORIGIN[0] + 0.0004, ORIGIN[1] + 0.0002),
+    (ORIGIN[0] + 0.0004, ORIGIN[1] + 0.0012),
+    (ORIGIN[0] + 4 * STEP_DEG, ORIGIN[1] + 4 * STEP_DEG),
+    (ORIGIN[0] + 2 * STEP_DEG + 0.0007, ORIGIN[1] + 0.0031),
+    (0.0, 0.0),
+]
+
+@pytest.mark.parametrize("backend", ["networkx", "csr"])
+def test_batch_matches_matrix(make_engine, backend):
+    engine = make_engine(backend)
+    matrix = engine.travel_time_matrix(POINTS, POINTS, departure_hour=13)
+    pairs = [(*a, *b) for a in POINTS for b in POINTS]
+    results = engine.batch_shortest_paths(pairs, departure_hour=13, include_paths=True)
+    for (i, j), result in zip([(i, j) for i in range(len(POINTS)) for j in range(len(POINTS))], results):
+        if matrix[i][j] is None:
+            assert result is None
+        else:
+            # Both include the access and egress walks
+            assert result["time_s"] == pytest.approx(matrix[i][j], abs=0.1)
+            assert result["distance_m"] > 0 or i == j
+
+def test_batch_backends_agree(make_engine):
+    pairs = [(*a, *b) for a in POINTS[:4] for b in POINTS[:4]]
+    expected = make_engine("networkx").batch_shortest_paths(pairs)
+    actual = make_engine("csr").batch_shortest_paths(pairs)
+    assert [r["time_s"] for r in actual] == pytest.approx([r["time_s"] for r in expected], abs=0.1)
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from scipy.sparse.csgraph import dijkstra
+
+from app.network.ch import ContractionHierarchy
+from app.network.csr import CSRGraph
+
+SPEEDS = (1.4, 5.0, 10.0)
+
+@pytest.fixture(scope="module")
+def graph():
+    """Random sparse digraph with parallel per-mode edges, contracted like scripts/build_ch.py."""
+    rng = np.random.default_rng(7)
+    n, m = 80, 320
+    src, dst = rng.integers(0, n, m), rng.integers(0, n, m)
+    modes = rng.integers(0, 3, m).astype(np.uint8)
+    lengths = rng.uniform(50, 2000, m).astype(np.float32)
+    g = CSRGraph.from_edges([f"n{i}" for i in range(n)], src, dst, modes, lengths, SPEEDS)
+    g.ch = ContractionHierarchy.build(g, log_every=0)
+    return g
+
+def path_cost(g, path):
+    slots = [g.edge_slot(u, v) for u, v in zip(path, path[1:])]
+    assert min(slots, default=0) >= 0, "path uses a missing edge"
+    return float(sum(g.weights[s] for s in slots))
+
+def test_query_matches_dijkstra(graph):
+    reference = dijkstra(graph.matrix)
+    n = len(graph.node_ids)
+    for s in range(0, n, 3):
+        for t in range(n):
+            found = graph.ch.query(s, t)
+            if not np.isfinite(reference[s, t]):
+                assert found is None
+                continue
+            cost, path = found
+            assert cost == pytest.approx(reference[s, t])
+            # Unpacked shortcuts give back a path of original edges with the same cost
+            assert path[0] == s and path[-1] == t
+            assert path_cost(graph, path) == pytest.approx(cost)
+
+def test_query_many_matches_dijkstra(graph):
+    reference = dijkstra(graph.matrix)
+    rng = np.random.default_rng(3)
+    n = len(graph.node_ids)
+    for _ in range(40):
+        sources = {int(i): float(rng.uniform(0, 300)) for i in rng.choice(n, 3, replace=False)}
+        targets = {int(i): float(rng.uniform(0, 300)) for i in rng.choice(n, 3, replace=False)}
+        expected = min(reference[s, t] + a + b for s, a in sources.items() for t, b in targets.items())
+        found = graph.ch.query_many(sources, targets)
+        if not np.isfinite(expected):
+            assert found is None
+            continue
+        cost, path = found
+        assert cost == pytest.approx(expected)
+        assert path[0] in sources and path[-1] in targets
+        assert sources[path[0]] + path_cost(graph, path) + targets[path[-1]] == pytest.approx(cost)
+
+def test_overlay_invalidates_hierarchy(graph):
+    assert graph.ch_valid
+    slot = int(np.argmin(graph.base_weights))
+    u = int(np.searchsorted(graph.indptr, slot, side='right') - 1)
+    v = int(graph.indices[slot])
+    modes, lengths, zones = graph.modes[[slot]], graph.lengths[[slot]], graph.zones[[slot]]
+
+    slowed = graph.reweighted([slot], graph.base_weights[[slot]] * 50, modes, lengths, zones)
+    assert not slowed.ch_valid and graph.ch_valid
+    # With the hierarchy out of date, searches fall back to Dijkstra over the overlay weights
+    reference = dijkstra(slowed.matrix, indices=u)
+    cost, _ = slowed.shortest_path(u, v)
+    assert cost == pytest.approx(reference[v])
+
+    closed = graph.reweighted([slot], [np.inf], modes, lengths, zones)
+    assert not closed.ch_valid
+    restored = closed.reweighted([slot], graph.base_weights[[slot]], modes, lengths, zones)
+    assert restored.ch_valid and not restored.overrides
@@ -0,0 +1,124 @@
+import copy
+
+import numpy as np
+import pytest
+
+from app.network.csr import MODES
+from app.network.geo import haversine_m
+from app.network.updates import LINK_MAX_M
+
+from conftest import ORIGIN, STEP_DEG, add_edge, build_network, use_network, write_network
+
+DELTA = {
+    "remove": ["bus_44"],
+    "move": [
+        {"id": "bus_22", "lat": ORIGIN[0] + 2 * STEP_DEG + 0.0008, "lon": ORIGIN[1] + 2 * STEP_DEG},
+        {"id": "metro_t_1", "lat": ORIGIN[0] + STEP_DEG, "lon": ORIGIN[1] + 2 * STEP_DEG + 0.0009},
+    ],
+    "add": [{"id": "bus_new", "name": "bus_new", "lat": ORIGIN[0] + 0.0015, "lon": ORIGIN[1] + 0.004, "type": "bus_stop"}],
+}
+OVERLAY = {
+    "slow": {"stops": ["bus_11"], "factor": 3.0},
+    "closed": {"stops": ["bus_33"], "modes": ["bus"], "closed": True},
+}
+POINTS = [
+    (ORIGIN[0] + 0.0002, ORIGIN[1] + 0.0001),
+    (ORIGIN[0] + 0.0015, ORIGIN[1] + 0.0041),
+    (ORIGIN[0] + 2 * STEP_DEG + 0.0006, ORIGIN[1] + 2 * STEP_DEG),
+    (ORIGIN[0] + 4 * STEP_DEG, ORIGIN[1] + 3 * STEP_DEG),
+]
+
+def rebuilt_network():
+    """The synthetic network with DELTA applied by hand, as scripts/build_graph.py would link it."""
+    G = build_network()
+    G.remove_node("bus_44")
+    relinked = [m["id"] for m in DELTA["move"]] + [stop["id"] for stop in DELTA["add"]]
+    for move in DELTA["move"]:
+        n = move["id"]
+        G.nodes[n].update(lat=move["lat"], lon=move["lon"])
+        for u, v, key, d in list(G.in_edges(n, keys=True, data=True)) + list(G.out_edges(n, keys=True, data=True)):
+            G.remove_edge(u, v, key)
+            if d["mode"] == "metro":
+                add_edge(G, u, v, "metro")
+    for stop in DELTA["add"]:
+        G.add_node(stop["id"], **stop)
+    for n in relinked:
+        a = G.nodes[n]
+        for m, b in list(G.nodes(data=True)):
+            if m == n or haversine_m(a["lat"], a["lon"], b["lat"], b["lon"]) > LINK_MAX_M:
+                continue
+            for u, v in ((n, m), (m, n)):
+                if a["type"] == b["type"] == "bus_stop":
+                    add_edge(G, u, v, "bus")
+                add_edge(G, u, v, "walk")
+    return G
+
+def band_edges(engine):
+    """{band: {(u id, v id): (mode, weight)}} over the collapsed graphs; closed edges weigh inf."""
+    out = {}
+    for band, G_simple in engine.weighted_graphs.items():
+        if engine.backend == "csr":
+            src = np.repeat(np.arange(len(G_simple.node_ids)), np.diff(G_simple.indptr))
+            ids, modes = G_simple.node_ids, G_simple.modes.tolist()
+            for slot, (_, mode, _, _) in G_simple.overrides.items():
+                modes[slot] = mode
+            out[band] = {
+                (ids[u], ids[v]): (MODES[m], round(float(w), 3))
+                for u, v, m, w in zip(src.tolist(), G_simple.indices.tolist(), modes, G_simple.weights.tolist())
+            }
+        else:
+            out[band] = {
+                (u, v): (d["mode"], round(float(np.inf if d.get("closed") else d["dynamic_time"]), 3))
+                for u, v, d in G_simple.edges(data=True)
+            }
+    return out
+
+def source_state(engine):
+    state = {"bands": band_edges(engine), "node_ids": list(engine.node_ids), "coords": np.array(engine.coords)}
+    if engine.backend == "csr":
+        state["arrays"] = {k: np.array(v) for k, v in engine.edge_arrays.items()}
+    else:
+        state["G"] = sorted((u, v, k, tuple(sorted(d.items()))) for u, v, k, d in engine.G.edges(keys=True, data=True))
+        state["nodes"] = copy.deepcopy(dict(engine.G.nodes(data=True)))
+    return state
+
+def assert_same_state(a, b):
+    assert a.keys() == b.keys()
+    for key in a:
+        if key == "arrays":
+            for name in a[key]:
+                np.testing.assert_array_equal(a[key][name], b[key][name])
+        elif key == "coords":
+            np.testing.assert_array_equal(a[key], b[key])
+        else:
+            assert a[key] == b[key], key
+
+def with_overlay(engine):
+    for entry_id, spec in OVERLAY.items():
+        engine.set_overlay(entry_id, spec)
+    return engine
+
+@pytest.mark.parametrize("backend", ["networkx", "csr"])
+def test_delta_matches_rebuild(make_engine, monkeypatch, tmp_path, backend):
+    source = with_overlay(make_engine(backend))
+    before = source_state(source)
+    updated = source.apply_delta(DELTA)
+
+    # The source engine is untouched, so searches still running on it are unaffected
+    assert_same_state(source_state(source), before)
+
+    write_network(rebuilt_network(), tmp_path / "rebuilt")
+    use_network(monkeypatch, tmp_path / "rebuilt")
+    rebuilt = with_overlay(make_engine(backend))
+
+    assert sorted(updated.node_ids) == sorted(rebuilt.node_ids)
+    assert band_edges(updated) == band_edges(rebuilt)
+    assert updated.travel_time_matrix(POINTS, POINTS) == rebuilt.travel_time_matrix(POINTS, POINTS)
+    pairs = [(*a, *b) for a in POINTS for b in POINTS]
+    for got, want in zip(updated.batch_shortest_paths(pairs), rebuilt.batch_shortest_paths(pairs)):
+        assert (got and got["time_s"]) == (want and want["time_s"])
+
+def test_backends_agree_after_delta(make_engine):
+    nx_engine = with_overlay(make_engine("networkx")).apply_delta(DELTA)
+    csr_engine = with_overlay(make_engine("csr")).apply_delta(DELTA)
+    assert band_edges(nx_engine) == band_edges(csr_engine)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from app.network.geo import haversine_m
+from app.network.graph import mode_speed
+
+from conftest import ORIGIN, STEP_DEG
+
+POINTS = [
+    (ORIGIN[0] + 0.0004, ORIGIN[1] + 0.0002),
+    (ORIGIN[0] + 0.0004, ORIGIN[1] + 0.0012),
+    (ORIGIN[0] + 4 * STEP_DEG, ORIGIN[1] + 4 * STEP_DEG),
+    (0.0, 0.0),
+]
+
+@pytest.mark.parametrize("backend", ["networkx", "csr"])
+def test_identical_points_take_no_time(make_engine, backend):
+    engine = make_engine(backend)
+    matrix = engine.travel_time_matrix(POINTS, POINTS)
+    assert [matrix[i][i] for i in range(len(POINTS))] == [0.0] * len(POINTS)
+    # Nothing is in range of (0, 0), so only its own point is reachable
+    assert matrix[3][:3] == [None] * 3 and [row[3] for row in matrix[:3]] == [None] * 3
+
+@pytest.mark.parametrize("backend", ["networkx", "csr"])
+def test_nearby_points_walk_directly(make_engine, backend):
+    engine = make_engine(backend)
+    (a, b) = POINTS[:2]
+    walk_s = float(haversine_m(a[0], a[1], b[0], b[1])) / mode_speed('walk', "off_peak")
+    assert engine.travel_time_matrix([a], [b], departure_hour=13)[0][0] <= round(walk_s, 1)
+
+def test_backends_agree(make_engine):
+    expected = make_engine("networkx").travel_time_matrix(POINTS, POINTS, max_time_s=900)
+    assert make_engine("csr").travel_time_matrix(POINTS, POINTS, max_time_s=900) == expected
+
+def test_seeded_tree_matches_virtual_source(make_engine):
+    G_simple = make_engine("csr").get_weighted_graph("off_peak")
+    n = len(G_simple.node_ids)
+    seeds = {0: 30.0, 7: 5.0, 12: 250.0}
+    # Reference: one search from an extra node with an edge of the offset to every seed
+    rows = np.concatenate([np.repeat(np.arange(n), np.diff(G_simple.indptr)), np.full(len(seeds), n)])
+    cols = np.concatenate([G_simple.indices, list(seeds)])
+    weights = np.concatenate([G_simple.weights, list(seeds.values())])
+    reference = dijkstra(csr_matrix((weights, (rows, cols)), shape=(n + 1, n + 1)), indices=n)[:n]
+
+    np.testing.assert_allclose(G_simple.seeded_tree(seeds), reference)
+    bounded = G_simple.seeded_tree(seeds, limit=200.0)
+    np.testing.assert_allclose(bounded, np.where(reference <= 200.0, reference, np.inf))
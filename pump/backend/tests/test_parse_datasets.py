@@ -0,0 +1,50 @@
+import json
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from parse_datasets import parse_routes_csv, write_json_array
+
+CSV = """Route ID,Route Description,Kilometer
+100,Swargate - Hadapsar,12.5
+,Depot shuttle,3
+10A,Katraj - Shivajinagar,
+11,,7.25
+"""
+
+def parse_routes_iterrows(csv_path):
+    """The parser before chunked reading, kept as the reference output."""
+    df = pd.read_csv(csv_path)
+    return [
+        {
+            'id': f"route_{row['Route ID']}",
+            'name': row['Route ID'],
+            'description': row['Route Description'],
+            'length_km': float(row['Kilometer']) if not pd.isna(row['Kilometer']) else 0.0
+        }
+        for _, row in df.iterrows()
+    ]
+
+def reject_constant(constant):
+    raise AssertionError(f"{constant} in output")
+
+def test_routes_match_iterrows_parser(tmp_path):
+    csv_path = tmp_path / "routes.csv"
+    csv_path.write_text(CSV)
+    routes = list(parse_routes_csv(csv_path, chunksize=2))
+
+    reference = parse_routes_iterrows(csv_path)
+    # The old parser wrote the blank-ID row as route_nan with a NaN name
+    assert reference[1]['id'] == "route_nan"
+    expected = [r for r in reference if r['id'] != "route_nan"]
+    for r in expected:
+        if pd.isna(r['description']):
+            r['description'] = None
+    assert routes == expected
+
+    # Valid JSON: no NaN anywhere
+    out = tmp_path / "bus_routes.json"
+    write_json_array(out, routes)
+    assert json.loads(out.read_text(), parse_constant=reject_constant) == expected
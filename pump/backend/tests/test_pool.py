@@ -0,0 +1,34 @@
+import pytest
+
+from app import pool
+
+def test_failed_overlay_is_applied_once(monkeypatch):
+    calls = []
+    def set_overlay(entry_id, spec):
+        calls.append(entry_id)
+        raise ValueError("no such stop")
+    monkeypatch.setattr(pool.engine, "set_overlay", set_overlay)
+    monkeypatch.setattr(pool.engine, "clear_overlay", lambda entry_id: True)
+    monkeypatch.setattr(pool, "_worker_overlay", {})
+    monkeypatch.setattr(pool, "_worker_overlay_errors", {})
+
+    specs = {"x": {"stops": ["nope"], "factor": 2.0}}
+    for _ in range(3):
+        pool._sync_overlay(specs)
+    assert calls == ["x"]
+    assert pool._worker_overlay_errors == {"x": "no such stop"}
+
+    search_pool = pool.SearchPool(workers=0)
+    search_pool.set_overlay(specs)
+    search_pool._unpack((None, 123, {}, dict(pool._worker_overlay_errors)))
+    assert search_pool.stats()["overlay_errors"] == {"x": {123: "no such stop"}}
+
+    pool._sync_overlay({})
+    assert pool._worker_overlay_errors == {}
+
+def test_in_process_call_respects_queue_limit():
+    search_pool = pool.SearchPool(workers=0, queue_limit=1)
+    with pytest.raises(pool.PoolBusy):
+        search_pool.call(lambda: search_pool.call(int))
+    assert search_pool.stats()["in_flight"] == 0
+    assert search_pool.call(int, "7") == 7
@@ -0,0 +1,66 @@
+import pytest
+
+from app.network.timetable import Timetable, parse_gtfs_time
+
+# Stops along one street, ~2 km apart, except B2 which is a ~220 m footpath from B
+STOPS = {"A": (18.500, 73.800), "B": (18.500, 73.820), "B2": (18.502, 73.820), "D": (18.500, 73.860)}
+ROUTES = [("slow", 3), ("east", 1), ("feeder", 1)]
+# trip_id -> route_id, [(stop, time)]
+TRIPS = {
+    "slow_0800": ("slow", [("A", "08:00:00"), ("D", "09:00:00")]),
+    "slow_0830": ("slow", [("A", "08:30:00"), ("D", "09:30:00")]),
+    "east_0805": ("east", [("A", "08:05:00"), ("B", "08:10:00")]),
+    # Leaves before the walk from B plus the minimum transfer time is done
+    "feeder_0812": ("feeder", [("B2", "08:12:00"), ("D", "08:22:00")]),
+    "feeder_0820": ("feeder", [("B2", "08:20:00"), ("D", "08:30:00")]),
+}
+
+@pytest.fixture
+def timetable(tmp_path):
+    """Hand-built GTFS feed: a slow direct bus, or a fast metro, a footpath and a second metro."""
+    def write(name, header, rows):
+        (tmp_path / name).write_text("\n".join([header] + [",".join(map(str, r)) for r in rows]) + "\n")
+    write("stops.txt", "stop_id,stop_name,stop_lat,stop_lon", [(s, s, lat, lon) for s, (lat, lon) in STOPS.items()])
+    write("routes.txt", "route_id,route_short_name,route_type", [(r, r, t) for r, t in ROUTES])
+    write("trips.txt", "route_id,trip_id", [(route, trip) for trip, (route, _) in TRIPS.items()])
+    write("stop_times.txt", "trip_id,arrival_time,departure_time,stop_id,stop_sequence", [
+        (trip, t, t, stop, seq) for trip, (_, times) in TRIPS.items() for seq, (stop, t) in enumerate(times, 1)
+    ])
+    table = Timetable(tmp_path)
+    table.load()
+    return table
+
+def plan(timetable, departure, algorithm):
+    return timetable.plan(*STOPS["A"], *STOPS["D"], parse_gtfs_time(departure), algorithm)
+
+def rides(journey):
+    return [leg["trip_id"] for leg in journey["legs"] if leg["mode"] != "walk"]
+
+def test_raptor_pareto_set_by_transfers(timetable):
+    journeys = plan(timetable, "07:55:00", "raptor")
+    # Direct bus with no transfer, then the faster trip with one; nothing dominated
+    assert [(j["transfers"], j["arrival"]) for j in journeys] == [(0, "09:00:00"), (1, "08:30:00")]
+    assert rides(journeys[0]) == ["slow_0800"]
+    assert rides(journeys[1]) == ["east_0805", "feeder_0820"]
+
+@pytest.mark.parametrize("algorithm", ["raptor", "csa"])
+def test_earliest_arrival_uses_footpath(timetable, algorithm):
+    best = min(plan(timetable, "07:55:00", algorithm), key=lambda j: j["arrival"])
+    assert best["arrival"] == "08:30:00"
+    assert rides(best) == ["east_0805", "feeder_0820"]
+    # The transfer from B to B2 is walked between the two rides
+    footpath = [leg for leg in best["legs"] if leg["mode"] == "walk" and leg["from_node"]["id"] == "B"]
+    assert len(footpath) == 1 and footpath[0]["to_node"]["id"] == "B2"
+    assert 150 < footpath[0]["duration_sec"] < 170
+
+@pytest.mark.parametrize("algorithm", ["raptor", "csa"])
+def test_missed_connection_waits_for_next_trip(timetable, algorithm):
+    journeys = plan(timetable, "08:06:00", algorithm)
+    assert [(j["transfers"], j["arrival"], rides(j)) for j in journeys] == [(0, "09:30:00", ["slow_0830"])]
+
+def test_csa_matches_raptor_earliest_arrival(timetable):
+    for departure in ("07:00:00", "07:55:00", "08:01:00", "08:06:00", "08:31:00"):
+        raptor = plan(timetable, departure, "raptor")
+        csa = plan(timetable, departure, "csa")
+        expected = [min(j["arrival"] for j in raptor)] if raptor else []
+        assert [j["arrival"] for j in csa] == expected
@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import { MapContainer, TileLayer, Marker, Polyline, useMapEvents } from 'react-leaflet';
+import { MapContainer, TileLayer, Marker, Polyline, CircleMarker, Tooltip, useMap, useMapEvents } from 'react-leaflet';
 import 'leaflet/dist/leaflet.css';
 import L from 'leaflet';
 import { getStops, searchRoutes } from './api';
@@ -27,6 +27,56 @@ function MapClickHandler({ setSource, setDest, selectingSource }) {
   return null;
 }
 
+// Stops in the visible area, with bus stops clustered when zoomed out.
+// Refetched after every pan and zoom (Leaflet ends both with moveend).
+function StopsLayer() {
+  const map = useMap();
+  const [view, setView] = useState({ stops: [], clusters: [] });
+
+  useEffect(() => {
+    let latest = 0;
+    const load = () => {
+      const request = ++latest;
+      getStops(map.getBounds(), map.getZoom())
+        .then((data) => {
+          // Drop responses for viewports the user has already left
+          if (request === latest) setView(data);
+        })
+        .catch((err) => console.error(err));
+    };
+    load();
+    map.on('moveend', load);
+    return () => map.off('moveend', load);
+  }, [map]);
+
+  return (
+    <>
+      {view.clusters.map((cluster) => (
+        <CircleMarker
+          key={`${cluster.lat},${cluster.lon}`}
+          center={[cluster.lat, cluster.lon]}
+          radius={8 + Math.min(12, 2 * Math.log2(cluster.count))}
+          pathOptions={{ color: '#ef4444', fillOpacity: 0.4, weight: 1 }}
+          bubblingMouseEvents={false}
+          eventHandlers={{ click: () => map.setView([cluster.lat, cluster.lon], map.getZoom() + 2) }}
+        >
+          <Tooltip>{cluster.count} stops</Tooltip>
+        </CircleMarker>
+      ))}
+      {view.stops.map((stop) => (
+        <CircleMarker
+          key={stop.id}
+          center={[stop.lat, stop.lon]}
+          radius={stop.type === 'metro_station' ? 6 : 3}
+          pathOptions={{ color: stop.type === 'metro_station' ? '#0ea5e9' : '#ef4444', fillOpacity: 0.8, weight: 1 }}
+        >
+          <Tooltip>{stop.name}</Tooltip>
+        </CircleMarker>
+      ))}
+    </>
+  );
+}
+
 export default function App() {
   const [source, setSource] = useState(null);
   const [dest, setDest] = useState(null);
@@ -144,6 +194,7 @@ export default function App() {
             url="https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}{r}.png"
           />
           <MapClickHandler setSource={setSource} setDest={setDest} selectingSource={selectingSource} />
+          <StopsLayer />
 
           {source && <Marker position={source} />}
           {dest && <Marker position={dest} />}
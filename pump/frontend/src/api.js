@@ -12,8 +12,18 @@ export const getHealth = async () => {
     return res.data;
 };
 
-export const getStops = async () => {
-    const res = await api.get('/network/stops');
+// Stops in the visible map area; pass map.getBounds() and map.getZoom().
+// Bus stops come back as clusters when zoomed out.
+export const getStops = async (bounds, zoom) => {
+    const res = await api.get('/network/stops', {
+        params: {
+            min_lat: bounds.getSouth(),
+            min_lng: bounds.getWest(),
+            max_lat: bounds.getNorth(),
+            max_lng: bounds.getEast(),
+            zoom: Math.round(zoom)
+        }
+    });
     return res.data;
 };
 